@@ -0,0 +1,137 @@
+# benchmarks/boot.py
+# How long a worker takes to start. Every dependency (MongoDB, S3, Cognito, the
+# Hugging Face Space) points at an address that never answers, so the numbers also
+# show that startup doesn't wait on the network:
+#   import   `import src.server` in a fresh interpreter
+#   serving  launching uvicorn until /healthcheck first answers 200
+#   app      the worker's own app_startup_seconds{phase="serving"}, from process start
+# /readyz must answer 503 quickly meanwhile. Exits with status 1 when the median
+# serving time is over --target, so it can gate CI.
+#
+#   python -m benchmarks.boot
+#   python -m benchmarks.boot --repeat 10 --target 3
+import argparse
+import json
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import time
+import urllib.error
+import urllib.request
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# Non-routable: connections hang instead of being refused, like a dependency that is down
+UNREACHABLE = "10.255.255.1"
+
+
+def unreachable_env() -> dict:
+    return {
+        **os.environ,
+        "MONGODB_URI": f"mongodb://{UNREACHABLE}:27017",
+        "MONGODB_DB_NAME": "boot",
+        "MONGODB_DB_COLLECTION": "books",
+        "AWS_ENDPOINT_URL_S3": f"http://{UNREACHABLE}:9000",
+        "AWS_ACCESS_KEY_ID": "boot",
+        "AWS_SECRET_ACCESS_KEY": "boot",
+        "AWS_DEFAULT_REGION": "us-east-1",
+        "S3_BUCKET_NAME": "boot",
+        "COGNITO_ISSUER": f"http://{UNREACHABLE}",
+        "HF_SPACE": "wordvision/unreachable-space",
+        "HF_SPACE_STUB": "false",
+        "TRACING_ENABLED": "false",
+    }
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def get(url: str, timeout: float = 5) -> tuple:
+    try:
+        with urllib.request.urlopen(url, timeout=timeout) as response:
+            return response.status, response.read().decode()
+    except urllib.error.HTTPError as e:
+        return e.code, e.read().decode()
+
+
+def measure_import() -> float:
+    start = time.perf_counter()
+    subprocess.run([sys.executable, "-c", "import src.server"], cwd=BACKEND_DIR, env=unreachable_env(),
+                   check=True, capture_output=True, timeout=120)
+    return time.perf_counter() - start
+
+
+def measure_serving(timeout: float) -> dict:
+    port = free_port()
+    base = f"http://127.0.0.1:{port}"
+    start = time.perf_counter()
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "src.server:app", "--port", str(port), "--log-level", "warning"],
+        cwd=BACKEND_DIR, env=unreachable_env(), stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    try:
+        while True:
+            if server.poll() is not None:
+                raise RuntimeError("The server exited during startup")
+            if time.perf_counter() - start > timeout:
+                raise RuntimeError(f"/healthcheck didn't answer within {timeout}s")
+            try:
+                if get(f"{base}/healthcheck", 1)[0] == 200:
+                    break
+            except (urllib.error.URLError, ConnectionError, socket.timeout):
+                time.sleep(0.02)
+        serving = time.perf_counter() - start
+
+        ready_start = time.perf_counter()
+        ready_status, _ = get(f"{base}/readyz", timeout)
+        readyz = time.perf_counter() - ready_start
+
+        metrics = get(f"{base}/metrics")[1]
+        app = next(
+            float(line.split()[-1]) for line in metrics.splitlines()
+            if line.startswith('app_startup_seconds{phase="serving"}')
+        )
+        return {"serving": serving, "app": app, "readyzStatus": ready_status, "readyz": readyz}
+    finally:
+        server.terminate()
+        try:
+            server.wait(10)
+        except subprocess.TimeoutExpired:
+            server.kill()
+
+
+def summary(values: list) -> str:
+    return f"{statistics.median(values):>10.2f}{min(values):>10.2f}{max(values):>10.2f}"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Worker startup time with unreachable dependencies")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--target", type=float, default=float(os.getenv("WORKER_BOOT_TARGET_SECONDS", "5")),
+                        help="Maximum median seconds from launch to serving")
+    parser.add_argument("--timeout", type=float, default=60, help="Give up on a run after this many seconds")
+    args = parser.parse_args()
+
+    imports = [measure_import() for _ in range(args.repeat)]
+    runs = [measure_serving(args.timeout) for _ in range(args.repeat)]
+
+    print(f"{'seconds':<12}{'median':>10}{'min':>10}{'max':>10}")
+    print(f"{'import':<12}{summary(imports)}")
+    print(f"{'serving':<12}{summary([run['serving'] for run in runs])}")
+    print(f"{'app':<12}{summary([run['app'] for run in runs])}")
+    print(f"{'/readyz':<12}{summary([run['readyz'] for run in runs])}"
+          f"   status {sorted({run['readyzStatus'] for run in runs})}")
+
+    serving = statistics.median(run["serving"] for run in runs)
+    if serving > args.target:
+        print(f"\nMedian time to serving {serving:.2f}s is over the {args.target}s target")
+        sys.exit(1)
+    print(f"\nMedian time to serving {serving:.2f}s is within the {args.target}s target")
+
+
+if __name__ == "__main__":
+    main()
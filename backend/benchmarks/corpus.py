@@ -0,0 +1,147 @@
+# benchmarks/corpus.py
+# Generates synthetic EPUB and PDF books, and images, for the benchmarks.
+# Chapters are filler prose; the target size is reached with incompressible "illustrations".
+import io
+import os
+import zipfile
+
+CONTAINER_XML = """<?xml version="1.0" encoding="UTF-8"?>
+<container version="1.0" xmlns="urn:oasis:names:tc:opendocument:xmlns:container">
+  <rootfiles><rootfile full-path="OEBPS/content.opf" media-type="application/oebps-package+xml"/></rootfiles>
+</container>"""
+
+PARAGRAPH = (
+    "The balloon rose steadily over the grey Atlantic, and the passengers, wrapped in their "
+    "cloaks, watched the coastline of Wales dissolve into a thin line of mist. "
+)
+
+MB = 1024 * 1024
+
+
+def chapter_xhtml(number: int, paragraphs: int) -> str:
+    body = "".join(f"<p>{PARAGRAPH * 3}</p>" for _ in range(paragraphs))
+    return (
+        '<?xml version="1.0" encoding="UTF-8"?>'
+        '<html xmlns="http://www.w3.org/1999/xhtml"><head>'
+        f"<title>Chapter {number}</title></head><body><h1>Chapter {number}</h1>{body}</body></html>"
+    )
+
+
+def write_epub(path: str, size_mb: float, chapters: int = 20, paragraphs: int = 40, title: str | None = None):
+    title = title or os.path.splitext(os.path.basename(path))[0]
+    image_count = max(1, chapters // 2)
+    image_size = int(size_mb * MB / image_count)
+
+    manifest, spine, toc = [], [], []
+    with zipfile.ZipFile(path, "w", zipfile.ZIP_DEFLATED) as archive:
+        archive.writestr("mimetype", "application/epub+zip", compress_type=zipfile.ZIP_STORED)
+        archive.writestr("META-INF/container.xml", CONTAINER_XML)
+
+        for number in range(1, chapters + 1):
+            href = f"text/chapter{number:03}.xhtml"
+            archive.writestr(f"OEBPS/{href}", chapter_xhtml(number, paragraphs))
+            manifest.append(f'<item id="c{number}" href="{href}" media-type="application/xhtml+xml"/>')
+            spine.append(f'<itemref idref="c{number}"/>')
+            toc.append(f'<li><a href="{href}">Chapter {number}</a></li>')
+
+        for number in range(1, image_count + 1):
+            href = f"images/plate{number:03}.jpg"
+            archive.writestr(f"OEBPS/{href}", os.urandom(image_size), compress_type=zipfile.ZIP_STORED)
+            manifest.append(f'<item id="i{number}" href="{href}" media-type="image/jpeg"/>')
+
+        archive.writestr("OEBPS/nav.xhtml", (
+            '<?xml version="1.0" encoding="UTF-8"?>'
+            '<html xmlns="http://www.w3.org/1999/xhtml" xmlns:epub="http://www.idpf.org/2007/ops"><body>'
+            f'<nav epub:type="toc"><ol>{"".join(toc)}</ol></nav></body></html>'
+        ))
+        manifest.append('<item id="nav" href="nav.xhtml" media-type="application/xhtml+xml" properties="nav"/>')
+
+        archive.writestr("OEBPS/content.opf", (
+            '<?xml version="1.0" encoding="UTF-8"?>'
+            '<package xmlns="http://www.idpf.org/2007/opf" version="3.0" unique-identifier="bookid">'
+            '<metadata xmlns:dc="http://purl.org/dc/elements/1.1/">'
+            f'<dc:title>{title}</dc:title><dc:creator>Benchmark Author</dc:creator>'
+            f'<dc:language>en</dc:language><dc:identifier id="bookid">urn:uuid:{title}</dc:identifier>'
+            '<dc:publisher>WordVision</dc:publisher><dc:description>Synthetic benchmark book</dc:description>'
+            f'</metadata><manifest>{"".join(manifest)}</manifest><spine>{"".join(spine)}</spine></package>'
+        ))
+    return path
+
+
+# Default corpus for the metadata benchmark: (file name, size in MB, chapters)
+DEFAULT_EPUBS = [
+    ("small.epub", 0.5, 10),
+    ("medium.epub", 10, 40),
+    ("large.epub", 50, 120),
+]
+
+
+# Microbenchmark corpus, from small books to the largest uploads we expect
+MICRO_EPUBS = DEFAULT_EPUBS + [("huge.epub", 200, 200)]
+MICRO_PDFS = [
+    ("small.pdf", 0.5, 10),
+    ("medium.pdf", 10, 40),
+    ("large.pdf", 50, 120),
+    ("huge.pdf", 200, 200),
+]
+MICRO_IMAGES = 5
+
+
+# PDF with a page of prose per page and a noise image on every other page for size
+def write_pdf(path: str, size_mb: float, pages: int = 20, title: str | None = None):
+    import pymupdf
+    from PIL import Image
+
+    title = title or os.path.splitext(os.path.basename(path))[0]
+    image_count = max(1, pages // 2)
+    # Raw RGB noise; PNG can't compress it, so the embedded image is about this size
+    side = int((size_mb * MB / image_count / 3) ** 0.5)
+
+    doc = pymupdf.open()
+    for number in range(1, pages + 1):
+        page = doc.new_page()
+        page.insert_textbox(page.rect + (50, 50, -50, -50), f"Chapter {number}\n\n" + PARAGRAPH * 12, fontsize=11)
+        if number % 2 == 0 or pages == 1:
+            noise = Image.frombytes("RGB", (side, side), os.urandom(side * side * 3))
+            png = io.BytesIO()
+            noise.save(png, format="PNG", compress_level=1)
+            page.insert_image(pymupdf.Rect(50, 400, 300, 650), stream=png.getvalue())
+    doc.set_metadata({"title": title, "author": "Benchmark Author"})
+    doc.save(path)
+    doc.close()
+    return path
+
+
+# Image like the Space returns: a 1024px WebP with gradients and grain, so
+# encoders do about as much work as on a real render (solid colours are trivial)
+def write_image(path: str, seed: int, size: int = 1024):
+    from PIL import Image, ImageChops
+
+    gradient = Image.radial_gradient("L").resize((size, size))
+    linear = Image.linear_gradient("L").resize((size, size)).rotate(seed * 37 % 360)
+    grain = Image.effect_noise((size, size), 24 + seed * 8)
+    channels = (gradient, linear, ImageChops.add(gradient, grain, scale=2))
+    Image.merge("RGB", channels[seed % 3:] + channels[:seed % 3]).save(path, format="WEBP", quality=90)
+    return path
+
+
+def build_corpus(directory: str, books=DEFAULT_EPUBS) -> list:
+    os.makedirs(directory, exist_ok=True)
+    paths = []
+    for name, size_mb, chapters in books:
+        path = os.path.join(directory, name)
+        if not os.path.exists(path):
+            (write_pdf if name.endswith(".pdf") else write_epub)(path, size_mb, chapters)
+        paths.append(path)
+    return paths
+
+
+def build_images(directory: str, count: int = MICRO_IMAGES) -> list:
+    os.makedirs(directory, exist_ok=True)
+    paths = []
+    for number in range(count):
+        path = os.path.join(directory, f"image{number}.webp")
+        if not os.path.exists(path):
+            write_image(path, number)
+        paths.append(path)
+    return paths
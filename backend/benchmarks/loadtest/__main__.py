@@ -0,0 +1,211 @@
+# benchmarks/loadtest/__main__.py
+# End-to-end HTTP load test. Starts the server (benchmarks.loadtest.serve) against
+# local stand-ins for Cognito, MongoDB, S3 and the Hugging Face Space, uploads a
+# generated library for each user, then drives a weighted mix of user actions
+# from --concurrency closed-loop clients and reports p50/p95/p99 and RPS per route.
+#
+#   python -m benchmarks.loadtest                                  # defaults
+#   python -m benchmarks.loadtest --concurrency 32 --duration 60 --mix read=80,list=20
+#   python -m benchmarks.loadtest --compare benchmarks/results/loadtest-20260101T000000Z.json
+#   python -m benchmarks.loadtest --mongo-uri mongodb://localhost:27017 --mix read=50,search=50
+#   python -m benchmarks.loadtest --workers 4 --mongo-uri mongodb://localhost:27017 --s3-endpoint http://localhost:9000
+import argparse
+import asyncio
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+import httpx
+
+from ..corpus import write_epub
+from .cognito import CLIENT_ID, CognitoStub
+from .report import print_comparison, print_summary, save, summarise
+from .scenarios import DEFAULT_MIX, EPUB_TYPE, SCENARIOS, Recorder, User, parse_mix
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+RESULTS_DIR = os.path.join(BACKEND_DIR, "benchmarks", "results")
+CHAPTERS = 20
+# Actions that don't read what earlier requests stored, so they work with several
+# workers each holding their own in-memory MongoDB and S3
+PER_WORKER_STAND_IN_ACTIONS = {"health", "list"}
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def start_server(args, issuer: str, port: int, log_path: str) -> subprocess.Popen:
+    env = {
+        **os.environ,
+        "COGNITO_ISSUER": issuer,
+        "COGNITO_CLIENT_ID": CLIENT_ID,
+        # The app only calls userInfo over https, so users come from ID token claims
+        "AUTH_IDENTITY_MODE": "claims",
+        "HF_SPACE_STUB": "true",
+        "HF_STUB_LATENCY": str(args.hf_latency),
+        "HF_STUB_CONCURRENCY": str(args.hf_slots),
+        "BOOK_CACHE_DIR": tempfile.mkdtemp(prefix="wordvision-loadtest-cache-"),
+        "PYTHONUNBUFFERED": "1",
+    }
+    if args.mongo_uri:
+        env["MONGODB_URI"] = args.mongo_uri
+    if args.s3_endpoint:
+        env["AWS_ENDPOINT_URL_S3"] = args.s3_endpoint
+    log = open(log_path, "w")
+    return subprocess.Popen(
+        [sys.executable, "-m", "benchmarks.loadtest.serve", "--port", str(port), "--workers", str(args.workers)],
+        cwd=BACKEND_DIR, env=env, stdout=log, stderr=subprocess.STDOUT,
+    )
+
+
+async def wait_until_healthy(client: httpx.AsyncClient, server: subprocess.Popen, timeout: float = 60):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if server.poll() is not None:
+            raise RuntimeError("The server exited during startup")
+        try:
+            if (await client.get("/healthcheck")).status_code == 200:
+                return
+        except httpx.TransportError:
+            pass
+        await asyncio.sleep(0.2)
+    raise RuntimeError("The server didn't become healthy in time")
+
+
+async def seed_library(client: httpx.AsyncClient, users: list, books_per_user: int, book_mb: float):
+    directory = tempfile.mkdtemp(prefix="wordvision-loadtest-books-")
+    paths = []
+    for number in range(books_per_user):
+        path = os.path.join(directory, f"book-{number}.epub")
+        write_epub(path, book_mb, chapters=CHAPTERS, title=f"Load test book {number}")
+        paths.append(path)
+
+    for user in users:
+        for path in paths:
+            with open(path, "rb") as file:
+                response = await client.post(
+                    "/book", headers=user.headers, files={"file": (os.path.basename(path), file, EPUB_TYPE)}
+                )
+            response.raise_for_status()
+            book = response.json()
+            user.books.append({"id": book["id"], "chapters": len(book.get("spine", {}).get("chapters", [])) or CHAPTERS})
+
+
+async def run_client(client, recorder: Recorder, users: list, mix: dict, stop_at: float):
+    names, weights = list(mix), list(mix.values())
+    while time.monotonic() < stop_at:
+        scenario = SCENARIOS[random.choices(names, weights)[0]]
+        await scenario(client, recorder, random.choice(users))
+
+
+async def run(args, mix: dict) -> dict:
+    cognito = CognitoStub().start()
+    port = free_port()
+    log_path = os.path.join(tempfile.gettempdir(), "wordvision-loadtest-server.log")
+    server = start_server(args, cognito.issuer, port, log_path)
+    print(f"Server on port {port}, log in {log_path}")
+
+    limits = httpx.Limits(max_connections=args.concurrency + 4, max_keepalive_connections=args.concurrency + 4)
+    timeout = httpx.Timeout(args.timeout)
+    try:
+        async with httpx.AsyncClient(base_url=f"http://127.0.0.1:{port}", limits=limits, timeout=timeout) as client:
+            await wait_until_healthy(client, server)
+
+            users = [
+                User(email, cognito.id_token(email))
+                for email in (f"loadtest-{number}@example.com" for number in range(args.users))
+            ]
+            print(f"Uploading {args.books_per_user} book(s) of {args.book_mb} MB for {args.users} user(s)")
+            await seed_library(client, users, args.books_per_user, args.book_mb)
+
+            recorder = Recorder()
+            if args.warmup:
+                print(f"Warming up for {args.warmup}s")
+                stop_at = time.monotonic() + args.warmup
+                await asyncio.gather(*(run_client(client, recorder, users, mix, stop_at) for _ in range(args.concurrency)))
+
+            print(f"Running {args.concurrency} clients for {args.duration}s, mix {mix}")
+            recorder.recording = True
+            start = time.monotonic()
+            stop_at = start + args.duration
+            await asyncio.gather(*(run_client(client, recorder, users, mix, stop_at) for _ in range(args.concurrency)))
+            # Scenarios finish their current step, so the run may overrun the duration slightly
+            elapsed = time.monotonic() - start
+    finally:
+        server.terminate()
+        try:
+            server.wait(10)
+        except subprocess.TimeoutExpired:
+            server.kill()
+        cognito.stop()
+
+    return summarise(recorder.samples, elapsed)
+
+
+def add_arguments(parser: argparse.ArgumentParser):
+    parser.add_argument("--concurrency", type=int, default=16, help="Concurrent clients, each running one action at a time")
+    parser.add_argument("--duration", type=float, default=30, help="Seconds to measure")
+    parser.add_argument("--warmup", type=float, default=5, help="Seconds to run before measuring")
+    parser.add_argument("--users", type=int, default=4)
+    parser.add_argument("--books-per-user", type=int, default=2)
+    parser.add_argument("--book-mb", type=float, default=1, help="Size of each uploaded EPUB")
+    parser.add_argument("--hf-latency", type=float, default=2, help="Seconds the fake Space takes for a final-quality image")
+    parser.add_argument("--hf-slots", type=int, default=4, help="Images the fake Space renders at once")
+    parser.add_argument("--mix", default=DEFAULT_MIX, help=f"Weighted actions, from: {', '.join(SCENARIOS)}")
+    parser.add_argument("--timeout", type=float, default=120, help="Per-request timeout in seconds")
+    parser.add_argument("--mongo-uri", help="Use this MongoDB instead of the in-memory one")
+    parser.add_argument("--s3-endpoint", help="Use this S3-compatible endpoint (e.g. MinIO) instead of the in-process mock")
+    parser.add_argument("--output", default=RESULTS_DIR, help="Directory for the JSON results")
+
+
+# The mix, or a parser error when it can't run with these settings
+def checked_mix(parser: argparse.ArgumentParser, args, workers: int) -> dict:
+    try:
+        mix = parse_mix(args.mix)
+    except ValueError as e:
+        parser.error(str(e))
+    shared = args.mongo_uri and args.s3_endpoint
+    if workers > 1 and not shared and set(mix) - PER_WORKER_STAND_IN_ACTIONS:
+        parser.error(
+            "With more than one worker the in-memory MongoDB and S3 are per worker, so a book uploaded "
+            "through one worker is missing from the others. Pass --mongo-uri and --s3-endpoint, "
+            f"or use --mix with only: {', '.join(sorted(PER_WORKER_STAND_IN_ACTIONS))}"
+        )
+    return mix
+
+
+def run_settings(args, mix: dict) -> dict:
+    return {
+        "concurrency": args.concurrency, "duration": args.duration, "users": args.users,
+        "booksPerUser": args.books_per_user, "bookMb": args.book_mb, "hfLatency": args.hf_latency,
+        "hfSlots": args.hf_slots, "mix": mix, "mongo": "external" if args.mongo_uri else "in-memory",
+        "s3": "external" if args.s3_endpoint else "in-process", "workers": args.workers,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="End-to-end HTTP load test against local stand-ins")
+    add_arguments(parser)
+    parser.add_argument("--workers", type=int, default=1, help="Server worker processes")
+    parser.add_argument("--compare", help="Results file of an earlier run to compare with")
+    args = parser.parse_args()
+
+    mix = checked_mix(parser, args, args.workers)
+    summary = asyncio.run(run(args, mix))
+
+    settings = run_settings(args, mix)
+    print()
+    print_summary(summary)
+    print(f"\nSaved {save(summary, settings, args.output)}")
+    if args.compare:
+        print_comparison(summary, settings, args.compare)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,8 @@
+# benchmarks/loadtest/app.py
+# The app as served by benchmarks/loadtest/serve.py. Every worker imports this, so the
+# stand-ins are in place before src.server creates any client.
+from .serve import use_stand_ins
+
+use_stand_ins()
+
+from src.server import app
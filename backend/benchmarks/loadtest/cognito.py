@@ -0,0 +1,73 @@
+# benchmarks/loadtest/cognito.py
+# Local stand-in for the Cognito user pool: serves a JWKS over HTTP and mints
+# RS256 ID tokens for load-test users, so auth.py verifies real signatures
+# against a key set it fetches (and caches) exactly as it does in production.
+import base64
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import rsa
+from jose import jwt
+
+CLIENT_ID = "loadtest-client"
+KEY_ID = "loadtest-key"
+
+
+def _b64url_uint(value: int) -> str:
+    data = value.to_bytes((value.bit_length() + 7) // 8, "big")
+    return base64.urlsafe_b64encode(data).rstrip(b"=").decode()
+
+
+class CognitoStub:
+    def __init__(self, host: str = "127.0.0.1", port: int = 0):
+        key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+        self.private_pem = key.private_bytes(
+            serialization.Encoding.PEM, serialization.PrivateFormat.PKCS8, serialization.NoEncryption()
+        )
+        numbers = key.public_key().public_numbers()
+        self.jwks = {"keys": [{
+            "kty": "RSA", "alg": "RS256", "use": "sig", "kid": KEY_ID,
+            "n": _b64url_uint(numbers.n), "e": _b64url_uint(numbers.e),
+        }]}
+        self.jwks_requests = 0
+
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path != "/.well-known/jwks.json":
+                    self.send_error(404)
+                    return
+                stub.jwks_requests += 1
+                body = json.dumps(stub.jwks).encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer((host, port), Handler)
+        self.issuer = f"http://{host}:{self.server.server_address[1]}"
+        self._thread = threading.Thread(target=self.server.serve_forever, name="cognito-stub", daemon=True)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+
+    # ID token as issued by the hosted UI; the server reads the user from its claims
+    def id_token(self, email: str, ttl: int = 24 * 3600) -> str:
+        now = int(time.time())
+        claims = {
+            "sub": email, "email": email, "email_verified": True, "cognito:username": email.split("@")[0],
+            "token_use": "id", "aud": CLIENT_ID, "iss": self.issuer, "iat": now, "exp": now + ttl,
+        }
+        return jwt.encode(claims, self.private_pem, algorithm="RS256", headers={"kid": KEY_ID})
@@ -0,0 +1,92 @@
+# benchmarks/loadtest/report.py
+# Summarises load-test samples per route and saves them as JSON, so runs can be
+# compared (--compare) and regressions show up as deltas per route.
+import json
+import os
+import subprocess
+from datetime import datetime, timezone
+
+PERCENTILES = (50, 95, 99)
+
+
+def percentile(sorted_values: list, pct: float) -> float:
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, round(pct / 100 * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+
+def summarise(samples: list, duration: float) -> dict:
+    routes = {}
+    for route, seconds, status in samples:
+        routes.setdefault(route, []).append((seconds, status))
+    routes["all"] = [(seconds, status) for _, seconds, status in samples]
+
+    summary = {}
+    for route, values in sorted(routes.items()):
+        latencies = sorted(seconds * 1000 for seconds, _ in values)
+        errors = sum(1 for _, status in values if not isinstance(status, int) or status >= 400)
+        summary[route] = {
+            "count": len(values),
+            "errors": errors,
+            "rps": round(len(values) / duration, 2) if duration else 0,
+            **{f"p{pct}": round(percentile(latencies, pct), 2) for pct in PERCENTILES},
+            "mean": round(sum(latencies) / len(latencies), 2) if latencies else 0,
+            "max": round(latencies[-1], 2) if latencies else 0,
+        }
+    return summary
+
+
+def git_commit() -> str | None:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def save(summary: dict, settings: dict, directory: str) -> str:
+    os.makedirs(directory, exist_ok=True)
+    now = datetime.now(timezone.utc)
+    path = os.path.join(directory, f"loadtest-{now.strftime('%Y%m%dT%H%M%SZ')}.json")
+    with open(path, "w") as file:
+        json.dump({"timestamp": now.isoformat(), "commit": git_commit(), "settings": settings, "routes": summary}, file, indent=2)
+    return path
+
+
+def print_summary(summary: dict):
+    print(f"{'route':<46}{'count':>7}{'err':>5}{'rps':>8}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'max ms':>9}")
+    for route, row in summary.items():
+        print(
+            f"{route[:45]:<46}{row['count']:>7}{row['errors']:>5}{row['rps']:>8.1f}"
+            f"{row['p50']:>9.1f}{row['p95']:>9.1f}{row['p99']:>9.1f}{row['max']:>9.1f}"
+        )
+
+
+def _delta(new: float, old: float) -> str:
+    if not old:
+        return f"{new:>9.1f}{'':>8}"
+    return f"{new:>9.1f}{(new - old) / old * 100:>+7.0f}%"
+
+
+# Print this run next to a saved one. Settings that differ are listed first,
+# since the numbers are only comparable for the same mix and concurrency.
+def print_comparison(summary: dict, settings: dict, baseline_path: str):
+    with open(baseline_path) as file:
+        baseline = json.load(file)
+    print(f"\nCompared with {baseline_path} (commit {baseline.get('commit')}):")
+    for key, value in settings.items():
+        if baseline["settings"].get(key) != value:
+            print(f"  note: {key} was {baseline['settings'].get(key)!r}, now {value!r}")
+
+    print(f"{'route':<46}{'rps':>17}{'p50 ms':>17}{'p95 ms':>17}{'p99 ms':>17}")
+    for route, row in summary.items():
+        old = baseline["routes"].get(route)
+        if not old:
+            print(f"{route[:45]:<46}  (not in baseline)")
+            continue
+        print(
+            f"{route[:45]:<46}{_delta(row['rps'], old['rps'])}{_delta(row['p50'], old['p50'])}"
+            f"{_delta(row['p95'], old['p95'])}{_delta(row['p99'], old['p99'])}"
+        )
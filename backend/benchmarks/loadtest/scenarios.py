@@ -0,0 +1,149 @@
+# benchmarks/loadtest/scenarios.py
+# User actions the load test picks from, weighted by --mix. Each one is a short
+# sequence of requests, as the frontend makes them; every request is recorded
+# under its route template so results group by route, not by book or highlight id.
+import asyncio
+import random
+import time
+
+EPUB_TYPE = "application/epub+zip"
+# Seconds between GET /job polls, as in the frontend
+JOB_POLL_INTERVAL = 1
+
+
+class Recorder:
+    def __init__(self):
+        self.samples = []  # (route, seconds, status)
+        self.recording = False
+
+    async def request(self, client, route: str, method: str, url: str, **kwargs):
+        start = time.perf_counter()
+        try:
+            response = await client.request(method, url, **kwargs)
+            status = response.status_code
+        except Exception as e:
+            response, status = None, f"error:{type(e).__name__}"
+        if self.recording:
+            self.samples.append((route, time.perf_counter() - start, status))
+        return response
+
+
+class User:
+    def __init__(self, email: str, token: str):
+        self.email = email
+        self.headers = {"Authorization": f"Bearer {token}"}
+        self.books = []  # {"id", "chapters"}
+
+
+def pick_location(chapter: int) -> str:
+    paragraph = random.randint(1, 40) * 2
+    offset = random.randint(0, 200)
+    return f"epubcfi(/6/{(chapter + 1) * 2}!/4/{paragraph}/1:{offset})"
+
+
+# No auth or dependencies: the cost of the HTTP stack (event loop, parser, middleware) alone
+async def health(client, recorder: Recorder, user: User):
+    await recorder.request(client, "GET /healthcheck", "GET", "/healthcheck")
+
+
+async def list_library(client, recorder: Recorder, user: User):
+    await recorder.request(client, "GET /books", "GET", "/books", headers=user.headers)
+
+
+# Open a book and read a few chapters, with the highlights shown on each
+async def read_book(client, recorder: Recorder, user: User):
+    book = random.choice(user.books)
+    base = f"/book/{book['id']}"
+    await recorder.request(client, "GET /book/{id}", "GET", base, headers=user.headers)
+    await recorder.request(client, "GET /book/{id}/spine", "GET", f"{base}/spine", headers=user.headers)
+    first = random.randrange(book["chapters"])
+    for chapter in range(first, min(first + 3, book["chapters"])):
+        await recorder.request(
+            client, "GET /book/{id}/chapter/{index}", "GET", f"{base}/chapter/{chapter}",
+            headers={**user.headers, "Accept-Encoding": "gzip"},
+        )
+        await recorder.request(
+            client, "GET /book/{id}/highlights/range", "GET", f"{base}/highlights/range",
+            params={"chapter": chapter}, headers=user.headers,
+        )
+
+
+async def _create_highlight(client, recorder: Recorder, user: User, image: bool):
+    book = random.choice(user.books)
+    base = f"/book/{book['id']}"
+    body = {
+        "text": "The balloon rose steadily over the grey Atlantic",
+        "location": pick_location(random.randrange(book["chapters"])),
+    }
+    route = "POST /book/{id}/highlight" + ("?image=true" if image else "")
+    response = await recorder.request(
+        client, route, "POST", f"{base}/highlight", params={"image": "true"} if image else None,
+        json=body, headers=user.headers,
+    )
+    if response is None or response.status_code >= 300:
+        return
+    highlight_id = response.json()["highlightId"]
+    if image:
+        await _wait_for_job(client, recorder, user, response.json()["jobId"])
+    await recorder.request(
+        client, "DELETE /book/{id}/highlight/{highlight_id}", "DELETE", f"{base}/highlight/{highlight_id}",
+        headers=user.headers,
+    )
+
+
+# Poll the job until it is done or failed, as the frontend does after a 202
+async def _wait_for_job(client, recorder: Recorder, user: User, job_id: str):
+    while True:
+        response = await recorder.request(client, "GET /job/{id}", "GET", f"/job/{job_id}", headers=user.headers)
+        if response is None or response.status_code != 200 or response.json()["status"] in ("done", "failed"):
+            return
+        await asyncio.sleep(JOB_POLL_INTERVAL)
+
+
+# Highlight a passage, then delete it again so the collection doesn't grow during the run
+async def highlight(client, recorder: Recorder, user: User):
+    await _create_highlight(client, recorder, user, image=False)
+
+
+# Highlight with an image, waiting for the render as the frontend does
+async def highlight_image(client, recorder: Recorder, user: User):
+    await _create_highlight(client, recorder, user, image=True)
+
+
+async def download(client, recorder: Recorder, user: User):
+    book = random.choice(user.books)
+    await recorder.request(
+        client, "GET /book/{id}/content", "GET", f"/book/{book['id']}/content", headers=user.headers
+    )
+
+
+# Needs a MongoDB with text indexes (--mongo-uri); mongomock has no $text
+async def search(client, recorder: Recorder, user: User):
+    query = random.choice(["balloon", "atlantic", "coastline wales", "passengers cloaks"])
+    await recorder.request(client, "GET /search", "GET", "/search", params={"q": query}, headers=user.headers)
+
+
+SCENARIOS = {
+    "health": health,
+    "list": list_library,
+    "read": read_book,
+    "highlight": highlight,
+    "image": highlight_image,
+    "download": download,
+    "search": search,
+}
+
+DEFAULT_MIX = "list=20,read=50,highlight=20,image=5,download=5"
+
+
+def parse_mix(value: str) -> dict:
+    mix = {}
+    for part in value.split(","):
+        name, _, weight = part.partition("=")
+        name = name.strip()
+        if name not in SCENARIOS:
+            raise ValueError(f"Unknown scenario {name!r}; choose from {', '.join(SCENARIOS)}")
+        mix[name] = float(weight or 1)
+    if not any(mix.values()):
+        raise ValueError("The mix needs at least one scenario with a positive weight")
+    return mix
@@ -0,0 +1,98 @@
+# benchmarks/loadtest/serve.py
+# Runs src.server through the production entrypoint (src.serve) against local
+# stand-ins, for the load test:
+#   - S3: moto's in-process mock, unless AWS_ENDPOINT_URL_S3 points at an
+#     S3-compatible server (MinIO, moto_server, ...)
+#   - MongoDB: mongomock, unless MONGODB_URI is set (e.g. a local mongod)
+#   - Hugging Face Space: the stub client (HF_SPACE_STUB), whose latency and
+#     concurrency come from HF_STUB_LATENCY / HF_STUB_CONCURRENCY
+#   - Cognito: the JWKS served by the parent process (COGNITO_ISSUER)
+# The in-process stand-ins are set up in each worker (benchmarks/loadtest/app.py),
+# so with --workers above 1 every worker has its own MongoDB and S3 contents.
+#
+#   python -m benchmarks.loadtest.serve --port 8000 --workers 2
+import argparse
+import os
+
+
+def use_in_memory_mongo():
+    import mongomock
+    import pymongo
+    import pymongo.mongo_client
+
+    # mongomock doesn't accept some driver options, and its bulk_write doesn't
+    # work with current pymongo operation classes, so those are run one by one
+    class InMemoryClient(mongomock.MongoClient):
+        def __init__(self, *args, **kwargs):
+            for option in ("server_api", "maxPoolSize", "event_listeners"):
+                kwargs.pop(option, None)
+            super().__init__(*args, **kwargs)
+
+    def bulk_write(self, operations, ordered=True, **kwargs):
+        class Result:
+            upserted_count = modified_count = deleted_count = inserted_count = 0
+
+        result = Result()
+        for operation in operations:
+            kind = type(operation).__name__
+            if kind in ("UpdateOne", "ReplaceOne"):
+                method = self.update_one if kind == "UpdateOne" else self.replace_one
+                outcome = method(operation._filter, operation._doc, upsert=operation._upsert)
+                result.modified_count += outcome.modified_count
+                result.upserted_count += outcome.upserted_id is not None
+            elif kind == "DeleteOne":
+                result.deleted_count += self.delete_one(operation._filter).deleted_count
+            elif kind == "InsertOne":
+                self.insert_one(operation._doc)
+                result.inserted_count += 1
+        return result
+
+    shared = InMemoryClient()
+    pymongo.mongo_client.MongoClient = lambda *args, **kwargs: shared
+    pymongo.MongoClient = pymongo.mongo_client.MongoClient
+    mongomock.collection.Collection.bulk_write = bulk_write
+
+
+def use_mock_s3(bucket: str):
+    from moto import mock_aws
+    import boto3
+
+    mock_aws().start()
+    boto3.client("s3", region_name=os.environ.get("AWS_DEFAULT_REGION", "us-east-1")).create_bucket(Bucket=bucket)
+
+
+def use_stand_ins():
+    if not os.environ.get("MONGODB_URI"):
+        use_in_memory_mongo()
+    if not os.environ.get("AWS_ENDPOINT_URL_S3") and not os.environ.get("AWS_ENDPOINT_URL"):
+        use_mock_s3(os.environ["S3_BUCKET_NAME"])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve the app against local stand-ins")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--workers", type=int, default=1)
+    args = parser.parse_args()
+
+    os.environ.setdefault("AWS_DEFAULT_REGION", "us-east-1")
+    os.environ.setdefault("AWS_ACCESS_KEY_ID", "loadtest")
+    os.environ.setdefault("AWS_SECRET_ACCESS_KEY", "loadtest")
+    os.environ.setdefault("S3_BUCKET_NAME", "loadtest")
+    os.environ.setdefault("MONGODB_DB_NAME", "loadtest")
+    os.environ.setdefault("MONGODB_DB_COLLECTION", "books")
+    os.environ.setdefault("HF_SPACE_STUB", "true")
+    # Read by src.serve on import, and inherited by its workers
+    os.environ["SERVER_HOST"] = args.host
+    os.environ["SERVER_PORT"] = str(args.port)
+    os.environ["SERVER_WORKERS"] = str(args.workers)
+    os.environ.setdefault("SERVER_LOG_LEVEL", "warning")
+    os.environ.setdefault("SERVER_ACCESS_LOG", "false")
+
+    from src import serve
+
+    serve.main("benchmarks.loadtest.app:app")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,83 @@
+# benchmarks/metadata.py
+# Compares EPUB metadata extraction through the OPF package document with the
+# previous pymupdf (models.book) and ebooklib (database.book_metadata) paths.
+#
+#   python -m benchmarks.metadata                      # generated corpus
+#   python -m benchmarks.metadata --corpus ~/books     # your own EPUB files
+import argparse
+import glob
+import io
+import os
+import statistics
+import tempfile
+import time
+import warnings
+
+import pymupdf
+from ebooklib import epub
+
+from src.utils.epub import read_metadata
+from .corpus import build_corpus
+
+
+def opf_extractor(path):
+    with open(path, "rb") as file:
+        return read_metadata(file)["title"]
+
+
+def pymupdf_extractor(path):
+    # Previous models.book.extract_metadata: the whole file in memory, parsed by pymupdf
+    with open(path, "rb") as file:
+        doc = pymupdf.open(stream=io.BytesIO(file.read()), filetype="application/epub+zip")
+    title = doc.metadata["title"]
+    doc.close()
+    return title
+
+
+def ebooklib_extractor(path):
+    # Previous database.book_metadata.extract_metadata
+    return epub.read_epub(path).get_metadata("DC", "title")[0][0]
+
+
+EXTRACTORS = {
+    "opf": opf_extractor,
+    "pymupdf": pymupdf_extractor,
+    "ebooklib": ebooklib_extractor,
+}
+
+
+def measure(extractor, path, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        extractor(path)
+        timings.append((time.perf_counter() - start) * 1000)
+    return statistics.median(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--corpus", help="Directory of .epub files (default: a generated corpus)")
+    parser.add_argument("--repeat", type=int, default=5, help="Runs per book and extractor; the median is reported")
+    args = parser.parse_args()
+
+    directory = args.corpus or os.path.join(tempfile.gettempdir(), "wordvision-benchmark-corpus")
+    paths = sorted(glob.glob(os.path.join(directory, "*.epub"))) if args.corpus else build_corpus(directory)
+    if not paths:
+        parser.error(f"No .epub files found in {directory}")
+
+    warnings.simplefilter("ignore")
+    print(f"{'book':<32}{'size MB':>10}" + "".join(f"{name + ' ms':>14}" for name in EXTRACTORS))
+    for path in paths:
+        row = f"{os.path.basename(path)[:30]:<32}{os.path.getsize(path) / 2**20:>10.1f}"
+        for extractor in EXTRACTORS.values():
+            try:
+                row += f"{measure(extractor, path, args.repeat):>14.2f}"
+            except Exception as e:
+                row += f"{'error':>14}"
+                print(f"{path}: {extractor.__name__} failed: {e}")
+        print(row)
+
+
+if __name__ == "__main__":
+    main()
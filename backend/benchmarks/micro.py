@@ -0,0 +1,236 @@
+# benchmarks/micro.py
+# Time and peak memory of the CPU-bound book and image steps, over a generated
+# corpus of EPUBs and PDFs (0.5 to 200 MB) and 1024px WebP renders:
+#   book.extract_metadata            models.book, as run on upload (OPF reader for EPUBs, pymupdf for PDFs)
+#   book.extract_metadata:pymupdf    its pymupdf path, which EPUBs fall back to
+#   book_metadata.extract_metadata   database.book_metadata (OPF reader)
+#   book_metadata.extract_metadata:ebooklib  its ebooklib fallback
+#   text2image.read_image            WebP -> PNG conversion of a Space result
+#   image_variants.render_variants   resized WebP/AVIF renditions of that PNG
+#
+# Each operation and input runs in a fresh process, so its peak RSS isn't hidden
+# by memory an earlier one left behind; "peak MB" is how far RSS rose above the
+# process after imports. Results are saved as JSON; --compare shows the change per row.
+#
+#   python -m benchmarks.micro                         # everything, up to 200 MB books
+#   python -m benchmarks.micro --max-mb 50 --repeat 3  # skip the largest books
+#   python -m benchmarks.micro --only text2image --compare benchmarks/results/micro-20260101T000000Z.json
+import argparse
+import gc
+import json
+import os
+import resource
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+
+from .corpus import MICRO_EPUBS, MICRO_PDFS, build_corpus, build_images
+from .loadtest.report import git_commit
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RESULTS_DIR = os.path.join(BACKEND_DIR, "benchmarks", "results")
+CORPUS_DIR = os.path.join(tempfile.gettempdir(), "wordvision-benchmark-corpus")
+EPUB_TYPE = "application/epub+zip"
+PDF_TYPE = "application/pdf"
+# Marks the child's result line, since the code under test may print
+RESULT_PREFIX = "MICRO-RESULT "
+
+
+def book_type(path: str) -> str:
+    return PDF_TYPE if path.endswith(".pdf") else EPUB_TYPE
+
+
+# Each operation returns a function that runs it once on the input, so the
+# modules are imported (and the input prepared) before measuring
+def book_extract_metadata(path):
+    from src.models.book import extract_metadata
+
+    def run():
+        with open(path, "rb") as file:
+            return extract_metadata(file, book_type(path))
+    return run
+
+
+def book_extract_metadata_pymupdf(path):
+    import pymupdf
+    from src.models.book import file_view
+
+    def run():
+        with open(path, "rb") as file, file_view(file) as view:
+            doc = pymupdf.open(stream=view, filetype=book_type(path))
+            try:
+                return doc.metadata
+            finally:
+                doc.close()
+    return run
+
+
+def book_metadata_extract_metadata(path):
+    from src.database.book_metadata import extract_metadata
+    return lambda: extract_metadata(path)
+
+
+def book_metadata_extract_metadata_ebooklib(path):
+    from ebooklib import epub
+    return lambda: epub.read_epub(path).get_metadata("DC", "title")
+
+
+def text2image_read_image(path):
+    from src.utils.text2image import read_image
+    return lambda: read_image(path)
+
+
+def image_variants_render_variants(path):
+    from src.utils.image_variants import render_variants
+    from src.utils.text2image import read_image
+    png = read_image(path)
+    return lambda: render_variants(png)
+
+
+# name: (function, inputs)
+OPERATIONS = {
+    "book.extract_metadata": (book_extract_metadata, "books"),
+    "book.extract_metadata:pymupdf": (book_extract_metadata_pymupdf, "books"),
+    "book_metadata.extract_metadata": (book_metadata_extract_metadata, "epubs"),
+    "book_metadata.extract_metadata:ebooklib": (book_metadata_extract_metadata_ebooklib, "epubs"),
+    "text2image.read_image": (text2image_read_image, "images"),
+    "image_variants.render_variants": (image_variants_render_variants, "images"),
+}
+
+
+def process_status(field: str) -> float | None:
+    try:
+        with open("/proc/self/status") as file:
+            for line in file:
+                if line.startswith(field + ":"):
+                    return int(line.split()[1]) / 2**10
+    except OSError:
+        pass
+    return None
+
+
+# Current RSS, with the peak reset to it where possible (Linux), so the peak measured
+# next isn't the one reached while importing. Elsewhere the peak so far is the baseline.
+def reset_peak_rss() -> float:
+    try:
+        with open("/proc/self/clear_refs", "w") as file:
+            file.write("5")
+        return process_status("VmRSS")
+    except OSError:
+        return peak_rss_mb()
+
+
+def peak_rss_mb() -> float:
+    peak = process_status("VmHWM")
+    if peak is not None:
+        return peak
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Kilobytes on Linux, bytes on macOS
+    return peak / (2**20 if sys.platform == "darwin" else 2**10)
+
+
+# Child process: run one operation on one input and print its measurements
+def measure(operation: str, path: str, repeat: int):
+    run = OPERATIONS[operation][0](path)
+    gc.collect()
+    baseline = reset_peak_rss()
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        run()
+        timings.append((time.perf_counter() - start) * 1000)
+    peak = peak_rss_mb()
+    print(RESULT_PREFIX + json.dumps({
+        "medianMs": round(statistics.median(timings), 2),
+        "minMs": round(min(timings), 2),
+        "peakMb": round(peak - baseline, 1),
+        "rssMb": round(peak, 1),
+    }))
+
+
+def run_child(operation: str, path: str, repeat: int) -> dict:
+    completed = subprocess.run(
+        [sys.executable, "-m", "benchmarks.micro", "--child", operation, path, "--repeat", str(repeat)],
+        cwd=BACKEND_DIR, capture_output=True, text=True,
+    )
+    for line in completed.stdout.splitlines():
+        if line.startswith(RESULT_PREFIX):
+            return json.loads(line[len(RESULT_PREFIX):])
+    error = (completed.stderr.strip().splitlines() or ["no output"])[-1]
+    return {"error": error}
+
+
+def build_inputs(max_mb: float) -> dict:
+    books = [book for book in MICRO_EPUBS + MICRO_PDFS if book[1] <= max_mb]
+    paths = build_corpus(CORPUS_DIR, books)
+    return {
+        "books": paths,
+        "epubs": [path for path in paths if path.endswith(".epub")],
+        "images": build_images(os.path.join(CORPUS_DIR, "images")),
+    }
+
+
+def print_row(operation: str, name: str, size: float, result: dict, baseline: dict | None = None):
+    row = f"{operation[:40]:<42}{name[:14]:<16}{size:>8.1f}"
+    if "error" in result:
+        print(f"{row}  error: {result['error']}")
+        return
+    row += f"{result['medianMs']:>12.2f}{result['minMs']:>10.2f}{result['peakMb']:>10.1f}"
+    if baseline and "medianMs" in baseline and baseline["medianMs"]:
+        row += f"{(result['medianMs'] - baseline['medianMs']) / baseline['medianMs'] * 100:>+10.0f}%"
+        row += f"{result['peakMb'] - baseline['peakMb']:>+10.1f}"
+    print(row)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Microbenchmarks of the CPU-bound book and image steps")
+    parser.add_argument("--child", nargs=2, metavar=("OPERATION", "PATH"), help=argparse.SUPPRESS)
+    parser.add_argument("--repeat", type=int, default=5, help="Runs per operation and input; the median is reported")
+    parser.add_argument("--max-mb", type=float, default=200, help="Skip books larger than this")
+    parser.add_argument("--only", help="Run operations whose name contains this")
+    parser.add_argument("--output", default=RESULTS_DIR, help="Directory for the JSON results")
+    parser.add_argument("--compare", help="Results file of an earlier run to compare with")
+    args = parser.parse_args()
+
+    if args.child:
+        measure(args.child[0], args.child[1], args.repeat)
+        return
+
+    baseline = {}
+    if args.compare:
+        with open(args.compare) as file:
+            baseline = {(row["operation"], row["input"]): row for row in json.load(file)["results"]}
+
+    print(f"Building the corpus in {CORPUS_DIR}")
+    inputs = build_inputs(args.max_mb)
+
+    header = f"{'operation':<42}{'input':<16}{'MB':>8}{'median ms':>12}{'min ms':>10}{'peak MB':>10}"
+    print(header + (f"{'time':>11}{'peak':>10}" if baseline else ""))
+    results = []
+    for operation, (_, kind) in OPERATIONS.items():
+        if args.only and args.only not in operation:
+            continue
+        for path in inputs[kind]:
+            name = os.path.basename(path)
+            size = os.path.getsize(path) / 2**20
+            result = run_child(operation, path, args.repeat)
+            print_row(operation, name, size, result, baseline.get((operation, name)))
+            results.append({"operation": operation, "input": name, "sizeMb": round(size, 1), **result})
+
+    os.makedirs(args.output, exist_ok=True)
+    now = datetime.now(timezone.utc)
+    path = os.path.join(args.output, f"micro-{now.strftime('%Y%m%dT%H%M%SZ')}.json")
+    with open(path, "w") as file:
+        json.dump({
+            "timestamp": now.isoformat(), "commit": git_commit(),
+            "settings": {"repeat": args.repeat, "maxMb": args.max_mb, "python": sys.version.split()[0]},
+            "results": results,
+        }, file, indent=2)
+    print(f"\nSaved {path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,242 @@
+# benchmarks/search.py
+# Latency of a search (utils/search.search, what GET /search runs) on a library of
+# hundreds of books, against the 100 ms target. One user's library of --books generated
+# books, each with --chapters chapters of prose and --highlights highlights, is indexed
+# into a scratch database, then each kind of query runs --repeat times:
+#   common   a frequent word
+#   rare     a word found in a handful of books
+#   words    two words
+#   phrase   a quoted phrase
+#   negated  a word, excluding another
+#   book     a frequent word within one book (?book_id=)
+# Reported are the median, p95 and p99 of the whole call (the $text query and the
+# snippets of a page of results), and of the snippets alone. Exits with status 1 when a
+# p95 is over --target-ms, so it can gate CI.
+#
+# Needs a MongoDB with text search (mongomock has none); --snippets-only times just the
+# snippets, on generated passages, without one:
+#   python -m benchmarks.search --mongo-uri mongodb://localhost:27017
+#   python -m benchmarks.search --mongo-uri mongodb://localhost:27017 --books 500 --reuse
+#   python -m benchmarks.search --snippets-only
+import argparse
+import asyncio
+import json
+import os
+import random
+import statistics
+import sys
+import time
+from datetime import datetime, timezone
+
+from .loadtest.report import git_commit
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RESULTS_DIR = os.path.join(BACKEND_DIR, "benchmarks", "results")
+OWNER_ID = "search-benchmark"
+SYLLABLES = ["ba", "ce", "di", "fo", "gu", "ha", "je", "ki", "lo", "mu", "na", "pe", "ri", "so", "tu", "va", "we", "za", "ion", "ent", "ast", "orn"]
+
+
+# Made-up words, most frequent first; word frequencies follow Zipf's law, like prose
+def vocabulary(size: int, seed: int) -> list:
+    rng = random.Random(seed)
+    words = set()
+    while len(words) < size:
+        words.add("".join(rng.choice(SYLLABLES) for _ in range(rng.randint(1, 4))))
+    return sorted(words, key=lambda word: (len(word), word))
+
+
+class Prose:
+    def __init__(self, words: list, seed: int):
+        self.words = words
+        self.weights = [1 / rank for rank in range(1, len(words) + 1)]
+        self.rng = random.Random(seed)
+
+    def sentence(self) -> str:
+        words = self.rng.choices(self.words, self.weights, k=self.rng.randint(6, 18))
+        return " ".join(words).capitalize() + "."
+
+    def text(self, characters: int) -> str:
+        sentences, length = [], 0
+        while length < characters:
+            sentences.append(self.sentence())
+            length += len(sentences[-1]) + 1
+        return " ".join(sentences)
+
+
+# Search documents of a generated library, shaped like search.passage_documents and
+# search.highlight_update make them
+def library_documents(prose: Prose, books: int, chapters: int, chapter_chars: int, highlights: int):
+    from src.utils import search
+
+    for book in range(books):
+        book_id = f"book-{book}"
+        for chapter in range(chapters):
+            for number, (offset, passage) in enumerate(search.split_passages(prose.text(chapter_chars))):
+                yield {
+                    "_id": f"{OWNER_ID}:{book_id}:{chapter}:{number}", "ownerId": OWNER_ID, "bookId": book_id,
+                    "kind": "book", "chapter": chapter, "offset": offset, "text": passage,
+                }
+        for number in range(highlights):
+            yield {
+                "_id": f"highlight:{OWNER_ID}:{book_id}:{book_id}-{number}", "ownerId": OWNER_ID, "bookId": book_id,
+                "kind": "highlight", "highlightId": f"{book_id}-{number}", "offset": 0, "text": prose.sentence(),
+            }
+
+
+def fill(collection, prose: Prose, args) -> int:
+    from src.utils.search import INSERT_BATCH_SIZE
+
+    collection.delete_many({})
+    count, batch = 0, []
+    for document in library_documents(prose, args.books, args.chapters, args.chapter_chars, args.highlights):
+        batch.append(document)
+        if len(batch) >= INSERT_BATCH_SIZE:
+            collection.insert_many(batch, ordered=False)
+            count += len(batch)
+            batch = []
+            print(f"\rIndexed {count} documents", end="", flush=True)
+    if batch:
+        collection.insert_many(batch, ordered=False)
+        count += len(batch)
+    print(f"\rIndexed {count} documents")
+    return count
+
+
+# query kind: (query, book id)
+def queries(words: list, sample: str) -> dict:
+    first, second = sample.split()[2:4]
+    return {
+        "common": (words[3], None),
+        "rare": (words[len(words) // 2], None),
+        "words": (f"{words[10]} {words[200]}", None),
+        "phrase": (f'"{first.strip(".").lower()} {second.strip(".").lower()}"', None),
+        "negated": (f"{words[20]} -{words[3]}", None),
+        "book": (words[3], "book-0"),
+    }
+
+
+def percentiles(timings: list) -> dict:
+    ordered = sorted(timings)
+    pick = lambda fraction: ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+    return {
+        "medianMs": round(statistics.median(ordered), 2),
+        "p95Ms": round(pick(0.95), 2),
+        "p99Ms": round(pick(0.99), 2),
+    }
+
+
+# Time of the snippets of one page of results for the query
+def time_snippets(texts: list, query: str) -> float:
+    from src.utils import search
+
+    start = time.perf_counter()
+    terms = search.query_terms(query)
+    for text in texts:
+        search.snippet(text, terms)
+    return (time.perf_counter() - start) * 1000
+
+
+async def run_queries(collection, kinds: dict, args) -> dict:
+    from src.utils import search
+
+    results = {}
+    for kind, (query, book_id) in kinds.items():
+        criteria = {"ownerId": OWNER_ID, "$text": {"$search": query}, **({"bookId": book_id} if book_id else {})}
+        page = [document["text"] for document in collection.find(
+            criteria, {"text": 1, "score": {"$meta": "textScore"}},
+            sort=[("score", {"$meta": "textScore"})], limit=args.limit,
+        )]
+        calls, snippets = [], []
+        for _ in range(args.repeat):
+            start = time.perf_counter()
+            found, _more = await search.search(OWNER_ID, query, book_id, None, 0, args.limit)
+            calls.append((time.perf_counter() - start) * 1000)
+            snippets.append(time_snippets(page, query))
+        results[kind] = {"query": query, "results": len(found), "search": percentiles(calls), "snippets": percentiles(snippets)}
+    return results
+
+
+def snippet_queries(prose: Prose, kinds: dict, args) -> dict:
+    from src.utils import search
+
+    page = [passage for _offset, passage in search.split_passages(prose.text(search.SEARCH_PASSAGE_SIZE * args.limit))][:args.limit]
+    results = {}
+    for kind, (query, _book_id) in kinds.items():
+        snippets = [time_snippets(page, query) for _ in range(args.repeat)]
+        results[kind] = {"query": query, "snippets": percentiles(snippets)}
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Search latency on a large library")
+    parser.add_argument("--mongo-uri", default=os.getenv("MONGODB_URI"), help="MongoDB to index into (default MONGODB_URI)")
+    parser.add_argument("--database", default="search_benchmark", help="Scratch database, dropped afterwards unless --reuse")
+    parser.add_argument("--books", type=int, default=300)
+    parser.add_argument("--chapters", type=int, default=20)
+    parser.add_argument("--chapter-chars", type=int, default=20000, help="Characters of prose per chapter")
+    parser.add_argument("--highlights", type=int, default=20, help="Highlights per book")
+    parser.add_argument("--limit", type=int, default=20, help="Results per page, as GET /search's default")
+    parser.add_argument("--repeat", type=int, default=50)
+    parser.add_argument("--target-ms", type=float, default=100)
+    parser.add_argument("--reuse", action="store_true", help="Keep the scratch database, and use it if it is already filled")
+    parser.add_argument("--snippets-only", action="store_true", help="Time only the snippets; no MongoDB needed")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--output", default=RESULTS_DIR, help="Directory for the JSON results")
+    args = parser.parse_args()
+    if not args.snippets_only and not args.mongo_uri:
+        parser.error("--mongo-uri is required (mongomock has no text search), or pass --snippets-only")
+
+    # The app reads its MongoDB settings on import
+    if not args.snippets_only:
+        os.environ["MONGODB_URI"] = args.mongo_uri
+        os.environ["MONGODB_DB_NAME"] = args.database
+    os.environ.setdefault("MONGODB_SEARCH_COLLECTION", "search")
+    from src.database.mongodb import get_db, get_mongo_client
+    from src.utils import search
+
+    words = vocabulary(20000, args.seed)
+    prose = Prose(words, args.seed)
+    kinds = queries(words, prose.sentence())
+
+    if args.snippets_only:
+        results = snippet_queries(prose, kinds, args)
+    else:
+        collection = get_db()[search.MONGODB_SEARCH_COLLECTION]
+        expected = args.books * args.highlights
+        if args.reuse and collection.count_documents({"kind": "highlight"}) == expected and expected:
+            print(f"Using the {collection.estimated_document_count()} documents already in {args.database}")
+        else:
+            search.ensure_indexes()
+            fill(collection, prose, args)
+        try:
+            results = asyncio.run(run_queries(collection, kinds, args))
+        finally:
+            if not args.reuse:
+                get_mongo_client().drop_database(args.database)
+
+    over = []
+    print(f"\n{'query':<10}{'results':>8}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'snippet p95':>13}")
+    for kind, result in results.items():
+        timed = result.get("search", result["snippets"])
+        if timed["p95Ms"] > args.target_ms:
+            over.append(kind)
+        print(
+            f"{kind:<10}{result.get('results', '-'):>8}{timed['medianMs']:>10.2f}{timed['p95Ms']:>10.2f}"
+            f"{timed['p99Ms']:>10.2f}{result['snippets']['p95Ms']:>13.2f}"
+        )
+
+    os.makedirs(args.output, exist_ok=True)
+    now = datetime.now(timezone.utc)
+    path = os.path.join(args.output, f"search-{now.strftime('%Y%m%dT%H%M%SZ')}.json")
+    settings = {key: value for key, value in vars(args).items() if key not in ("mongo_uri", "output")}
+    with open(path, "w") as file:
+        json.dump({"timestamp": now.isoformat(), "commit": git_commit(), "settings": settings, "results": results}, file, indent=2)
+    print(f"\nSaved {path}")
+
+    if over:
+        print(f"p95 over {args.target_ms:g} ms: {', '.join(over)}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,69 @@
+# benchmarks/workers.py
+# How throughput scales with the number of server workers (src.serve). Runs the HTTP
+# load test (benchmarks.loadtest) once per worker count, with the same mix, clients and
+# duration, and reports RPS and latency of all requests for each, with the speedup over
+# the first count and its efficiency per worker.
+#
+# With more than one worker the in-memory stand-ins are per worker, so only the `health`
+# and `list` actions give consistent results; for the full mix point it at a real MongoDB and S3:
+#   python -m benchmarks.workers --mix list --concurrency 32
+#   python -m benchmarks.workers --counts 1,2,4,8 --mongo-uri mongodb://localhost:27017 --s3-endpoint http://localhost:9000
+#
+# The load generator is one Python process, so check its CPU isn't what runs out first
+# (run it from another machine, or compare with fewer clients).
+import argparse
+import asyncio
+import json
+import os
+from datetime import datetime, timezone
+
+from .loadtest.__main__ import add_arguments, checked_mix, run, run_settings
+from .loadtest.report import git_commit
+from src.serve import available_cpus
+
+
+def default_counts() -> str:
+    counts = [1]
+    while counts[-1] < max(2, available_cpus()):
+        counts.append(counts[-1] * 2)
+    return ",".join(str(count) for count in counts)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load-test throughput by number of server workers")
+    add_arguments(parser)
+    parser.add_argument("--counts", default=default_counts(), help="Worker counts to run, comma separated")
+    args = parser.parse_args()
+
+    counts = [int(count) for count in args.counts.split(",")]
+    mix = checked_mix(parser, args, max(counts))
+    print(f"{available_cpus()} CPUs available, worker counts {counts}")
+
+    results = []
+    for workers in counts:
+        args.workers = workers
+        print(f"\n{workers} worker(s)")
+        summary = asyncio.run(run(args, mix))
+        results.append({"workers": workers, **summary["all"], "routes": summary})
+
+    base = results[0]["rps"] / results[0]["workers"] if results[0]["rps"] else 0
+    print(f"\n{'workers':>8}{'rps':>9}{'speedup':>9}{'per wkr':>9}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'errors':>8}")
+    for row in results:
+        speedup = row["rps"] / results[0]["rps"] if results[0]["rps"] else 0
+        efficiency = row["rps"] / row["workers"] / base if base else 0
+        print(
+            f"{row['workers']:>8}{row['rps']:>9.1f}{speedup:>8.2f}x{efficiency:>8.0%} "
+            f"{row['p50']:>9.1f}{row['p95']:>9.1f}{row['p99']:>9.1f}{row['errors']:>8}"
+        )
+
+    os.makedirs(args.output, exist_ok=True)
+    now = datetime.now(timezone.utc)
+    path = os.path.join(args.output, f"workers-{now.strftime('%Y%m%dT%H%M%SZ')}.json")
+    settings = {**run_settings(args, mix), "workers": counts, "cpus": available_cpus()}
+    with open(path, "w") as file:
+        json.dump({"timestamp": now.isoformat(), "commit": git_commit(), "settings": settings, "results": results}, file, indent=2)
+    print(f"\nSaved {path}")
+
+
+if __name__ == "__main__":
+    main()
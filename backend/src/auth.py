@@ -1,16 +1,137 @@
 from dotenv import load_dotenv
 from fastapi import HTTPException, status, Request
 from jose import jwt, JWTError
+import hashlib
 import requests
+import threading
+import time
 import os
 
+from .database.executor import run_blocking
 from .models.book import hash_email
+from .utils.cache import TTLCache
+from .utils.metrics import track_dependency
+from .utils.tracing import span, traced
 
 load_dotenv()
 COGNITO_CLIENT_ID = os.getenv("COGNITO_CLIENT_ID")
 COGNITO_ISSUER = os.getenv("COGNITO_ISSUER")
 COGNITO_DOMAIN = os.getenv("COGNITO_DOMAIN")
 JWKS_URL = f"{COGNITO_ISSUER}/.well-known/jwks.json"
+JWKS_TTL_SECONDS = int(os.getenv("JWKS_TTL_SECONDS", "3600"))
+JWKS_MIN_REFRESH_INTERVAL = int(os.getenv("JWKS_MIN_REFRESH_INTERVAL", "30"))
+JWKS_REQUEST_TIMEOUT = float(os.getenv("JWKS_REQUEST_TIMEOUT", "5"))
+
+# "claims": build the user from verified ID token claims, falling back to the cached userInfo call
+# "userinfo": always use the (cached) Cognito userInfo call
+AUTH_IDENTITY_MODE = os.getenv("AUTH_IDENTITY_MODE", "claims")
+USER_INFO_CACHE_SIZE = int(os.getenv("USER_INFO_CACHE_SIZE", "10000"))
+USER_INFO_CACHE_TTL = int(os.getenv("USER_INFO_CACHE_TTL", "3600"))
+USER_INFO_REQUEST_TIMEOUT = float(os.getenv("USER_INFO_REQUEST_TIMEOUT", "5"))
+
+# Standard profile claims that Cognito also returns from /oauth2/userInfo
+USER_INFO_CLAIMS = (
+    "sub", "email", "email_verified", "name", "given_name", "family_name", "birthdate",
+    "phone_number", "phone_number_verified", "picture", "locale", "zoneinfo", "preferred_username",
+)
+
+
+# In-process cache of the Cognito JSON Web Key Set, indexed by key id (kid).
+# The first lookup fetches the key set synchronously. After that, lookups are
+# served from memory and a stale key set is refreshed on a background thread,
+# so token verification never waits on Cognito in the common case. A token
+# signed with an unknown kid (key rotation) triggers one forced refetch, rate
+# limited by JWKS_MIN_REFRESH_INTERVAL so forged kids can't hammer Cognito.
+class JWKSCache:
+    def __init__(self, url: str, ttl: int, min_refresh_interval: int):
+        self.url = url
+        self.ttl = ttl
+        self.min_refresh_interval = min_refresh_interval
+        self._keys: dict = {}
+        self._fetched_at = 0.0
+        self._last_forced_refresh = float("-inf")
+        self._refreshing = False
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.refreshes = 0
+        self.refresh_errors = 0
+
+    def refresh(self) -> bool:
+        try:
+            with track_dependency("cognito_jwks", "get"), span("cognito jwks", "client", **{"http.url": self.url}):
+                response = requests.get(self.url, timeout=JWKS_REQUEST_TIMEOUT)
+                response.raise_for_status()
+            keys = {key["kid"]: key for key in response.json().get("keys", []) if "kid" in key}
+        except (requests.RequestException, ValueError, KeyError) as e:
+            print(f"Failed to refresh JWKS from {self.url}: {e}")
+            with self._lock:
+                self.refresh_errors += 1
+            return False
+
+        with self._lock:
+            self._keys = keys
+            self._fetched_at = time.monotonic()
+            self.refreshes += 1
+        return True
+
+    def _refresh_in_background(self):
+        with self._lock:
+            if self._refreshing:
+                return
+            self._refreshing = True
+
+        def run():
+            try:
+                self.refresh()
+            finally:
+                with self._lock:
+                    self._refreshing = False
+
+        threading.Thread(target=run, name="jwks-refresh", daemon=True).start()
+
+    def get_key(self, kid: str | None):
+        if not self._keys:
+            self.refresh()
+        elif time.monotonic() - self._fetched_at > self.ttl:
+            # Keep serving the current keys while the new set is fetched
+            self._refresh_in_background()
+
+        key = self._keys.get(kid)
+        if key is not None:
+            with self._lock:
+                self.hits += 1
+            return key
+
+        with self._lock:
+            self.misses += 1
+            now = time.monotonic()
+            force_refresh = now - self._last_forced_refresh >= self.min_refresh_interval
+            if force_refresh:
+                self._last_forced_refresh = now
+
+        if force_refresh and self.refresh():
+            return self._keys.get(kid)
+        return None
+
+    def has_keys(self) -> bool:
+        return bool(self._keys)
+
+    def stats(self) -> dict:
+        return {
+            "keys": len(self._keys),
+            "hits": self.hits,
+            "misses": self.misses,
+            "refreshes": self.refreshes,
+            "refresh_errors": self.refresh_errors,
+            "age_seconds": round(time.monotonic() - self._fetched_at, 1) if self._keys else None,
+        }
+
+
+jwks_cache = JWKSCache(JWKS_URL, JWKS_TTL_SECONDS, JWKS_MIN_REFRESH_INTERVAL)
+
+# userInfo responses keyed by token hash, each expiring no later than its token
+user_info_cache = TTLCache(USER_INFO_CACHE_SIZE, USER_INFO_CACHE_TTL)
 
 # Custom Middleware for Authentication
 async def auth_middleware(request: Request):
@@ -23,39 +144,39 @@ async def auth_middleware(request: Request):
     # Extract access_token from the Authorization header ("Bearer <token>")
     token = auth_header.split(" ")[1]
 
-    # Verify token
-    decoded_token = verify_jwt_token(token)
+    # Verify token. Both steps may call Cognito (a JWKS refetch for an unknown kid, userInfo
+    # for access tokens), so they run on the I/O executor rather than the event loop.
+    decoded_token = await run_blocking(verify_jwt_token, token)
     username = decoded_token.get("sub")
     if not username:
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="User identifier not found in token")
 
     # Attach user info to request
-    user = get_user_info(token)
-    user["id"] = hash_email(user["email"])
-    request.state.user = user
+    request.state.user = await run_blocking(get_user, token, decoded_token)
 
     return request
 
 # Function to Verify JWT Tokens
+@traced("verify_jwt_token")
 def verify_jwt_token(token: str):
     try:
-        # Fetch the public keys (JWKS) from Cognito
-        print(f"JWKS URL: {JWKS_URL}")
-        jwks = requests.get(JWKS_URL).json()
-        print("Fetched JWKS:", jwks)
+        # Look up the signing key for this token in the cached JWKS
+        kid = jwt.get_unverified_header(token).get("kid")
+        key = jwks_cache.get_key(kid)
 
-        if jwks is None:
-            raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Unable to retrieve JSON Web keys")
+        if key is None:
+            if not jwks_cache.has_keys():
+                raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Unable to retrieve JSON Web keys")
+            raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid token")
 
-        # Attempt to decode and verify the JWT token using the found JSON Web Keys
+        # Attempt to decode and verify the JWT token using the matching JSON Web Key
         payload = jwt.decode(
             token,
-            jwks,
+            key,
             algorithms=["RS256"],
             audience=COGNITO_CLIENT_ID,
             issuer=COGNITO_ISSUER,
         )
-        print("Decoded payload:", payload)  # Check if the payload contains the expected audience and issuer
         return payload  # Return the decoded token if it's valid
 
     except JWTError as e:
@@ -63,12 +184,52 @@ def verify_jwt_token(token: str):
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid token")
 
 
+# Resolve the user for a verified token without calling Cognito when possible
+def get_user(token: str, claims: dict) -> dict:
+    if AUTH_IDENTITY_MODE == "claims":
+        user = user_from_claims(claims)
+        if user:
+            return user
+
+    token_hash = hashlib.sha256(token.encode()).hexdigest()
+    user = user_info_cache.get(token_hash)
+    if user is None:
+        user = get_user_info(token)
+        user["id"] = hash_email(user["email"])
+        user_info_cache.set(token_hash, user, expires_at=claims.get("exp"))
+
+    # Routes may modify request.state.user, so never hand out the cached dict itself
+    return dict(user)
+
+
+# ID tokens carry the user's email and profile; access tokens don't, so those return None
+def user_from_claims(claims: dict) -> dict | None:
+    if claims.get("token_use") != "id" or not claims.get("email"):
+        return None
+
+    user = {claim: claims[claim] for claim in USER_INFO_CLAIMS if claim in claims}
+    user["username"] = claims.get("cognito:username", claims["sub"])
+    user["id"] = hash_email(user["email"])
+    return user
+
+
+@traced("get_user_info", "client")
 def get_user_info(access_token: str):
     user_info_url = f"https://{COGNITO_DOMAIN}/oauth2/userInfo"
     headers = {
         "Authorization": f"Bearer {access_token}"
     }
-    response = requests.get(user_info_url, headers=headers)
+    try:
+        with track_dependency("cognito_userinfo", "get") as call:
+            response = requests.get(user_info_url, headers=headers, timeout=USER_INFO_REQUEST_TIMEOUT)
+            if response.status_code != 200:
+                call["outcome"] = "error"
+    except requests.RequestException as e:
+        print(f"Cognito userInfo request failed: {e}")
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Unable to reach Cognito for user info"
+        )
 
     if response.status_code == 200:
         return response.json()  # User info returned by Cognito
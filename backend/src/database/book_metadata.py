@@ -1,11 +1,17 @@
 # src/database/book_metadata.py
 from ebooklib import epub
-from .mongodb import db_connection, collection
-
-db_connection()
+from .mongodb import get_db, MONGODB_DB_COLLECTION
+from ..utils.epub import EpubError, read_metadata
 
 # Function to extract metadata from an EPUB file
 def extract_metadata(epub_path):
+    # Read only the OPF package document, falling back to a full parse for malformed files
+    try:
+        with open(epub_path, "rb") as file:
+            return read_metadata(file)
+    except EpubError as e:
+        print(f"Falling back to ebooklib for {epub_path}: {e}")
+
     # Load the EPUB book
     book = epub.read_epub(epub_path)
     
@@ -24,7 +30,7 @@ def extract_metadata(epub_path):
 # Function to save metadata to MongoDB
 def save_metadata_to_mongodb(metadata):
     try:
-        collection.insert_one(metadata)
+        get_db()[MONGODB_DB_COLLECTION].insert_one(metadata)
         print("Metadata saved to MongoDB successfully!")
     except Exception as e:
         print(f"Failed to save metadata: {e}")
@@ -0,0 +1,47 @@
+# src/database/executor.py
+import asyncio
+import contextvars
+import functools
+import os
+from concurrent.futures import ThreadPoolExecutor
+from dotenv import load_dotenv
+
+from ..utils.metrics import io_executor_pending, io_executor_depth
+from ..utils.tracing import profiled_call
+
+load_dotenv()
+
+# pymongo, boto3 and the Cognito admin API are blocking clients. Routes hand those
+# calls to this bounded pool so a slow S3 upload or Mongo query only occupies one
+# thread instead of the whole event loop. IO_EXECUTOR_WORKERS is the number of
+# blocking calls a single uvicorn worker can have in flight at once; raise it for
+# I/O-heavy deployments (the MongoDB and S3 connection pools must be at least as big).
+IO_EXECUTOR_WORKERS = int(os.getenv("IO_EXECUTOR_WORKERS", "32"))
+
+io_executor = ThreadPoolExecutor(max_workers=IO_EXECUTOR_WORKERS, thread_name_prefix="io")
+
+
+# Set on every submit and start rather than read on scrape, since with several
+# workers /metrics is served from files the workers write (see utils/metrics.py)
+def _record_depth():
+    io_executor_depth.set(io_executor._work_queue.qsize())
+
+
+def _started(func, *args, **kwargs):
+    _record_depth()
+    return profiled_call(func, *args, **kwargs)
+
+
+# Run a blocking function on the I/O executor and await its result. It runs in a copy of
+# the caller's context, so context variables (like the current trace span) carry over, and
+# it is profiled along with the request when the request is profiled.
+async def run_blocking(func, *args, **kwargs):
+    loop = asyncio.get_running_loop()
+    context = contextvars.copy_context()
+    io_executor_pending.inc()
+    try:
+        future = loop.run_in_executor(io_executor, functools.partial(context.run, _started, func, *args, **kwargs))
+        _record_depth()
+        return await future
+    finally:
+        io_executor_pending.dec()
@@ -0,0 +1,31 @@
+# src/database/migrations/book_indexes.py
+# Add the index behind GET /books (see BOOK_LIST_SORT) to every per-user books collection.
+#
+#   python -m src.database.migrations.book_indexes [--dry-run]
+#
+# Libraries created since the index was introduced get it with their first book; this
+# covers the ones created before. Creating an index that exists is a no-op, so running
+# it again (or while the server is running) is always safe.
+import argparse
+
+from ..mongodb import get_db, BOOK_LIST_SORT
+from .shared_books import owner_collections
+
+
+def migrate(dry_run: bool = False):
+    db = get_db()
+    libraries = 0
+    for owner_id in owner_collections():
+        libraries += 1
+        if not dry_run:
+            db[owner_id].create_index(BOOK_LIST_SORT)
+
+    action = "Would index" if dry_run else "Indexed"
+    print(f"{action} {libraries} libraries")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Index every per-user books collection for GET /books")
+    parser.add_argument("--dry-run", action="store_true", help="count the libraries that would be indexed")
+    args = parser.parse_args()
+    migrate(dry_run=args.dry_run)
@@ -0,0 +1,114 @@
+# src/database/migrations/highlights.py
+# Copy highlights embedded in book documents into the highlights collection.
+#
+#   python -m src.database.migrations.highlights [--dry-run] [--remove-embedded]
+#
+# Safe to run more than once (and while the server is running): highlights are
+# upserted by id with $setOnInsert, so ones already migrated, or edited since,
+# are left alone. --remove-embedded unsets the old `highlights` arrays once
+# everything has been copied.
+#
+# Afterwards, highlights without a locationKey (created before it existed) get
+# one computed from their location, and the index on location it replaced is dropped.
+import argparse
+import re
+from pymongo import UpdateOne
+from pymongo.errors import OperationFailure
+
+from ..mongodb import get_db, highlight_document_id, highlight_filter, ensure_highlight_indexes, MONGODB_HIGHLIGHTS_COLLECTION
+from ...utils.locations import location_key
+
+# Per-user book collections are named after the sha256 of the owner's email
+OWNER_COLLECTION = re.compile(r"^[0-9a-f]{64}$")
+BATCH_SIZE = 1000
+
+
+def migrate(dry_run: bool = False, remove_embedded: bool = False):
+    db = get_db()
+    highlights = db[MONGODB_HIGHLIGHTS_COLLECTION]
+    if not dry_run:
+        ensure_highlight_indexes()
+
+    books_seen = copied = 0
+    for owner_id in filter(OWNER_COLLECTION.match, db.list_collection_names()):
+        books = db[owner_id]
+        operations = []
+        for book in books.find({"highlights.0": {"$exists": True}}, {"highlights": 1}):
+            books_seen += 1
+            for highlight in book["highlights"]:
+                document = {
+                    "_id": highlight_document_id(owner_id, book["_id"], highlight["id"]),
+                    **highlight,
+                    **highlight_filter(owner_id, book["_id"]),
+                    "locationKey": location_key(highlight.get("location")),
+                }
+                operations.append(UpdateOne(
+                    highlight_filter(owner_id, book["_id"], highlight["id"]),
+                    {"$setOnInsert": document},
+                    upsert=True,
+                ))
+
+            if len(operations) >= BATCH_SIZE:
+                copied += flush(highlights, operations, dry_run)
+                operations = []
+        copied += flush(highlights, operations, dry_run)
+
+        if remove_embedded and not dry_run:
+            result = books.update_many({"highlights": {"$exists": True}}, {"$unset": {"highlights": ""}})
+            print(f"{owner_id}: removed embedded highlights from {result.modified_count} books")
+
+    action = "Would copy" if dry_run else "Copied"
+    print(f"{action} {copied} highlights from {books_seen} books")
+
+    backfill_location_keys(dry_run)
+
+
+def backfill_location_keys(dry_run: bool = False):
+    highlights = get_db()[MONGODB_HIGHLIGHTS_COLLECTION]
+
+    updated = 0
+    operations = []
+    for highlight in highlights.find({"locationKey": {"$exists": False}}, {"location": 1}):
+        operations.append(UpdateOne(
+            {"_id": highlight["_id"], "locationKey": {"$exists": False}},
+            {"$set": {"locationKey": location_key(highlight.get("location"))}},
+        ))
+        if len(operations) >= BATCH_SIZE:
+            updated += set_keys(highlights, operations, dry_run)
+            operations = []
+    updated += set_keys(highlights, operations, dry_run)
+
+    action = "Would set" if dry_run else "Set"
+    print(f"{action} locationKey on {updated} highlights")
+
+    if not dry_run:
+        try:
+            highlights.drop_index("ownerId_1_bookId_1_location_1__id_1")
+            print("Dropped the (ownerId, bookId, location, _id) index")
+        except OperationFailure:
+            pass
+
+
+def flush(highlights, operations: list, dry_run: bool) -> int:
+    if not operations:
+        return 0
+    if dry_run:
+        return len(operations)
+    result = highlights.bulk_write(operations, ordered=False)
+    return result.upserted_count
+
+
+def set_keys(highlights, operations: list, dry_run: bool) -> int:
+    if not operations:
+        return 0
+    if dry_run:
+        return len(operations)
+    return highlights.bulk_write(operations, ordered=False).modified_count
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Move embedded book highlights into the highlights collection and backfill location keys")
+    parser.add_argument("--dry-run", action="store_true", help="count the highlights that would be copied")
+    parser.add_argument("--remove-embedded", action="store_true", help="unset the highlights arrays on book documents afterwards")
+    args = parser.parse_args()
+    migrate(dry_run=args.dry_run, remove_embedded=args.remove_embedded)
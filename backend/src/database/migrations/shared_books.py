@@ -0,0 +1,98 @@
+# src/database/migrations/shared_books.py
+# Copy every per-user books collection into the shared books collection.
+#
+#   python -m src.database.migrations.shared_books [--dry-run] [--shard] [--drop-source]
+#
+# Rollout, without downtime:
+#   1. deploy with MONGODB_BOOKS_STORAGE=dual, so new writes reach both layouts
+#   2. run this command (twice, to pick up anything written while the first run was copying)
+#   3. switch to MONGODB_BOOKS_STORAGE=shared
+#   4. run it with --drop-source to remove the per-user collections
+#
+# Per-user collections are authoritative until step 3, so their documents replace
+# the shared copies. Running it again is always safe.
+import argparse
+import re
+from pymongo import ReplaceOne
+
+from ..mongodb import get_db, get_mongo_client, ensure_books_indexes, MONGODB_BOOKS_COLLECTION, MONGODB_DB_NAME
+
+# Per-user book collections are named after the sha256 of the owner's email
+OWNER_COLLECTION = re.compile(r"^[0-9a-f]{64}$")
+BATCH_SIZE = 1000
+
+
+def migrate(dry_run: bool = False, shard: bool = False):
+    db = get_db()
+    books = db[MONGODB_BOOKS_COLLECTION]
+    if not dry_run:
+        ensure_books_indexes(force=True)
+        if shard:
+            shard_collection()
+
+    owners = copied = 0
+    for owner_id in owner_collections():
+        owners += 1
+        operations = []
+        for book in db[owner_id].find({}):
+            book["ownerId"] = owner_id
+            operations.append(ReplaceOne({"_id": book["_id"], "ownerId": owner_id}, book, upsert=True))
+            if len(operations) >= BATCH_SIZE:
+                copied += flush(books, operations, dry_run)
+                operations = []
+        copied += flush(books, operations, dry_run)
+
+    action = "Would copy" if dry_run else "Copied"
+    print(f"{action} {copied} books of {owners} users into {MONGODB_BOOKS_COLLECTION}")
+
+
+# Drop per-user collections whose books are all in the shared collection. Nothing is
+# copied: once the server runs in shared mode, the per-user copies may be stale.
+def drop_sources(dry_run: bool = False):
+    db = get_db()
+    books = db[MONGODB_BOOKS_COLLECTION]
+    for owner_id in owner_collections():
+        book_ids = db[owner_id].distinct("_id")
+        shared = books.count_documents({"ownerId": owner_id, "_id": {"$in": book_ids}})
+        if shared < len(book_ids):
+            print(f"{owner_id}: {len(book_ids) - shared} books not copied, keeping the collection")
+        elif dry_run:
+            print(f"{owner_id}: would drop")
+        else:
+            db[owner_id].drop()
+            print(f"{owner_id}: dropped")
+
+
+def owner_collections() -> list:
+    return sorted(filter(OWNER_COLLECTION.match, get_db().list_collection_names()))
+
+
+def flush(books, operations: list, dry_run: bool) -> int:
+    if not operations:
+        return 0
+    if dry_run:
+        return len(operations)
+    books.bulk_write(operations, ordered=False)
+    return len(operations)
+
+
+# Shard the books collection on a hashed ownerId, which spreads users evenly across
+# shards while keeping each user's library (and every query of it) on a single shard
+def shard_collection():
+    namespace = f"{MONGODB_DB_NAME}.{MONGODB_BOOKS_COLLECTION}"
+    client = get_mongo_client()
+    client.admin.command("enableSharding", MONGODB_DB_NAME)
+    client.admin.command("shardCollection", namespace, key={"ownerId": "hashed"})
+    print(f"Sharded {namespace} on a hashed ownerId")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Copy per-user books collections into the shared books collection")
+    parser.add_argument("--dry-run", action="store_true", help="count the books that would be copied")
+    parser.add_argument("--shard", action="store_true", help="shard the books collection on a hashed ownerId first")
+    parser.add_argument("--drop-source", action="store_true", help="only drop per-user collections that were copied completely")
+    args = parser.parse_args()
+    if args.drop_source:
+        drop_sources(dry_run=args.dry_run)
+    else:
+        migrate(dry_run=args.dry_run, shard=args.shard)
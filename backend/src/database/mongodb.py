@@ -1,25 +1,74 @@
 # src/database/mongodb.py
+from pymongo import ASCENDING, DESCENDING, HASHED
 from pymongo.mongo_client import MongoClient
 from pymongo.server_api import ServerApi
 from dotenv import load_dotenv
 import os
+import threading
+
+from .executor import IO_EXECUTOR_WORKERS, run_blocking
+from ..utils.metrics import MongoCommandMetrics
+from ..utils.tracing import MongoCommandTracer, TRACING_ENABLED
 
 load_dotenv()
 MONGODB_DB_PASSWORD = os.getenv("MONGODB_DB_PASSWORD")
 MONGODB_DB_NAME = os.getenv("MONGODB_DB_NAME")
 MONGODB_DB_COLLECTION = os.getenv("MONGODB_DB_COLLECTION")
 URI = os.getenv("MONGODB_URI")
+MONGODB_HIGHLIGHTS_COLLECTION = os.getenv("MONGODB_HIGHLIGHTS_COLLECTION", "highlights")
+MONGODB_BOOKS_COLLECTION = os.getenv("MONGODB_BOOKS_COLLECTION", "books")
+# Where book documents live:
+#   per_user - one collection per user, named after the hashed email (the original layout)
+#   dual     - per-user collections stay authoritative, writes are mirrored to the books collection
+#   shared   - one books collection for everyone, every query scoped by ownerId
+MONGODB_BOOKS_STORAGE = os.getenv("MONGODB_BOOKS_STORAGE", "per_user")
+
+# The client is created on first use rather than at import, so importing the app never
+# touches the network and each worker process builds its own connection pool
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_mongo_client() -> MongoClient:
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = MongoClient(
+                    URI, server_api=ServerApi('1'), maxPoolSize=max(100, IO_EXECUTOR_WORKERS),
+                    event_listeners=[MongoCommandMetrics()] + ([MongoCommandTracer()] if TRACING_ENABLED else []),
+                )
+    return _client
+
+
+def get_db():
+    return get_mongo_client()[MONGODB_DB_NAME]
+
+
+def close_mongo_client():
+    global _client
+    with _client_lock:
+        client, _client = _client, None
+    if client is not None:
+        client.close()
+
+
+# A client's sockets and monitor threads don't survive a fork, so a forked
+# worker starts without one instead of inheriting the parent's
+def _forget_client_after_fork():
+    global _client, _client_lock
+    _client = None
+    _client_lock = threading.Lock()
+
+
+os.register_at_fork(after_in_child=_forget_client_after_fork)
 
-# Create a new client and connect to the server
-client = MongoClient(URI, server_api=ServerApi('1'))
-db = client[MONGODB_DB_NAME]
-collection = db[MONGODB_DB_COLLECTION]
 
 # Send a ping to confirm a successful connection
 def db_connection():
     try:
-        client.admin.command('ping')
-        print(f"Connected to:\nDATABASE:{db}\nCOLLECTION:{collection}")
+        get_mongo_client().admin.command('ping')
+        print(f"Connected to:\nDATABASE:{MONGODB_DB_NAME}\nCOLLECTION:{MONGODB_DB_COLLECTION}")
         print("Pinged your deployment. You successfully connected to MongoDB!")
         return True
     except Exception as e:
@@ -28,7 +77,263 @@ def db_connection():
     
 def get_mongodb_collection(ownerId: str):
     try:
+        db = get_db()
+        if MONGODB_BOOKS_STORAGE == "shared":
+            return ScopedCollection(db[MONGODB_BOOKS_COLLECTION], ownerId)
+        if MONGODB_BOOKS_STORAGE == "dual":
+            return DualCollection(db[ownerId], ScopedCollection(db[MONGODB_BOOKS_COLLECTION], ownerId))
         return db[ownerId]  # Return the collection using the hashed email as the collection name
     except Exception as e:
         print(f"Error retrieving collection for ownerId {ownerId}: {e}")
         raise Exception(f"Could not retrieve collection for ownerId: {ownerId}")
+
+
+# One user's view of the shared books collection. Filters, inserted documents and
+# index keys get the owner's id added, so callers use it like a per-user collection.
+class ScopedCollection:
+    def __init__(self, collection, owner_id: str):
+        self.collection = collection
+        self.owner_id = owner_id
+
+    def scope(self, filter: dict | None) -> dict:
+        return {**(filter or {}), "ownerId": self.owner_id}
+
+    def own(self, document: dict) -> dict:
+        return {**document, "ownerId": self.owner_id}
+
+    def find_one(self, filter=None, *args, **kwargs):
+        return self.collection.find_one(self.scope(filter), *args, **kwargs)
+
+    def find(self, filter=None, *args, **kwargs):
+        return self.collection.find(self.scope(filter), *args, **kwargs)
+
+    def aggregate(self, pipeline: list, *args, **kwargs):
+        return self.collection.aggregate([{"$match": self.scope(None)}, *pipeline], *args, **kwargs)
+
+    def count_documents(self, filter, *args, **kwargs):
+        return self.collection.count_documents(self.scope(filter), *args, **kwargs)
+
+    def insert_one(self, document: dict, *args, **kwargs):
+        return self.collection.insert_one(self.own(document), *args, **kwargs)
+
+    def insert_many(self, documents: list, *args, **kwargs):
+        return self.collection.insert_many([self.own(document) for document in documents], *args, **kwargs)
+
+    def replace_one(self, filter, replacement: dict, *args, **kwargs):
+        return self.collection.replace_one(self.scope(filter), self.own(replacement), *args, **kwargs)
+
+    def update_one(self, filter, *args, **kwargs):
+        return self.collection.update_one(self.scope(filter), *args, **kwargs)
+
+    def update_many(self, filter, *args, **kwargs):
+        return self.collection.update_many(self.scope(filter), *args, **kwargs)
+
+    def delete_one(self, filter, *args, **kwargs):
+        return self.collection.delete_one(self.scope(filter), *args, **kwargs)
+
+    def delete_many(self, filter, *args, **kwargs):
+        return self.collection.delete_many(self.scope(filter), *args, **kwargs)
+
+    def find_one_and_delete(self, filter, *args, **kwargs):
+        return self.collection.find_one_and_delete(self.scope(filter), *args, **kwargs)
+
+    def find_one_and_update(self, filter, *args, **kwargs):
+        return self.collection.find_one_and_update(self.scope(filter), *args, **kwargs)
+
+    # Per-user indexes become compound indexes led by ownerId
+    def create_index(self, keys, *args, **kwargs):
+        keys = [(keys, ASCENDING)] if isinstance(keys, str) else list(keys)
+        return self.collection.create_index([("ownerId", ASCENDING), *keys], *args, **kwargs)
+
+
+# Rollout mode: reads come from the per-user collection, and every write is applied
+# to it and then mirrored to the shared collection. Mirroring is best effort; the
+# migration command copies anything the mirror missed.
+class DualCollection:
+    def __init__(self, primary, mirror: ScopedCollection):
+        self.primary = primary
+        self.mirror = mirror
+
+    def __getattr__(self, name):
+        # Reads (find, find_one, aggregate, count_documents, ...) only touch the primary
+        return getattr(self.primary, name)
+
+    def _mirror(self, name: str, *args, **kwargs):
+        try:
+            getattr(self.mirror, name)(*args, **kwargs)
+        except Exception as e:
+            print(f"Failed to mirror {name} to {MONGODB_BOOKS_COLLECTION} for {self.mirror.owner_id}: {e}")
+
+    def insert_one(self, document: dict, *args, **kwargs):
+        result = self.primary.insert_one(document, *args, **kwargs)
+        self._mirror("replace_one", {"_id": document["_id"]}, document, upsert=True)
+        return result
+
+    def insert_many(self, documents: list, *args, **kwargs):
+        result = self.primary.insert_many(documents, *args, **kwargs)
+        for document in documents:
+            self._mirror("replace_one", {"_id": document["_id"]}, document, upsert=True)
+        return result
+
+    def replace_one(self, *args, **kwargs):
+        result = self.primary.replace_one(*args, **kwargs)
+        self._mirror("replace_one", *args, **kwargs)
+        return result
+
+    def update_one(self, *args, **kwargs):
+        result = self.primary.update_one(*args, **kwargs)
+        self._mirror("update_one", *args, **kwargs)
+        return result
+
+    def update_many(self, *args, **kwargs):
+        result = self.primary.update_many(*args, **kwargs)
+        self._mirror("update_many", *args, **kwargs)
+        return result
+
+    def delete_one(self, *args, **kwargs):
+        result = self.primary.delete_one(*args, **kwargs)
+        self._mirror("delete_one", *args, **kwargs)
+        return result
+
+    def delete_many(self, *args, **kwargs):
+        result = self.primary.delete_many(*args, **kwargs)
+        self._mirror("delete_many", *args, **kwargs)
+        return result
+
+    def find_one_and_delete(self, filter, *args, **kwargs):
+        document = self.primary.find_one_and_delete(filter, *args, **kwargs)
+        if document is not None:
+            self._mirror("delete_one", {"_id": document["_id"]} if "_id" in document else filter)
+        return document
+
+    def find_one_and_update(self, filter, update, *args, **kwargs):
+        document = self.primary.find_one_and_update(filter, update, *args, **kwargs)
+        if document is not None:
+            self._mirror("update_one", {"_id": document["_id"]} if "_id" in document else filter, update)
+        return document
+
+    def create_index(self, *args, **kwargs):
+        result = self.primary.create_index(*args, **kwargs)
+        self._mirror("create_index", *args, **kwargs)
+        return result
+
+
+# Order of a library listing (GET /books), most recently updated first
+BOOK_LIST_SORT = [("updated", DESCENDING), ("_id", DESCENDING)]
+# Per-user libraries this process has already indexed
+_indexed_libraries = set()
+
+
+# Index behind the listing of a per-user library. A new library gets it with its first
+# book, once per process; libraries created before the index existed get it from
+# migrations/book_indexes.py. The shared collection has it from ensure_books_indexes.
+def ensure_library_indexes(owner_id: str):
+    if MONGODB_BOOKS_STORAGE == "shared" or owner_id in _indexed_libraries:
+        return
+    get_db()[owner_id].create_index(BOOK_LIST_SORT)
+    _indexed_libraries.add(owner_id)
+
+
+# Delete all of a user's books; returns how many there were. A per-user collection is
+# dropped rather than emptied, so no empty collection (with its indexes) is left behind.
+def drop_library(owner_id: str) -> int:
+    db = get_db()
+    books = 0
+    if MONGODB_BOOKS_STORAGE != "per_user":
+        books = db[MONGODB_BOOKS_COLLECTION].delete_many({"ownerId": owner_id}).deleted_count
+    if MONGODB_BOOKS_STORAGE != "shared":
+        # Per-user collections are authoritative until the switch to shared
+        books = db[owner_id].estimated_document_count()
+        db[owner_id].drop()
+        _indexed_libraries.discard(owner_id)
+    return books
+
+
+# Indexes of the shared books collection. The hashed ownerId index backs the
+# collection's shard key when it is sharded (see migrations/shared_books.py).
+def ensure_books_indexes(force: bool = False):
+    if MONGODB_BOOKS_STORAGE == "per_user" and not force:
+        return
+    books = get_db()[MONGODB_BOOKS_COLLECTION]
+    books.create_index([("ownerId", HASHED)])
+    books.create_index([("ownerId", ASCENDING), ("updated", DESCENDING), ("_id", DESCENDING)])
+
+
+# Async facade over a pymongo collection; every call runs on the I/O executor.
+# find() and aggregate() return lists since iterating a cursor is blocking too.
+class AsyncCollection:
+    def __init__(self, collection):
+        self.collection = collection
+
+    async def find_one(self, *args, **kwargs):
+        return await run_blocking(self.collection.find_one, *args, **kwargs)
+
+    async def find(self, *args, **kwargs) -> list:
+        return await run_blocking(lambda: list(self.collection.find(*args, **kwargs)))
+
+    async def aggregate(self, *args, **kwargs) -> list:
+        return await run_blocking(lambda: list(self.collection.aggregate(*args, **kwargs)))
+
+    async def count_documents(self, *args, **kwargs) -> int:
+        return await run_blocking(self.collection.count_documents, *args, **kwargs)
+
+    async def insert_one(self, *args, **kwargs):
+        return await run_blocking(self.collection.insert_one, *args, **kwargs)
+
+    async def insert_many(self, *args, **kwargs):
+        return await run_blocking(self.collection.insert_many, *args, **kwargs)
+
+    async def update_one(self, *args, **kwargs):
+        return await run_blocking(self.collection.update_one, *args, **kwargs)
+
+    async def update_many(self, *args, **kwargs):
+        return await run_blocking(self.collection.update_many, *args, **kwargs)
+
+    async def delete_one(self, *args, **kwargs):
+        return await run_blocking(self.collection.delete_one, *args, **kwargs)
+
+    async def delete_many(self, *args, **kwargs):
+        return await run_blocking(self.collection.delete_many, *args, **kwargs)
+
+    async def find_one_and_delete(self, *args, **kwargs):
+        return await run_blocking(self.collection.find_one_and_delete, *args, **kwargs)
+
+    async def find_one_and_update(self, *args, **kwargs):
+        return await run_blocking(self.collection.find_one_and_update, *args, **kwargs)
+
+    async def create_index(self, *args, **kwargs):
+        return await run_blocking(self.collection.create_index, *args, **kwargs)
+
+    async def bulk_write(self, *args, **kwargs):
+        return await run_blocking(self.collection.bulk_write, *args, **kwargs)
+
+
+def get_async_collection(ownerId: str) -> AsyncCollection:
+    return AsyncCollection(get_mongodb_collection(ownerId))
+
+
+# Highlights of every user live in one collection, one document per highlight:
+# { _id: <owner id>:<book id>:<highlight id>, id, ownerId, bookId, text, location, locationKey, imgUrl, imgVariants, created }
+def get_highlights_collection() -> AsyncCollection:
+    return AsyncCollection(get_db()[MONGODB_HIGHLIGHTS_COLLECTION])
+
+
+# Filter matching one highlight, or every highlight of a book
+def highlight_filter(owner_id: str, book_id: str, highlight_id: str | None = None) -> dict:
+    query = {"ownerId": owner_id, "bookId": book_id}
+    if highlight_id is not None:
+        query["id"] = highlight_id
+    return query
+
+
+# _id of a highlight document. Highlight ids are only unique within a book (and bulk imports
+# choose their own), so the _id is scoped to the owner and book. Highlights saved before
+# have their bare id as _id; they are still found by highlight_filter, never by _id.
+def highlight_document_id(owner_id: str, book_id: str, highlight_id: str) -> str:
+    return f"{owner_id}:{book_id}:{highlight_id}"
+
+
+def ensure_highlight_indexes():
+    highlights = get_db()[MONGODB_HIGHLIGHTS_COLLECTION]
+    highlights.create_index([("ownerId", ASCENDING), ("bookId", ASCENDING), ("id", ASCENDING)], unique=True)
+    highlights.create_index([("ownerId", ASCENDING), ("bookId", ASCENDING), ("locationKey", ASCENDING), ("_id", ASCENDING)])
@@ -1,24 +1,29 @@
 # src/database/s3_by.py
 
 from io import BytesIO
+from typing import BinaryIO, Awaitable, Callable
+import asyncio
 import os
-import boto3
 from boto3.s3.transfer import S3UploadFailedError
-from botocore.exceptions import ClientError, NoCredentialsError
+from botocore.exceptions import BotoCoreError, ClientError, NoCredentialsError
 from dotenv import load_dotenv
 
+from .executor import run_blocking
+from ..utils.aws import get_client
+
 load_dotenv()
 S3_BUCKET_NAME = os.getenv("S3_BUCKET_NAME")
-
-# Initializing the S3 client
-s3_client = boto3.client('s3')
+# Size of each multipart upload part; S3 requires at least 5 MB for all but the last part
+UPLOAD_PART_SIZE = max(5, int(os.getenv("UPLOAD_PART_SIZE_MB", "8"))) * 1024 * 1024
+# delete_objects batches (of up to 1000 keys) in flight at once while deleting a prefix
+S3_DELETE_CONCURRENCY = int(os.getenv("S3_DELETE_CONCURRENCY", "8"))
 
 # Upload function for S3
 def write_file_data(key: str, file_type: str, data: BytesIO):
 
     # Uploading the data to the S3 bucket
     try:
-        s3_client.put_object(Bucket=S3_BUCKET_NAME, Key=key, ContentType=file_type, Body=data)
+        get_client('s3').put_object(Bucket=S3_BUCKET_NAME, Key=key, ContentType=file_type, Body=data)
         print(f"Data has been uploaded to the S3 bucket")
         return True
     except NoCredentialsError:
@@ -31,10 +36,50 @@ def write_file_data(key: str, file_type: str, data: BytesIO):
         print(f"Unexpected error occurred: {e}")
         return False
 
+# Stream a file object to S3 one part at a time, so memory use is bounded by part_size.
+# Files smaller than one part are sent with a single put_object.
+def write_file_stream(key: str, file_type: str, file: BinaryIO, part_size: int = UPLOAD_PART_SIZE, max_size: int | None = None):
+    file.seek(0)
+    chunk = file.read(part_size)
+    if len(chunk) < part_size:
+        return write_file_data(key, file_type, chunk)
+
+    upload_id = None
+    completed = False
+    try:
+        upload_id = get_client('s3').create_multipart_upload(Bucket=S3_BUCKET_NAME, Key=key, ContentType=file_type)["UploadId"]
+        parts = []
+        uploaded = 0
+        while chunk:
+            uploaded += len(chunk)
+            if max_size is not None and uploaded > max_size:
+                raise ValueError(f"File exceeds the maximum size of {max_size} bytes")
+
+            part_number = len(parts) + 1
+            response = get_client('s3').upload_part(Bucket=S3_BUCKET_NAME, Key=key, PartNumber=part_number, UploadId=upload_id, Body=chunk)
+            parts.append({"ETag": response["ETag"], "PartNumber": part_number})
+            chunk = file.read(part_size)
+
+        get_client('s3').complete_multipart_upload(Bucket=S3_BUCKET_NAME, Key=key, UploadId=upload_id, MultipartUpload={"Parts": parts})
+        completed = True
+        print(f"Data has been uploaded to the S3 bucket in {len(parts)} parts")
+        return True
+    except (BotoCoreError, ClientError, ValueError) as e:
+        print(f"Multipart upload of {key} failed: {e}")
+        return False
+    finally:
+        # Whatever stopped it (including errors raised on to the caller), an unfinished
+        # upload is aborted: S3 keeps, and bills for, the parts of one until then
+        if upload_id and not completed:
+            try:
+                get_client('s3').abort_multipart_upload(Bucket=S3_BUCKET_NAME, Key=key, UploadId=upload_id)
+            except (BotoCoreError, ClientError) as abort_error:
+                print(f"Failed to abort multipart upload of {key}: {abort_error}")
+
 def read_file_data(key: str):
     try: 
         # Download the file from S3 into memory
-        response = s3_client.get_object(Bucket=S3_BUCKET_NAME, Key=key)
+        response = get_client('s3').get_object(Bucket=S3_BUCKET_NAME, Key=key)
         file_data = response['Body'].read()
         return file_data
     except NoCredentialsError:
@@ -47,7 +92,7 @@ def read_file_data(key: str):
 def delete_file_data(key: str):
     try:
         # Deleting the file from S3
-        response = s3_client.delete_object(Bucket=S3_BUCKET_NAME, Key=key)
+        response = get_client('s3').delete_object(Bucket=S3_BUCKET_NAME, Key=key)
         
         # Check if the response indicates a successful deletion
         return response.get('ResponseMetadata', {}).get('HTTPStatusCode') == 204
@@ -56,23 +101,74 @@ def delete_file_data(key: str):
         print(f"Failed to delete file {key}: {e}")
         return False
 
-def delete_folder(folder_name: str):
+def delete_files(keys: list):
     try:
-        # List all objects in the "folder"
-        objects = s3_client.list_objects_v2(Bucket=S3_BUCKET_NAME, Prefix=folder_name)
-        
-        # Check if the folder contains any objects
-        if 'Contents' in objects:
-            # Create a list of objects to delete
-            delete_keys = [{'Key': obj['Key']} for obj in objects['Contents']]
-            
-            # Delete all objects in the folder
-            s3_client.delete_objects(Bucket=S3_BUCKET_NAME, Delete={'Objects': delete_keys})
-            print(f"Deleted folder: {folder_name}")
-            return True
-        else:
-            print(f"No objects found in folder: {folder_name}")
-            return False
+        # Delete up to 1000 objects in a single request
+        get_client('s3').delete_objects(Bucket=S3_BUCKET_NAME, Delete={'Objects': [{'Key': key} for key in keys], 'Quiet': True})
+        return True
     except ClientError as e:
-        print(f"An error occurred: {e}")
+        print(f"Failed to delete files {keys}: {e}")
         return False
+
+# Delete one batch of up to 1000 keys; returns the keys S3 failed to delete
+def delete_batch(keys: list) -> list:
+    response = get_client('s3').delete_objects(Bucket=S3_BUCKET_NAME, Delete={'Objects': [{'Key': key} for key in keys], 'Quiet': True})
+    errors = response.get('Errors', [])
+    for error in errors:
+        print(f"Failed to delete {error.get('Key')}: {error.get('Code')} {error.get('Message')}")
+    return [error.get('Key') for error in errors]
+
+# Async versions of the helpers above for use from routes and models
+async def write_file_data_async(key: str, file_type: str, data: BytesIO):
+    return await run_blocking(write_file_data, key, file_type, data)
+
+async def write_file_stream_async(key: str, file_type: str, file: BinaryIO, max_size: int | None = None):
+    return await run_blocking(write_file_stream, key, file_type, file, max_size=max_size)
+
+async def read_file_data_async(key: str):
+    return await run_blocking(read_file_data, key)
+
+async def delete_file_data_async(key: str):
+    return await run_blocking(delete_file_data, key)
+
+async def delete_files_async(keys: list):
+    return await run_blocking(delete_files, keys)
+
+
+# Delete everything under a prefix. Listing continues page by page while up to
+# S3_DELETE_CONCURRENCY delete batches run, and on_progress is awaited with the
+# running totals ({"listed", "deleted", "failed"}) after each batch.
+async def delete_prefix_async(prefix: str, on_progress: Callable[[dict], Awaitable] | None = None) -> dict:
+    progress = {"listed": 0, "deleted": 0, "failed": 0}
+    slots = asyncio.Semaphore(S3_DELETE_CONCURRENCY)
+    batches = set()
+
+    async def delete(keys: list):
+        try:
+            failed = len(await run_blocking(delete_batch, keys))
+        except ClientError as e:
+            print(f"Failed to delete a batch under {prefix}: {e}")
+            failed = len(keys)
+        finally:
+            slots.release()
+        progress["deleted"] += len(keys) - failed
+        progress["failed"] += failed
+        if on_progress:
+            await on_progress(dict(progress))
+
+    pages = iter(get_client('s3').get_paginator('list_objects_v2').paginate(Bucket=S3_BUCKET_NAME, Prefix=prefix))
+    try:
+        while (page := await run_blocking(next, pages, None)) is not None:
+            keys = [obj['Key'] for obj in page.get('Contents', [])]
+            if not keys:
+                continue
+            progress["listed"] += len(keys)
+            await slots.acquire()
+            batch = asyncio.create_task(delete(keys))
+            batches.add(batch)
+            batch.add_done_callback(batches.discard)
+    finally:
+        await asyncio.gather(*batches)
+
+    print(f"Deleted {progress['deleted']} objects under {prefix} ({progress['failed']} failed)")
+    return progress
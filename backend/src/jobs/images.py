@@ -0,0 +1,98 @@
+# src/jobs/images.py
+import os
+from dotenv import load_dotenv
+
+from pymongo import ReturnDocument
+
+from .queue import JobQueue, PermanentJobError
+from ..database.executor import run_blocking
+from ..database.mongodb import get_highlights_collection, highlight_filter
+from ..database.s3_db import delete_files_async
+from ..utils.image_variants import variant_keys
+from ..utils.text2image import overwrite_image, highlight_image_key, current_image_key, image_url, variant_urls, GENERATION_PROFILES
+
+load_dotenv()
+# Concurrent generations per server process; the Space itself queues anything beyond its GPU capacity
+IMAGE_JOB_WORKERS = int(os.getenv("IMAGE_JOB_WORKERS", "2"))
+# How long routes called with ?wait=true wait for the image before answering 202 with the job id
+IMAGE_JOB_WAIT_TIMEOUT = float(os.getenv("IMAGE_JOB_WAIT_TIMEOUT", "20"))
+# Profile of new images: "draft" renders a quick draft first and queues the final render
+# as an upgrade; "final" goes straight to the final render
+IMAGE_DEFAULT_PROFILE = os.getenv("IMAGE_DEFAULT_PROFILE", "draft")
+
+image_jobs = JobQueue("images", workers=IMAGE_JOB_WORKERS)
+
+
+# Generate (or regenerate) a highlight image, upload it to S3 and save its URL on the highlight.
+# Every job renders to its own key and then switches the highlight to it in one update,
+# deleting the image it replaced. A draft records its job id on the highlight (imgDraftJob)
+# and queues the upgrade, which only switches the image if no newer generation has started
+# since; otherwise it deletes its own render.
+@image_jobs.register("highlight_image")
+async def run_highlight_image_job(job: dict) -> dict:
+    owner_id = job["ownerId"]
+    book_id = job["payload"]["bookId"]
+    highlight_id = job["payload"]["highlightId"]
+    prompt = job["payload"]["prompt"]
+    use_cache = job["payload"].get("useCache", True)
+    profile = job["payload"].get("profile", "final")
+    upgrades = job["payload"].get("upgrades")
+
+    highlights = get_highlights_collection()
+    query = highlight_filter(owner_id, book_id, highlight_id)
+    if upgrades:
+        # Only upgrade the draft this job was queued for
+        query = {**query, "imgDraftJob": upgrades}
+        if not await highlights.find_one(query, {"_id": 1}):
+            return {"skipped": "The draft was replaced or removed before its upgrade ran", "highlightId": highlight_id, "bookId": book_id}
+    elif not await highlights.find_one_and_update(query, {"$unset": {"imgDraftJob": ""}}, {"_id": 1}):
+        # Starting a new generation also cancels the upgrade of an earlier draft
+        raise PermanentJobError("Highlight not found")
+
+    # An upgrade checks again after the (slow) final render, so a stale one isn't uploaded at all
+    s3_key = highlight_image_key(owner_id, book_id, highlight_id, job["_id"])
+    still_wanted = (lambda: highlights.collection.find_one(query, {"_id": 1}) is not None) if upgrades else None
+    rendered = await run_blocking(overwrite_image, prompt, s3_key, use_cache, profile, still_wanted)
+    if rendered is None:
+        return {"skipped": "The draft was replaced or removed before its upgrade finished", "highlightId": highlight_id, "bookId": book_id}
+    variants = variant_urls(s3_key, rendered)
+    img_url = image_url(s3_key)
+
+    image = {"imgUrl": img_url, "imgVariants": variants, "imgProfile": profile}
+    if profile == "draft":
+        image["imgDraftJob"] = job["_id"]
+    update = {"$set": {**image, "imgKey": s3_key}}
+    if profile != "draft":
+        update["$unset"] = {"imgDraftJob": ""}
+    previous = await highlights.find_one_and_update(
+        query, update, {"imgKey": 1, "imgUrl": 1, "imgVariants": 1}, return_document=ReturnDocument.BEFORE
+    )
+    if previous is None:
+        # Replaced, or the highlight was deleted, while rendering: this render is nobody's image
+        await delete_files_async([s3_key, *variant_keys(s3_key, rendered)])
+        if upgrades:
+            return {"skipped": "The draft was replaced or removed before its upgrade finished", "highlightId": highlight_id, "bookId": book_id}
+        raise PermanentJobError("Highlight not found")
+    if previous.get("imgUrl"):
+        previous_key = current_image_key(owner_id, book_id, highlight_id, previous)
+        if previous_key != s3_key:
+            await delete_files_async([previous_key, *variant_keys(previous_key, previous.get("imgVariants"))])
+
+    upgrade = None
+    if profile == "draft":
+        # A fixed id, so a retried draft job doesn't queue a second upgrade
+        upgrade = await image_jobs.enqueue("highlight_image", owner_id, {
+            "bookId": book_id, "highlightId": highlight_id, "prompt": prompt,
+            "useCache": use_cache, "profile": "final", "upgrades": job["_id"],
+        }, job_id=f"{job['_id']}-final")
+    return {**image, "highlightId": highlight_id, "bookId": book_id, "upgradeJobId": upgrade and upgrade["id"]}
+
+
+# use_cache=False forces a fresh render, e.g. when the reader explicitly asks to regenerate.
+# profile defaults to IMAGE_DEFAULT_PROFILE.
+async def enqueue_highlight_image(owner_id: str, book_id: str, highlight_id: str, prompt: str, use_cache: bool = True, profile: str | None = None) -> dict:
+    profile = profile or IMAGE_DEFAULT_PROFILE
+    if profile not in GENERATION_PROFILES:
+        raise ValueError(f"Unknown image profile: {profile}")
+    payload = {"bookId": book_id, "highlightId": highlight_id, "prompt": prompt, "useCache": use_cache, "profile": profile}
+    return await image_jobs.enqueue("highlight_image", owner_id, payload)
@@ -0,0 +1,104 @@
+# src/jobs/maintenance.py
+import os
+from dotenv import load_dotenv
+
+from .queue import JobQueue
+from .store import job_store
+from ..database.executor import run_blocking
+from ..database.mongodb import get_async_collection, get_highlights_collection, highlight_filter, drop_library
+from ..database.s3_db import delete_prefix_async
+from ..utils.aws import get_async_client
+from ..utils.book_cache import book_cache, open_book_file
+from ..utils import search
+
+load_dotenv()
+COGNITO_REGION = os.getenv("COGNITO_REGION")
+COGNITO_USERPOOL_ID = os.getenv("COGNITO_USERPOOL_ID")
+# Deletions are mostly waiting on S3, a couple of them at a time is plenty
+MAINTENANCE_JOB_WORKERS = int(os.getenv("MAINTENANCE_JOB_WORKERS", "2"))
+
+cognito_client = get_async_client('cognito-idp', region_name=COGNITO_REGION)
+
+maintenance_jobs = JobQueue("maintenance", workers=MAINTENANCE_JOB_WORKERS)
+
+
+# Record deletion progress on the job so GET /job/{id} can report it
+def progress_recorder(job_id: str, step: str):
+    async def record(progress: dict):
+        await job_store.update(job_id, {"progress": {"step": step, **progress}})
+    return record
+
+
+# Remove a book's highlights and every S3 object under its prefix (file, images, chapters).
+# The book document itself is deleted by the route before the job is queued.
+@maintenance_jobs.register("delete_book")
+async def run_delete_book_job(job: dict) -> dict:
+    owner_id = job["ownerId"]
+    book_id = job["payload"]["bookId"]
+
+    highlights = await get_highlights_collection().delete_many(highlight_filter(owner_id, book_id))
+    await search.unindex_book(owner_id, book_id)
+    await run_blocking(book_cache.discard_prefix, f"{owner_id}/{book_id}/")
+    objects = await delete_prefix_async(f"{owner_id}/{book_id}/", progress_recorder(job["_id"], "s3"))
+    if objects["failed"]:
+        raise RuntimeError(f"{objects['failed']} objects could not be deleted")
+
+    return {"bookId": book_id, "highlights": highlights.deleted_count, "objects": objects["deleted"]}
+
+
+# Delete all of a user's data: S3 objects, books and highlights, then the Cognito account.
+# Every step is idempotent, so a retried job picks up where the failed attempt stopped.
+@maintenance_jobs.register("purge_user")
+async def run_purge_user_job(job: dict) -> dict:
+    owner_id = job["ownerId"]
+
+    await run_blocking(book_cache.discard_prefix, f"{owner_id}/")
+    objects = await delete_prefix_async(f"{owner_id}/", progress_recorder(job["_id"], "s3"))
+    if objects["failed"]:
+        raise RuntimeError(f"{objects['failed']} objects could not be deleted")
+
+    await job_store.update(job["_id"], {"progress": {"step": "mongodb", **objects}})
+    books = await run_blocking(drop_library, owner_id)
+    highlights = await get_highlights_collection().delete_many({"ownerId": owner_id})
+    await search.unindex_owner(owner_id)
+
+    await job_store.update(job["_id"], {"progress": {"step": "cognito", **objects}})
+    try:
+        await cognito_client.admin_delete_user(
+            UserPoolId=COGNITO_USERPOOL_ID,
+            Username=job["payload"]["username"]
+        )
+    except cognito_client.exceptions.UserNotFoundException:
+        # Already deleted by an earlier attempt
+        pass
+
+    return {"objects": objects["deleted"], "books": books, "highlights": highlights.deleted_count}
+
+
+# Add the text of a newly uploaded book to the search index, so the upload request doesn't
+# wait for text extraction. EPUBs are read from the chapters stored at upload; other books
+# (PDFs, or EPUBs that couldn't be split) from the book file.
+@maintenance_jobs.register("index_book")
+async def run_index_book_job(job: dict) -> dict:
+    owner_id = job["ownerId"]
+    book_id = job["payload"]["bookId"]
+
+    book = await get_async_collection(owner_id).find_one({"_id": book_id}, {"spine": 1})
+    if book is None:
+        return {"bookId": book_id, "skipped": "The book was deleted before it was indexed"}
+
+    if book.get("spine"):
+        chapters = search.stored_chapters(owner_id, book_id, book["spine"])
+        passages = await run_blocking(search.index_book, owner_id, book_id, chapters)
+    else:
+        _entry, file = await open_book_file(f"{owner_id}/{book_id}/book.epub")
+        try:
+            chapters = search.book_chapters(file, job["payload"]["type"])
+            passages = await run_blocking(search.index_book, owner_id, book_id, chapters)
+        finally:
+            file.close()
+
+    # The book may have been deleted while it was being indexed
+    if not await get_async_collection(owner_id).find_one({"_id": book_id}, {"_id": 1}):
+        await search.unindex_book(owner_id, book_id)
+    return {"bookId": book_id, "passages": passages}
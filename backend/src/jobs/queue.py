@@ -0,0 +1,180 @@
+# src/jobs/queue.py
+import asyncio
+import os
+import time
+import uuid
+from dotenv import load_dotenv
+
+from .store import job_store, new_job, public_job
+from ..utils.metrics import job_queue_depth, jobs_running, job_duration
+from ..utils import tracing
+
+load_dotenv()
+JOB_MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", "3"))
+JOB_RETRY_DELAY = float(os.getenv("JOB_RETRY_DELAY", "5"))
+# A running job whose lease has expired is assumed to belong to a dead worker and is picked up again
+JOB_LEASE_SECONDS = int(os.getenv("JOB_LEASE_SECONDS", "600"))
+# When a worker process stops (deploys, max-requests recycling), running jobs get this
+# long to finish. Jobs still running after that are put back in the queue for resume().
+JOB_SHUTDOWN_TIMEOUT = float(os.getenv("JOB_SHUTDOWN_TIMEOUT", "60"))
+
+
+# Raised by job handlers for failures that retrying can't fix (e.g. the highlight was deleted)
+class PermanentJobError(Exception):
+    pass
+
+
+# Bounded pool of asyncio workers pulling job ids from an in-memory queue.
+# Job state lives in the job store, so jobs that were queued or running when the
+# process stopped are picked up again by resume(). Failed attempts are retried
+# with exponential backoff until the job's maxAttempts is reached.
+class JobQueue:
+    def __init__(self, name: str, workers: int, max_attempts: int = JOB_MAX_ATTEMPTS):
+        self.name = name
+        self.workers = workers
+        self.max_attempts = max_attempts
+        self.handlers = {}
+        self._queue: asyncio.Queue | None = None
+        self._tasks: list = []
+        self._busy: set = set()
+        self._stopping = False
+        self._finished: dict = {}
+        job_queue_depth.labels(name).set(0)
+
+    # Decorator registering the coroutine that runs jobs of the given type
+    def register(self, job_type: str):
+        def decorator(handler):
+            self.handlers[job_type] = handler
+            return handler
+        return decorator
+
+    # Start the workers. This does no I/O, so jobs can be queued as soon as the app starts;
+    # jobs left over from an earlier run are queued by resume() once the store is reachable.
+    async def start(self):
+        self._queue = asyncio.Queue()
+        self._stopping = False
+        self._tasks = [asyncio.create_task(self._worker(), name=f"{self.name}-worker-{i}") for i in range(self.workers)]
+
+    async def resume(self):
+        resumed = await job_store.list_resumable(self.name)
+        for job in resumed:
+            self._put(job["_id"])
+        if resumed:
+            print(f"Resuming {len(resumed)} unfinished {self.name} jobs")
+
+    # Stop taking jobs and give the running ones up to timeout seconds before cancelling them
+    async def stop(self, timeout: float = 0):
+        self._stopping = True
+        for task in self._tasks:
+            if task not in self._busy:
+                task.cancel()
+        busy = [task for task in self._tasks if task in self._busy]
+        if busy and timeout > 0:
+            print(f"Waiting up to {timeout:.0f}s for {len(busy)} running {self.name} jobs")
+            await asyncio.wait(busy, timeout=timeout)
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    # job_id makes enqueueing idempotent: if a job with that id exists it is returned instead
+    async def enqueue(self, job_type: str, owner_id: str, payload: dict, job_id: str | None = None) -> dict:
+        if job_type not in self.handlers:
+            raise ValueError(f"No handler registered for {self.name} job type: {job_type}")
+        if job_id:
+            existing = await job_store.get(job_id)
+            if existing:
+                return public_job(existing)
+
+        job = new_job(job_id or str(uuid.uuid4()), self.name, job_type, owner_id, payload, self.max_attempts)
+        # Jobs queued by a traced request are traced as part of it
+        traceparent = tracing.current_traceparent()
+        if traceparent:
+            job["trace"] = traceparent
+        await job_store.create(job)
+        self._put(job["_id"])
+        return public_job(job)
+
+    # Wait until the job is done or failed; returns None if it is still pending after the timeout
+    async def wait(self, job_id: str, timeout: float) -> dict | None:
+        event = self._finished.setdefault(job_id, asyncio.Event())
+        job = await job_store.get(job_id)
+        if job and job["status"] in ("done", "failed"):
+            self._finished.pop(job_id, None)
+            return public_job(job)
+
+        try:
+            await asyncio.wait_for(event.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+        finally:
+            self._finished.pop(job_id, None)
+
+        job = await job_store.get(job_id)
+        if job and job["status"] in ("done", "failed"):
+            return public_job(job)
+        return None
+
+    def depth(self) -> int:
+        return self._queue.qsize() if self._queue else 0
+
+    def _put(self, job_id: str):
+        self._queue.put_nowait(job_id)
+        job_queue_depth.labels(self.name).set(self.depth())
+
+    async def _worker(self):
+        task = asyncio.current_task()
+        while not self._stopping:
+            job_id = await self._queue.get()
+            job_queue_depth.labels(self.name).set(self.depth())
+            self._busy.add(task)
+            try:
+                await self._run(job_id)
+            except Exception as e:
+                print(f"Unexpected error running {self.name} job {job_id}: {e}")
+            finally:
+                self._busy.discard(task)
+                self._queue.task_done()
+
+    async def _run(self, job_id: str):
+        # Claiming is atomic, so a job resumed by several processes only runs once
+        job = await job_store.claim(job_id, JOB_LEASE_SECONDS)
+        if job is None:
+            return
+
+        if job.get("trace") and tracing.TRACING_ENABLED:
+            with tracing.root_span(f"job {self.name}.{job['type']}", job["trace"], "consumer", **{"job.id": job_id, "job.attempt": job["attempts"]}):
+                await self._attempt(job)
+        else:
+            await self._attempt(job)
+
+    async def _attempt(self, job: dict):
+        job_id = job["_id"]
+
+        start = time.perf_counter()
+        jobs_running.labels(self.name).inc()
+        try:
+            result = await self.handlers[job["type"]](job)
+        except Exception as e:
+            job_duration.labels(self.name, job["type"], "error").observe(time.perf_counter() - start)
+            retry = not isinstance(e, PermanentJobError) and job["attempts"] < job["maxAttempts"]
+            print(f"{self.name} job {job_id} attempt {job['attempts']} failed: {e}")
+            if retry:
+                await job_store.update(job_id, {"status": "queued", "error": str(e), "leaseUntil": None})
+                delay = JOB_RETRY_DELAY * 2 ** (job["attempts"] - 1)
+                asyncio.get_running_loop().call_later(delay, self._put, job_id)
+                return
+            await job_store.update(job_id, {"status": "failed", "error": str(e), "leaseUntil": None})
+        except asyncio.CancelledError:
+            # Stopped during shutdown: release the lease so the job is resumed right away
+            await job_store.update(job_id, {"status": "queued", "leaseUntil": None})
+            raise
+        else:
+            job_duration.labels(self.name, job["type"], "ok").observe(time.perf_counter() - start)
+            await job_store.update(job_id, {"status": "done", "result": result, "error": None, "leaseUntil": None})
+        finally:
+            jobs_running.labels(self.name).dec()
+
+        event = self._finished.get(job_id)
+        if event:
+            event.set()
@@ -0,0 +1,127 @@
+# src/jobs/store.py
+import os
+import time
+from datetime import datetime
+from dotenv import load_dotenv
+from pymongo import ReturnDocument
+
+from ..database.mongodb import get_db, AsyncCollection
+
+load_dotenv()
+# "mongodb" keeps job state in MONGODB_JOBS_COLLECTION so it survives restarts,
+# "memory" keeps it in-process (local development, benchmarks)
+JOB_STORE = os.getenv("JOB_STORE", "mongodb")
+MONGODB_JOBS_COLLECTION = os.getenv("MONGODB_JOBS_COLLECTION", "jobs")
+
+# Fields that are only meaningful to the queue and never returned to clients
+PRIVATE_JOB_FIELDS = ("_id", "queue", "payload", "leaseUntil")
+
+
+def new_job(job_id: str, queue: str, job_type: str, owner_id: str, payload: dict, max_attempts: int) -> dict:
+    now = datetime.now().isoformat()
+    return {
+        "_id": job_id,
+        "queue": queue,
+        "type": job_type,
+        "status": "queued",
+        "ownerId": owner_id,
+        "payload": payload,
+        "attempts": 0,
+        "maxAttempts": max_attempts,
+        "result": None,
+        "error": None,
+        "leaseUntil": None,
+        "created": now,
+        "updated": now,
+    }
+
+
+# Shape a stored job for API responses
+def public_job(job: dict) -> dict:
+    data = {key: value for key, value in job.items() if key not in PRIVATE_JOB_FIELDS}
+    data["id"] = job["_id"]
+    return data
+
+
+class MemoryJobStore:
+    def __init__(self):
+        self.jobs: dict = {}
+
+    async def create(self, job: dict):
+        self.jobs[job["_id"]] = dict(job)
+
+    async def get(self, job_id: str) -> dict | None:
+        job = self.jobs.get(job_id)
+        return dict(job) if job else None
+
+    async def update(self, job_id: str, fields: dict):
+        if job_id in self.jobs:
+            self.jobs[job_id].update(fields, updated=datetime.now().isoformat())
+
+    # Atomically move a queued (or lease-expired running) job to running
+    async def claim(self, job_id: str, lease_seconds: int) -> dict | None:
+        job = self.jobs.get(job_id)
+        if not job or not _claimable(job):
+            return None
+        job.update(status="running", attempts=job["attempts"] + 1, leaseUntil=time.time() + lease_seconds,
+                   updated=datetime.now().isoformat())
+        return dict(job)
+
+    async def list_resumable(self, queue: str) -> list:
+        return [dict(job) for job in self.jobs.values() if job["queue"] == queue and _claimable(job)]
+
+
+class MongoJobStore:
+    def __init__(self, collection_name: str):
+        self.collection_name = collection_name
+
+    # Looked up on use, since the Mongo client is only created when first needed
+    @property
+    def collection(self) -> AsyncCollection:
+        return AsyncCollection(get_db()[self.collection_name])
+
+    async def create(self, job: dict):
+        await self.collection.insert_one(job)
+
+    async def get(self, job_id: str) -> dict | None:
+        return await self.collection.find_one({"_id": job_id})
+
+    async def update(self, job_id: str, fields: dict):
+        await self.collection.update_one({"_id": job_id}, {"$set": {**fields, "updated": datetime.now().isoformat()}})
+
+    async def claim(self, job_id: str, lease_seconds: int) -> dict | None:
+        return await self.collection.find_one_and_update(
+            {"_id": job_id, "$or": [
+                {"status": "queued"},
+                {"status": "running", "leaseUntil": {"$lt": time.time()}},
+            ]},
+            {
+                "$set": {"status": "running", "leaseUntil": time.time() + lease_seconds, "updated": datetime.now().isoformat()},
+                "$inc": {"attempts": 1},
+            },
+            return_document=ReturnDocument.AFTER,
+        )
+
+    async def list_resumable(self, queue: str) -> list:
+        return await self.collection.find({"queue": queue, "$or": [
+            {"status": "queued"},
+            {"status": "running", "leaseUntil": {"$lt": time.time()}},
+        ]})
+
+    async def ensure_indexes(self):
+        await self.collection.create_index([("queue", 1), ("status", 1)])
+
+
+def _claimable(job: dict) -> bool:
+    if job["status"] == "queued":
+        return True
+    return job["status"] == "running" and (job["leaseUntil"] or 0) < time.time()
+
+
+def create_job_store():
+    if JOB_STORE == "memory":
+        return MemoryJobStore()
+    return MongoJobStore(MONGODB_JOBS_COLLECTION)
+
+
+job_store = create_job_store()
@@ -1,17 +1,22 @@
 from fastapi import HTTPException
-from io import BytesIO
+from contextlib import contextmanager
+from typing import BinaryIO
 import hashlib
+import mmap
 import uuid
 import os
 import pymupdf
 from datetime import datetime
 from dotenv import load_dotenv
 
-from ..database.mongodb import db
-from ..database.s3_db import write_file_data
+from ..database.executor import run_blocking
+from ..database.mongodb import get_async_collection, ensure_library_indexes, BOOK_LIST_SORT
+from ..database.s3_db import write_file_stream_async
+from ..utils.epub import EpubError, read_metadata
 
 load_dotenv()
 BUCKET_NAME = os.getenv("AWS_BUCKET_NAME")
+EPUB_TYPES = ("application/epub", "application/epub+zip")
 
 # Book class definition
 class Book:
@@ -25,23 +30,26 @@ class Book:
         self.title = title
         self.author = author
         self.imgUrl = None
+        # Reading order and TOC of an EPUB whose chapters are stored separately (see utils/chapters.py)
+        self.spine = None
 
-    def setBookContent(self, book_file: BytesIO):
+    async def setBookContent(self, book_file: BinaryIO, max_size: int | None = None):
         # Define the S3 key (where the book will be stored in the bucket)
         s3_key = f"{self.ownerId}/{self.id}/book.epub"
-        success = write_file_data(s3_key, self.type, book_file)
+        success = await write_file_stream_async(s3_key, self.type, book_file, max_size)
         if not success:
             raise HTTPException(status_code=500, detail="Failed to upload file to S3")
         else:
             print(f"Successfully uploaded book with id: {self.id} to S3")
 
-    def save(self):
+    async def save(self):
         # Save the book metadata to MongoDB
         self.updated = datetime.now().isoformat()
-        collection = db[self.ownerId]
+        collection = get_async_collection(self.ownerId)
         book_metadata = self.get_metadata()
         book_metadata["_id"] = book_metadata.pop("id", "not found")
-        collection.insert_one(book_metadata)
+        await collection.insert_one(book_metadata)
+        await run_blocking(ensure_library_indexes, self.ownerId)
         print(f"Book metadata saved to MongoDB with ID: {self.id}")
 
     def get_metadata(self):
@@ -56,13 +64,43 @@ class Book:
             "author": self.author,
             "imgUrl": self.imgUrl
         }
+        if self.spine:
+            metadata["spine"] = self.spine
         return metadata
 
 # Helper function to hash email
 def hash_email(email: str) -> str:
     return hashlib.sha256(email.encode()).hexdigest()
 
-# Helper function to extract metadata from book
-def extract_metadata(file: BytesIO, type: str):
-    doc = pymupdf.open(stream=file, filetype=type)
-    return doc.metadata
+# Zero-copy view of a seekable file: the buffer of an in-memory file,
+# or a read-only memory map of a file on disk (e.g. a spooled upload)
+@contextmanager
+def file_view(file: BinaryIO):
+    if hasattr(file, "getbuffer"):
+        with file.getbuffer() as view:
+            yield view
+        return
+
+    file.flush()
+    with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+        with memoryview(mapped) as view:
+            yield view
+
+# Helper function to extract metadata from book.
+# EPUBs are read straight from their OPF package document; PDFs and EPUBs
+# that can't be read that way are opened with pymupdf.
+def extract_metadata(file: BinaryIO, type: str):
+    if type in EPUB_TYPES:
+        try:
+            metadata = read_metadata(file)
+            # Same keys and empty-string convention as pymupdf's metadata
+            return {"title": metadata["title"] or "", "author": ", ".join(metadata["authors"])}
+        except EpubError as e:
+            print(f"Falling back to pymupdf for EPUB metadata: {e}")
+
+    with file_view(file) as view:
+        doc = pymupdf.open(stream=view, filetype=type)
+        try:
+            return doc.metadata
+        finally:
+            doc.close()
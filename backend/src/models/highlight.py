@@ -1,100 +1,182 @@
 from pydantic import BaseModel, Field
 import uuid
-from typing import Optional, Dict
+from datetime import datetime
+from typing import Optional, Dict, List
 from fastapi import HTTPException
-
-from ..utils.text2image import generate_image
-from ..database.mongodb import get_mongodb_collection
-from ..database.s3_db import delete_file_data
+from pymongo import ASCENDING
+from pymongo.errors import BulkWriteError, DuplicateKeyError
+
+from ..jobs.images import enqueue_highlight_image
+from ..database.mongodb import get_async_collection, get_highlights_collection, highlight_document_id, highlight_filter
+from ..database.s3_db import delete_files_async
+from ..utils.image_variants import variant_keys
+from ..utils.locations import location_key
+from ..utils.pagination import find_page
+from ..utils import search
+from ..utils.text2image import current_image_key
+
+# Fields of a highlight document that are not part of the API response
+HIGHLIGHT_PROJECTION = {"_id": 0, "ownerId": 0, "bookId": 0, "locationKey": 0, "imgDraftJob": 0, "imgKey": 0}
+# Reading order of a book's highlights; backed by the (ownerId, bookId, locationKey, _id) index.
+# locationKey is the location parsed into a sortable string (see utils/locations.py).
+HIGHLIGHT_LIST_SORT = [("locationKey", ASCENDING), ("_id", ASCENDING)]
+DUPLICATE_KEY_ERROR = 11000
 
 class Highlight(BaseModel):
     id: Optional[str] = Field(default_factory=lambda: str(uuid.uuid4()))
     text: Optional[str] = None
     location: Optional[str] = None
     imgUrl: Optional[str] = None
+    imgProfile: Optional[str] = None  # Generation profile of the current image (draft/final)
     book_id: Optional[str] = None  # Made optional
     owner_id: Optional[str] = None  # Made optional
 
-    def create_highlight(self, image: bool = False) -> Dict:
+    async def create_highlight(self, image: bool = False, profile: Optional[str] = None) -> Dict:
 
         if not self.text or not self.id or not self.owner_id or not self.book_id: 
             return {}
 
-        self.imgUrl = generate_image(self.text, self.owner_id, self.id, self.book_id) if image else None
-        highlight_data = self.model_dump()
-        del highlight_data["book_id"]
-        del highlight_data["owner_id"]
-        collection = get_mongodb_collection(self.owner_id)
-        print(highlight_data)
-        result = collection.update_one(
-            {"_id": self.book_id},
-            {"$push": {"highlights": highlight_data}}
-        )
-        if result.modified_count == 0:
-            raise HTTPException(status_code=404, detail="Failed to add highlight to book")
-        
+        await self.check_book_exists("Failed to add highlight to book")
+
+        try:
+            await get_highlights_collection().insert_one(self.to_document())
+        except DuplicateKeyError:
+            raise HTTPException(status_code=409, detail="Highlight already exists")
+        await search.index_highlight(self.owner_id, self.book_id, self.id, self.text)
+
+        job = await enqueue_highlight_image(self.owner_id, self.book_id, self.id, self.text, profile=profile) if image else None
+
         return {
             "message": "Successfully saved highlight!",
             "highlightId": self.id,
             "highlightText": self.text,
             "imgUrl": self.imgUrl,
-            "bookId": self.book_id
+            "bookId": self.book_id,
+            "jobId": job and job["id"]
         }
 
-    def delete_highlight(self) -> None:
+    # Document stored for a new highlight. The image is generated by the image job
+    # queue and saved on the highlight when ready, so it starts without one.
+    def to_document(self, created: Optional[str] = None) -> Dict:
+        self.imgUrl = None
+        self.imgProfile = None
+        return {
+            "_id": highlight_document_id(self.owner_id, self.book_id, self.id),
+            **self.model_dump(exclude={"book_id", "owner_id"}),
+            "ownerId": self.owner_id,
+            "bookId": self.book_id,
+            "locationKey": location_key(self.location),
+            "created": created or datetime.now().isoformat(),
+        }
+
+    async def delete_highlight(self) -> None:
 
         if not self.owner_id:
             raise HTTPException(status_code=404, detail="Missing owner_id for highlight")
 
-        collection = get_mongodb_collection(self.owner_id)
-
-        document = collection.find_one(
-            {"_id": self.book_id, "highlights.id": self.id},
-            {"highlights.$": 1}
-        )
-        
-        # Delete highlight image from s3 if it exists
-        if document and "highlights" in document:
-            highlight = document["highlights"][0]
-            if "imgUrl" in highlight and highlight["imgUrl"]:
-                s3_key = f"{self.owner_id}/{self.book_id}/images/{self.id}.png"
-                delete_file_data(s3_key)
-
         # Delete highlight from mongodb
-        result = collection.update_one(
-            {"_id": self.book_id},
-            {"$pull": {"highlights": {"id": self.id}}}
+        highlight = await get_highlights_collection().find_one_and_delete(
+            highlight_filter(self.owner_id, self.book_id, self.id)
         )
-        if result.modified_count == 0:
+        if highlight is None:
             raise HTTPException(status_code=404, detail="Highlight not found")
+        await search.unindex_highlight(self.owner_id, self.book_id, self.id)
+
+        # Delete highlight image from s3 if it exists
+        if highlight.get("imgUrl"):
+            s3_key = current_image_key(self.owner_id, self.book_id, self.id, highlight)
+            await delete_files_async([s3_key, *variant_keys(s3_key, highlight.get("imgVariants"))])
 
     
-    def get_highlights(self):
+    # One page of the book's highlights and the cursor of the next page (None on the last one).
+    # key_range limits them to location keys in [lower, upper); either bound may be None.
+    async def get_highlights(self, projection: Dict, limit: int, cursor: Optional[str] = None, key_range: tuple = (None, None)) -> tuple:
         if not self.owner_id:
             raise HTTPException(status_code=404, detail="Missing owner_id for highlight")
 
-        collection = get_mongodb_collection(self.owner_id)
-        result = collection.find_one({"_id": self.book_id}, {"highlights": 1, "_id": 0})
+        query = highlight_filter(self.owner_id, self.book_id)
+        lower, upper = key_range
+        if lower is not None or upper is not None:
+            query["locationKey"] = {
+                **({"$gte": lower} if lower is not None else {}),
+                **({"$lt": upper} if upper is not None else {}),
+            }
+
+        highlights, next_cursor = await find_page(
+            get_highlights_collection(), query, HIGHLIGHT_LIST_SORT, projection, limit, cursor
+        )
 
-        if result is None:
-            raise HTTPException(status_code=404, detail="Book not found")
+        # No highlights could also mean there is no such book
+        if not highlights and not cursor:
+            await self.check_book_exists()
 
-        return result.get("highlights", [])
+        return highlights, next_cursor
 
 
-    def get_highlight_by_id(self) -> Dict:
+    async def get_highlight_by_id(self) -> Dict:
         if not self.owner_id:
             raise HTTPException(status_code=404, detail="Missing owner_id for highlight")
 
-        collection = get_mongodb_collection(self.owner_id)
-        book_metadata = collection.find_one({"_id": self.book_id})
-
-        if not book_metadata:
-            raise HTTPException(status_code=404, detail="Book not found")
+        highlight_data = await get_highlights_collection().find_one(
+            highlight_filter(self.owner_id, self.book_id, self.id), HIGHLIGHT_PROJECTION
+        )
 
-        highlight_data = next((h for h in book_metadata.get("highlights", []) if h["id"] == self.id), None)
-        
         if not highlight_data:
+            await self.check_book_exists()
             raise HTTPException(status_code=404, detail="Highlight not found")
 
         return highlight_data
+
+    # Remove the image from the highlight, cancelling a pending upgrade of an earlier draft,
+    # and delete it from S3. Returns False if the highlight had no image.
+    async def remove_image(self) -> bool:
+        previous = await get_highlights_collection().find_one_and_update(
+            {**highlight_filter(self.owner_id, self.book_id, self.id), "imgUrl": {"$nin": [None, ""]}},
+            {"$set": {"imgUrl": None, "imgVariants": None, "imgProfile": None}, "$unset": {"imgDraftJob": "", "imgKey": ""}},
+            {"imgKey": 1, "imgVariants": 1},
+        )
+        if previous is None:
+            return False
+        s3_key = current_image_key(self.owner_id, self.book_id, self.id, previous)
+        if not await delete_files_async([s3_key, *variant_keys(s3_key, previous.get("imgVariants"))]):
+            raise HTTPException(status_code=500, detail="Failed to delete image from S3")
+        return True
+
+    async def check_book_exists(self, detail: str = "Book not found") -> None:
+        collection = get_async_collection(self.owner_id)
+        if not await collection.find_one({"_id": self.book_id}, {"_id": 1}):
+            raise HTTPException(status_code=404, detail=detail)
+
+
+# Save many highlights of one book with a single unordered insert_many, then index
+# them for search in one bulk write. created optionally maps highlight ids to their
+# original creation times (imports). Returns one result per highlight, in order:
+# {"id", "status": "created" | "duplicate" | "failed", "error"?}. A highlight whose
+# id the book already has, e.g. from a re-sent import, is a duplicate and left as it is.
+# Ids are scoped to the owner and book (see highlight_document_id), so ids used in
+# other books or libraries neither clash nor show up here.
+async def create_highlights(owner_id: str, book_id: str, highlights: List[Highlight], created: Optional[Dict] = None) -> List[Dict]:
+    await Highlight(owner_id=owner_id, book_id=book_id).check_book_exists("Failed to add highlights to book")
+
+    created = created or {}
+    now = datetime.now().isoformat()
+    results = [{"id": highlight.id, "status": "created"} for highlight in highlights]
+    if not highlights:
+        return results
+
+    try:
+        await get_highlights_collection().insert_many(
+            [highlight.to_document(created.get(highlight.id) or now) for highlight in highlights], ordered=False
+        )
+    except BulkWriteError as e:
+        for error in e.details.get("writeErrors", []):
+            if error.get("code") == DUPLICATE_KEY_ERROR:
+                results[error["index"]].update(status="duplicate", error="Highlight already exists")
+            else:
+                print(f"Failed to save highlight {results[error['index']]['id']}: {error.get('errmsg')}")
+                results[error["index"]].update(status="failed", error="Failed to save highlight")
+
+    await search.index_highlights(owner_id, book_id, [
+        (highlight.id, highlight.text) for highlight, result in zip(highlights, results) if result["status"] == "created"
+    ])
+    return results
@@ -1,32 +1,38 @@
 import os
-import boto3
-from fastapi import APIRouter, HTTPException, UploadFile, Form, Request, status, Response
-from fastapi.responses import JSONResponse
-from io import BytesIO
+from fastapi import APIRouter, HTTPException, UploadFile, Form, Request, Query, status, Response
+from fastapi.responses import JSONResponse, RedirectResponse, StreamingResponse
 from botocore.exceptions import NoCredentialsError
 from dotenv import load_dotenv
 from pydantic import BaseModel
 from typing import Annotated, Optional
 from ...database.book_metadata import extract_metadata
-from ...database.mongodb import get_mongodb_collection
-from ...database.s3_db import delete_folder 
-from ...models.book import Book, extract_metadata
-from . import highlight
+from ...database.executor import run_blocking
+from ...database.mongodb import get_async_collection
+from ...jobs.maintenance import maintenance_jobs
+from ...models.book import Book, extract_metadata, BOOK_LIST_SORT, EPUB_TYPES
+from ...utils.aws import get_client
+from ...utils.chapters import store_chapters
+from ...utils.book_cache import book_cache, BOOK_CACHE_ENABLED
+from ...utils.ranges import parse_range, etag_matches, mmap_chunks
+from ...utils.pagination import fields_projection, find_page, page_response
+from . import chapter, highlight
 
 load_dotenv()
 S3_BUCKET_NAME = os.getenv("S3_BUCKET_NAME")
 AWS_REGION = os.getenv("COGNITO_REGION")
-s3_client = boto3.client('s3')
+MAX_UPLOAD_SIZE = int(os.getenv("MAX_UPLOAD_SIZE_MB", "200")) * 1024 * 1024
+BOOKS_PAGE_SIZE = int(os.getenv("BOOKS_PAGE_SIZE", "50"))
+BOOKS_MAX_PAGE_SIZE = int(os.getenv("BOOKS_MAX_PAGE_SIZE", "200"))
 
-# Define S3 client outside the route for reuse
-s3 = boto3.client('s3')
+# Fields returned by GET /books by default, and the ones that can be asked for with ?fields=
+BOOK_SUMMARY_FIELDS = ["id", "title", "author", "imgUrl", "type", "size", "updated"]
+BOOK_LIST_FIELDS = BOOK_SUMMARY_FIELDS + ["created", "settings"]
 
 router = APIRouter()
 
-# include highlight routes
+# include highlight and chapter routes
 router.include_router(highlight.router)
-
-
+router.include_router(chapter.router)
 
 
 class BookFormData(BaseModel):
@@ -52,9 +58,12 @@ async def upload_book(request: Request, data: Annotated[BookFormData, Form()]):
     if file.content_type not in ("application/epub", "application/epub+zip", "application/pdf"):
         return JSONResponse(status_code=400, content={"message": "Invalid file type. Only EPUB or PDF files are allowed."})
 
-    # Get metadata from file
-    file_stream = BytesIO(await file.read())
-    metadata = extract_metadata(file_stream, file.content_type)
+    if file.size is not None and file.size > MAX_UPLOAD_SIZE:
+        return JSONResponse(status_code=413, content={"message": f"File is too large. The maximum size is {MAX_UPLOAD_SIZE // (1024 * 1024)} MB."})
+
+    # Get metadata from file. The upload is already spooled to a temporary file,
+    # so read it from there instead of copying it into memory.
+    metadata = await run_blocking(extract_metadata, file.file, file.content_type)
 
     # Set title and author
     title = data.title or str(metadata and metadata["title"]) or file.filename or "Unknown"
@@ -63,11 +72,18 @@ async def upload_book(request: Request, data: Annotated[BookFormData, Form()]):
     # Create book object
     book = Book(user_email, title, author, file.content_type, file.size or 0) 
 
-    # Upload book file
-    book.setBookContent(file_stream)
+    # Stream the book file to S3
+    await book.setBookContent(file.file, MAX_UPLOAD_SIZE)
+
+    # Split EPUBs into separately fetchable chapters
+    if file.content_type in EPUB_TYPES:
+        book.spine = await store_chapters(book.ownerId, book.id, file.file)
 
     # Upload book metadata
-    book.save()
+    await book.save()
+
+    # Add the book's text to the search index in the background
+    await maintenance_jobs.enqueue("index_book", book.ownerId, {"bookId": book.id, "type": book.type})
 
     return book.get_metadata()
 
@@ -84,10 +100,9 @@ async def update_book_settings(request: Request, book_id: str, settings: BookSet
     owner_id = request.state.user["id"]
 
 
-
     # Get MongoDB collection
 
-    collection = get_mongodb_collection(owner_id)
+    collection = get_async_collection(owner_id)
     # Prepare update data
 
     update_data = {
@@ -99,10 +114,9 @@ async def update_book_settings(request: Request, book_id: str, settings: BookSet
     }
 
 
-
     # Update the book settings in MongoDB
 
-    result = collection.update_one(
+    result = await collection.update_one(
 
         {"_id": book_id, "ownerId": owner_id},  # Match book and owner
 
@@ -111,7 +125,6 @@ async def update_book_settings(request: Request, book_id: str, settings: BookSet
     )
 
 
-
     if result.matched_count == 0:
 
         raise HTTPException(status_code=404, detail="Book not found.")
@@ -121,28 +134,36 @@ async def update_book_settings(request: Request, book_id: str, settings: BookSet
         return {"message": "No changes were made."}
 
 
-
     return {"message": "Successfully updated book settings."}
 
 # GET /books - Retrieve Books Metadata API
+# Most recently updated first, one page at a time. The cursor of the next page
+# is returned in the X-Next-Cursor header.
 @router.get("/books", tags=["book"])
-async def retrieve_books(request: Request):
+async def retrieve_books(
+    request: Request,
+    limit: int = Query(BOOKS_PAGE_SIZE, ge=1, le=BOOKS_MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    fields: Optional[str] = None,
+):
     owner_id = request.state.user["id"]
+    projection = fields_projection(fields, BOOK_SUMMARY_FIELDS, BOOK_LIST_FIELDS)
+    if projection.pop("id", None):
+        projection["_id"] = 1
 
     # Retrieve books from MongoDB based on the owner's hashed email
-    collection = get_mongodb_collection(owner_id)
-    books = list(collection.find({}))  # Fetch all books for the user
+    collection = get_async_collection(owner_id)
+    books, next_cursor = await find_page(collection, {}, BOOK_LIST_SORT, projection, limit, cursor)
 
     if not books:
         return Response(status_code=status.HTTP_204_NO_CONTENT)
 
     # Rename '_id' to 'id' in the response for each book
     for book in books:
-        book['id'] = str(book.pop('_id'))
-
-    return books
-
+        if "_id" in book:
+            book['id'] = str(book.pop('_id'))
 
+    return page_response(books, next_cursor)
 
 
 # GET /book/info/{id} this route gets book metadata from mongodb
@@ -151,8 +172,8 @@ async def get_book_info(request: Request, book_id: str):
     owner_id = request.state.user["id"]
 
     # Retrieve the book metadata from MongoDB based on user's hashed email and the UUID field
-    collection = get_mongodb_collection(owner_id)
-    book_metadata = collection.find_one({"_id": book_id})
+    collection = get_async_collection(owner_id)
+    book_metadata = await collection.find_one({"_id": book_id})
 
     if not book_metadata:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Book not found")
@@ -171,10 +192,10 @@ async def get_book_settings(request: Request, book_id: str):
     owner_id = request.state.user["id"]
 
     # Get MongoDB collection
-    collection = get_mongodb_collection(owner_id)
+    collection = get_async_collection(owner_id)
 
     # Try to find the book document
-    book_metadata = collection.find_one({"_id": book_id, "ownerId": owner_id})
+    book_metadata = await collection.find_one({"_id": book_id, "ownerId": owner_id})
 
     if not book_metadata:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Book not found")
@@ -185,7 +206,7 @@ async def get_book_settings(request: Request, book_id: str):
             "font_size": 16,
             "dark_mode": False
         }
-        collection.update_one(
+        await collection.update_one(
             {"_id": book_id, "ownerId": owner_id},
             {"$set": {"settings": default_settings}}
         )
@@ -204,7 +225,7 @@ async def get_book_presigned_url(request: Request, book_id: str):
 
     try:
         # Generate a pre-signed URL for the S3 object
-        presigned_url = s3_client.generate_presigned_url(
+        presigned_url = get_client('s3').generate_presigned_url(
             'get_object',
             Params={'Bucket': S3_BUCKET_NAME, 'Key': s3_key},
             ExpiresIn=3600  # URL will expire in 1 hour
@@ -217,40 +238,86 @@ async def get_book_presigned_url(request: Request, book_id: str):
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=str(e))
 
 
+# GET the book file itself, served from the local book cache (downloaded from S3 on
+# the first request). Supports Range requests and ETag revalidation. Without the
+# cache, or when S3 can't be read into it, redirects to a presigned S3 URL instead.
+@router.get("/book/{book_id}/content", tags=["book"])
+async def get_book_content(request: Request, book_id: str):
+    owner_id = request.state.user["id"]
+
+    collection = get_async_collection(owner_id)
+    if not await collection.find_one({"_id": book_id}, {"_id": 1}):
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Book not found")
+
+    s3_key = f"{owner_id}/{book_id}/book.epub"
+    if not BOOK_CACHE_ENABLED:
+        return RedirectResponse(await presigned_book_url(s3_key))
+    try:
+        entry, file = await book_cache.open(s3_key)
+    except Exception as e:
+        print(f"Book cache unavailable for {s3_key}, redirecting to S3: {e}")
+        return RedirectResponse(await presigned_book_url(s3_key))
+
+    etag = f'"{entry["etag"]}"'
+    headers = {"ETag": etag, "Accept-Ranges": "bytes", "Cache-Control": "private, max-age=3600"}
+    size = entry["size"]
+    byte_range = None
+    try:
+        if etag_matches(request.headers.get("if-none-match"), etag):
+            file.close()
+            return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+
+        # A stale If-Range (the client holds another version) gets the whole file
+        if request.headers.get("if-range") in (None, etag):
+            byte_range = parse_range(request.headers.get("range"), size)
+    except HTTPException:
+        file.close()
+        raise
+
+    if byte_range is None:
+        start, end, status_code = 0, size - 1, status.HTTP_200_OK
+    else:
+        (start, end), status_code = byte_range, status.HTTP_206_PARTIAL_CONTENT
+        headers["Content-Range"] = f"bytes {start}-{end}/{size}"
+    headers["Content-Length"] = str(end - start + 1)
+
+    return StreamingResponse(
+        mmap_chunks(file, start, end),
+        status_code=status_code,
+        media_type=entry["content_type"],
+        headers=headers,
+    )
+
+
+async def presigned_book_url(s3_key: str) -> str:
+    return await run_blocking(
+        get_client('s3').generate_presigned_url,
+        'get_object',
+        Params={'Bucket': S3_BUCKET_NAME, 'Key': s3_key},
+        ExpiresIn=3600
+    )
 
 
 # Delete route for book
+# The book disappears from the library as soon as its metadata is deleted. Its highlights
+# and S3 objects are removed by a background job, whose progress is at GET /job/{jobId}.
 @router.delete("/book/{book_id}", tags=["book"])
 async def delete_book(request: Request, book_id: str):
     owner_id = request.state.user["id"]
 
     try:
         # Deleting the book metadata from mongodb
-        collection = get_mongodb_collection(owner_id)
-        result = collection.delete_one({"_id": book_id})
+        collection = get_async_collection(owner_id)
+        result = await collection.delete_one({"_id": book_id})
 
         if result.deleted_count > 0:
             print(f"Book with ID {book_id} successfully deleted.")
 
-            # S3 key where the book folder is stored
-            book_folder = f"{owner_id}/{book_id}/"
-    
-            # Now deleting book from AWS s3
-            response = delete_folder(book_folder)
-
-            # Step 3: Check S3 deletion result
-            if response:
-                print(f"Book {book_folder} successfully deleted from S3.")
-                return JSONResponse(
-                    content={"message": "Book successfully deleted."},
-                    status_code=status.HTTP_200_OK
-                ) 
-            else:
-                print(f"Error deleting book {book_folder} from S3.")
-                return JSONResponse(
-                    content={"message": "Error deleting book data from S3."},
-                    status_code=status.HTTP_500_INTERNAL_SERVER_ERROR
-                )  
+            job = await maintenance_jobs.enqueue("delete_book", owner_id, {"bookId": book_id})
+            return JSONResponse(
+                content={"message": "Book successfully deleted.", "jobId": job["id"]},
+                status_code=status.HTTP_200_OK
+            )
         else:
             print(f"Error Deleting File metaData {book_id}.")
             return JSONResponse(
@@ -259,4 +326,4 @@ async def delete_book(request: Request, book_id: str):
             )
 
     except Exception as e:
-        raise HTTPException(status_code=status.HTTP_501_INTERNAL_SERVER_ERROR, detail=str(e))
+        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=str(e))
@@ -0,0 +1,106 @@
+import gzip
+import mimetypes
+from fastapi import APIRouter, HTTPException, Request, status, Response
+from fastapi.responses import JSONResponse
+
+from ...database.executor import run_blocking
+from ...database.mongodb import get_async_collection
+from ...database.s3_db import read_file_data_async
+from ...utils.book_cache import open_book_file
+from ...utils.chapters import chapter_key
+from ...utils.epub import EpubError, open_archive, read_member
+from ...utils.ranges import accepts_encoding, etag_matches
+
+router = APIRouter(prefix="/book/{book_id}")
+
+# Chapter objects never change once stored
+CHAPTER_CACHE_CONTROL = "private, max-age=86400, immutable"
+
+
+
+
+async def get_spine(owner_id: str, book_id: str) -> dict:
+    collection = get_async_collection(owner_id)
+    book = await collection.find_one({"_id": book_id}, {"spine": 1})
+    if not book:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Book not found")
+    if not book.get("spine"):
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Book has no chapter index")
+    return book["spine"]
+
+
+# GET the reading order and table of contents
+@router.get("/spine", tags=["chapter"])
+async def get_book_spine(request: Request, book_id: str):
+    owner_id = request.state.user["id"]
+    spine = await get_spine(owner_id, book_id)
+
+    chapters = [
+        {key: chapter.get(key) for key in ("index", "id", "path", "mediaType", "linear", "size", "cfiSteps")}
+        for chapter in spine["chapters"]
+    ]
+    return JSONResponse(content={"chapters": chapters, "toc": spine["toc"]})
+
+
+# GET one chapter. It is sent gzip-encoded as stored when the client accepts gzip,
+# and the Link header asks the client to prefetch the next chapter.
+@router.get("/chapter/{index}", tags=["chapter"])
+async def get_book_chapter(request: Request, book_id: str, index: int):
+    owner_id = request.state.user["id"]
+    chapters = (await get_spine(owner_id, book_id))["chapters"]
+    if not 0 <= index < len(chapters):
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Chapter not found")
+    chapter = chapters[index]
+
+    etag = f'"{chapter["etag"]}"'
+    headers = {"ETag": etag, "Cache-Control": CHAPTER_CACHE_CONTROL, "Vary": "Accept-Encoding"}
+    if index + 1 < len(chapters):
+        headers["Link"] = f"</book/{book_id}/chapter/{index + 1}>; rel=prefetch"
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+
+    compressed = await read_file_data_async(chapter_key(owner_id, book_id, index))
+    if compressed is None:
+        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Failed to read chapter")
+
+    if accepts_encoding(request.headers.get("accept-encoding"), "gzip"):
+        headers["Content-Encoding"] = "gzip"
+        body = compressed
+    else:
+        body = await run_blocking(gzip.decompress, compressed)
+    return Response(content=body, media_type=chapter["mediaType"], headers=headers)
+
+
+# GET a file referenced by a chapter (image, stylesheet, font) by its path in the
+# EPUB, read from the locally cached book file (a temporary download when the cache is off).
+# A file the archive has but zipfile can't read is a 422.
+@router.get("/resource/{path:path}", tags=["chapter"])
+async def get_book_resource(request: Request, book_id: str, path: str):
+    owner_id = request.state.user["id"]
+    await get_spine(owner_id, book_id)
+
+    try:
+        entry, file = await open_book_file(f"{owner_id}/{book_id}/book.epub")
+    except Exception as e:
+        print(f"Failed to read book {book_id} for a resource: {e}")
+        raise HTTPException(status_code=status.HTTP_502_BAD_GATEWAY, detail="Failed to read book")
+    etag = f'"{entry["etag"]}"'
+    headers = {"ETag": etag, "Cache-Control": CHAPTER_CACHE_CONTROL}
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        file.close()
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+
+    def read_resource():
+        with file, open_archive(file) as archive:
+            return read_member(archive, path)
+
+    try:
+        body = await run_blocking(read_resource)
+    except KeyError:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Resource not found")
+    except EpubError as e:
+        print(f"Unreadable resource {path} of {book_id}: {e}")
+        raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY, detail="Resource can't be read from the book")
+
+    media_type = mimetypes.guess_type(path)[0] or "application/octet-stream"
+    return Response(content=body, media_type=media_type, headers=headers)
@@ -1,20 +1,30 @@
+import asyncio
 import os
-import boto3
-from fastapi import APIRouter, HTTPException, Request, status, Response, Body
-from fastapi.responses import JSONResponse
+from datetime import datetime
+from fastapi import APIRouter, HTTPException, Request, Query, status, Response, Body
+from fastapi.responses import JSONResponse, RedirectResponse
 from dotenv import load_dotenv
 from pydantic import BaseModel
-from ...database.mongodb import get_mongodb_collection
-from ...models.highlight import Highlight
-from ...utils.text2image import overwrite_image, generate_image
+from typing import Optional, List, Literal
+from ...database.mongodb import get_async_collection
+from ...jobs.images import image_jobs, enqueue_highlight_image, IMAGE_JOB_WAIT_TIMEOUT
+from ...models.highlight import Highlight, create_highlights
+from ...utils.image_variants import best_variant
+from ...utils.locations import chapter_key_range, location_key_range
+from ...utils.pagination import fields_projection, page_response
 
 load_dotenv()
 S3_BUCKET_NAME = os.getenv("S3_BUCKET_NAME")
 AWS_REGION = os.getenv("COGNITO_REGION")
-s3_client = boto3.client('s3')
+HIGHLIGHTS_PAGE_SIZE = int(os.getenv("HIGHLIGHTS_PAGE_SIZE", "100"))
+HIGHLIGHTS_MAX_PAGE_SIZE = int(os.getenv("HIGHLIGHTS_MAX_PAGE_SIZE", "500"))
+# Most highlights accepted by one POST /highlights
+HIGHLIGHTS_BULK_MAX = int(os.getenv("HIGHLIGHTS_BULK_MAX", "500"))
+HIGHLIGHT_ID_MAX_LENGTH = 128
 
-# Define S3 client outside the route for reuse
-s3 = boto3.client('s3')
+# Fields returned by GET /highlights by default, and the ones that can be asked for with ?fields=
+HIGHLIGHT_SUMMARY_FIELDS = ["id", "text", "location", "imgUrl"]
+HIGHLIGHT_LIST_FIELDS = HIGHLIGHT_SUMMARY_FIELDS + ["imgVariants", "imgProfile", "created"]
 
 router = APIRouter(prefix="/book/{book_id}")
 
@@ -26,31 +36,201 @@ class CreateHighlight(BaseModel):
     text: str
     location: str
 
+# Items are checked one by one (see bulk_item_error) so a bad item is reported in
+# its result instead of failing the whole request
+class BulkHighlight(BaseModel):
+    id: Optional[str] = None
+    text: Optional[str] = None
+    location: Optional[str] = None
+    created: Optional[str] = None
+    image: bool = False
+
+class BulkHighlights(BaseModel):
+    highlights: List[BulkHighlight]
+
+# Image generation runs on the image job queue. These routes answer 202 with the job id
+# right away and the client polls GET /job/{jobId} for the imgUrl. With ?wait=true they wait
+# for the job (without blocking the worker) for up to IMAGE_JOB_WAIT_TIMEOUT and answer with
+# the imgUrl, or with the 202 if it isn't ready by then.
+# With the draft profile (the default, see IMAGE_DEFAULT_PROFILE) the job finishes with a
+# quick low-resolution image and queues the final render, whose job id is returned as
+# upgradeJobId; the final image then replaces the draft under a new imgUrl.
+ImageProfile = Optional[Literal["draft", "final"]]
+
+async def wait_for_image_job(job_id: str, wait: bool):
+    if not wait:
+        return None
+
+    job = await image_jobs.wait(job_id, IMAGE_JOB_WAIT_TIMEOUT)
+    if job and job["status"] == "failed":
+        raise HTTPException(status_code=500, detail=f"Image generation failed: {job['error']}")
+    return job
+
 # POST /book/:id/highlight - Add a highlight to the book's metadata
 @router.post("/highlight", tags=["highlight"])
-async def add_book_highlight(request: Request, book_id: str, body: CreateHighlight, image: bool = False):
+async def add_book_highlight(request: Request, book_id: str, body: CreateHighlight, image: bool = False, wait: bool = False, profile: ImageProfile = None):
     owner_id = request.state.user["id"]
 
     # Call create_highlight from Highlight model
     highlight = Highlight(text=body.text, location=body.location, book_id=book_id, owner_id=owner_id)
-    return highlight.create_highlight(image)
+    result = await highlight.create_highlight(image, profile)
+    if not result.get("jobId"):
+        return result
+
+    job = await wait_for_image_job(result["jobId"], wait)
+    if job is None:
+        return JSONResponse(status_code=status.HTTP_202_ACCEPTED, content=result)
+
+    result["imgUrl"] = job["result"]["imgUrl"]
+    result["imgProfile"] = job["result"].get("imgProfile")
+    result["upgradeJobId"] = job["result"].get("upgradeJobId")
+    return result
+
+
+
+def bulk_item_error(item: BulkHighlight, seen_ids: set) -> Optional[str]:
+    if not item.text or not item.text.strip():
+        return "text is required"
+    if not item.location or not item.location.strip():
+        return "location is required"
+    if item.id is not None:
+        if not item.id.strip() or len(item.id) > HIGHLIGHT_ID_MAX_LENGTH:
+            return f"id must be 1 to {HIGHLIGHT_ID_MAX_LENGTH} characters"
+        if item.id in seen_ids:
+            return "id appears more than once in the request"
+    if item.created is not None:
+        try:
+            datetime.fromisoformat(item.created)
+        except ValueError:
+            return "created must be an ISO 8601 timestamp"
+    return None
+
+
+# POST /book/:id/highlights - Add many highlights at once, e.g. an import from another
+# reader or a batch made offline. Valid items are written with one insert_many; items
+# may carry their own id (so re-sending a batch is harmless) and created time.
+# Images are queued only for items with "image": true and never generated inline.
+# Answers with one result per item, in request order:
+# {"index", "id", "status": "created" | "duplicate" | "invalid" | "failed", "error"?, "jobId"?}
+@router.post("/highlights", tags=["highlight"])
+async def add_book_highlights(request: Request, book_id: str, body: BulkHighlights):
+    owner_id = request.state.user["id"]
+    if not body.highlights:
+        raise HTTPException(status_code=400, detail="No highlights given")
+    if len(body.highlights) > HIGHLIGHTS_BULK_MAX:
+        raise HTTPException(status_code=413, detail=f"At most {HIGHLIGHTS_BULK_MAX} highlights per request")
+
+    results = []
+    valid = []
+    seen_ids = set()
+    for index, item in enumerate(body.highlights):
+        error = bulk_item_error(item, seen_ids)
+        if error:
+            results.append({"index": index, "id": item.id, "status": "invalid", "error": error})
+            continue
+
+        highlight = Highlight(text=item.text, location=item.location, book_id=book_id, owner_id=owner_id)
+        if item.id is not None:
+            highlight.id = item.id
+        seen_ids.add(highlight.id)
+        results.append({"index": index, "id": highlight.id, "status": "created"})
+        valid.append((index, item, highlight))
+
+    saved = await create_highlights(
+        owner_id, book_id, [highlight for _, _, highlight in valid],
+        {highlight.id: item.created for _, item, highlight in valid if item.created},
+    )
 
+    images = []
+    for (index, item, highlight), result in zip(valid, saved):
+        results[index].update(result)
+        if result["status"] == "created" and item.image:
+            images.append((index, highlight))
 
+    jobs = await asyncio.gather(*(
+        enqueue_highlight_image(owner_id, book_id, highlight.id, highlight.text) for _, highlight in images
+    ))
+    for (index, _), job in zip(images, jobs):
+        results[index]["jobId"] = job["id"]
 
+    return JSONResponse(content={
+        "created": sum(result["status"] == "created" for result in results),
+        "results": results,
+    })
 
+
+
+# Highlights in reading order, one page at a time. The cursor of the next page
+# is returned in the X-Next-Cursor header.
 @router.get("/highlights", tags=["highlight"])
-async def get_all_highlights(request: Request, book_id: str):
+async def get_all_highlights(
+    request: Request,
+    book_id: str,
+    limit: int = Query(HIGHLIGHTS_PAGE_SIZE, ge=1, le=HIGHLIGHTS_MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    fields: Optional[str] = None,
+):
     owner_id = request.state.user["id"]
+    projection = fields_projection(fields, HIGHLIGHT_SUMMARY_FIELDS, HIGHLIGHT_LIST_FIELDS)
 
     # Call the static method with required arguments
     highlight_instance = Highlight(book_id=book_id, owner_id=owner_id)
-    highlights = highlight_instance.get_highlights()
+    highlights, next_cursor = await highlight_instance.get_highlights(projection, limit, cursor)
 
     # If there are no highlights, return a 204 No Content status
     if not highlights:
         return Response(status_code=status.HTTP_204_NO_CONTENT)
 
-    return JSONResponse(content=highlights)
+    return page_response(highlights, next_cursor)
+
+
+# A chapter's entry in the book's spine, or None for a book without a saved spine
+# (a PDF, or an EPUB whose spine couldn't be read)
+async def chapter_entry(owner_id: str, book_id: str, chapter: int) -> Optional[dict]:
+    book = await get_async_collection(owner_id).find_one({"_id": book_id}, {"spine.chapters": 1})
+    if not book:
+        raise HTTPException(status_code=404, detail="Book not found")
+    chapters = (book.get("spine") or {}).get("chapters") or []
+    if not chapters:
+        return None
+    if chapter >= len(chapters):
+        raise HTTPException(status_code=404, detail="Chapter not found")
+    return chapters[chapter]
+
+
+# Highlights in one section of the book, in reading order: an EPUB spine item with
+# ?chapter=, or the locations from ?start= to ?end= (both inclusive, either may be
+# left out), e.g. the CFIs of the visible page or a window of PDF page numbers.
+# An index range scan on locationKey; paginated like GET /highlights, but an
+# empty section is an empty list.
+@router.get("/highlights/range", tags=["highlight"])
+async def get_highlights_in_range(
+    request: Request,
+    book_id: str,
+    chapter: Optional[int] = Query(None, ge=0),
+    start: Optional[str] = None,
+    end: Optional[str] = None,
+    limit: int = Query(HIGHLIGHTS_PAGE_SIZE, ge=1, le=HIGHLIGHTS_MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    fields: Optional[str] = None,
+):
+    owner_id = request.state.user["id"]
+    if chapter is not None and (start or end):
+        raise HTTPException(status_code=400, detail="Pass either chapter or start/end, not both")
+    if chapter is None and not (start or end):
+        raise HTTPException(status_code=400, detail="Pass chapter, or start and/or end")
+
+    if chapter is not None:
+        key_range = chapter_key_range(chapter, await chapter_entry(owner_id, book_id, chapter))
+    else:
+        key_range = location_key_range(start, end)
+    if key_range[0] is not None and key_range[1] is not None and key_range[0] >= key_range[1]:
+        raise HTTPException(status_code=400, detail="start must not come after end")
+    projection = fields_projection(fields, HIGHLIGHT_SUMMARY_FIELDS, HIGHLIGHT_LIST_FIELDS)
+
+    highlight_instance = Highlight(book_id=book_id, owner_id=owner_id)
+    highlights, next_cursor = await highlight_instance.get_highlights(projection, limit, cursor, key_range)
+    return page_response(highlights, next_cursor)
 
 
 
@@ -61,7 +241,7 @@ async def get_book_highlight(request: Request, book_id: str, highlight_id: str):
 
     # Instantiate a Highlight object with bookId, ownerId, and highlight_id 
     highlight_instance = Highlight(id=highlight_id, book_id=book_id, owner_id=owner_id)
-    highlight = highlight_instance.get_highlight_by_id()
+    highlight = await highlight_instance.get_highlight_by_id()
 
     return JSONResponse(content=highlight, status_code=status.HTTP_200_OK)
 
@@ -75,7 +255,7 @@ async def delete_highlight(request: Request, book_id: str, highlightid: str):
 
     # Call delete_highlight from Highlight model
     highlight_instance = Highlight(id=highlightid, book_id=book_id, owner_id=owner_id)
-    highlight_instance.delete_highlight()
+    await highlight_instance.delete_highlight()
 
     return JSONResponse(status_code=status.HTTP_200_OK, content={"message": "Successfully deleted highlight!"})
 
@@ -86,24 +266,15 @@ async def regenerate_highlight_image(
     request: Request, 
     book_id: str, 
     highlight_id: str, 
-    new_text: str = Body(None)
+    new_text: str = Body(None),
+    wait: bool = False,
+    profile: ImageProfile = None
 ):
     owner_id = request.state.user["id"]
     
-    # Query the MongoDB for the book document and find the highlight by ID
-    collection = get_mongodb_collection(owner_id)
-    book_metadata = collection.find_one({"_id": book_id})
-    
-    if not book_metadata:
-        raise HTTPException(status_code=404, detail="Book not found")
-    
-    # Extract the highlight data based on highlight_id
-    highlight_data = next(
-        (highlight for highlight in book_metadata.get("highlights", []) if highlight["id"] == highlight_id), 
-        None
-    )
-    if not highlight_data:
-        raise HTTPException(status_code=404, detail="Highlight not found")
+    # Find the highlight by ID (404 if the book or highlight doesn't exist)
+    highlight_instance = Highlight(id=highlight_id, book_id=book_id, owner_id=owner_id)
+    highlight_data = await highlight_instance.get_highlight_by_id()
 
     # Check if the image URL exists and is not null or "null"
     img_url = highlight_data.get("imgUrl")
@@ -114,20 +285,22 @@ async def regenerate_highlight_image(
     if not prompt:
         raise HTTPException(status_code=500, detail="Highlight text is missing")
 
-    # Prepare S3 key for the image
-    s3_key = f"{owner_id}/{book_id}/images/{highlight_id}.png"
-    print(f"S3 Key: {s3_key}")
-
-    # Call the appropriate function based on whether the image exists
-    if image_exists:
-        print("Overwriting existing image...")
-        overwrite_image(prompt, s3_key)
-    else:
-        print("Generating new image...")
-        generate_image(prompt, owner_id, highlight_id, book_id)
+    # Overwrite the existing image in place, or generate a new one.
+    # Regenerating the same text asks for a different picture, so only custom prompts may reuse a cached render.
+    job = await enqueue_highlight_image(owner_id, book_id, highlight_id, prompt, use_cache=bool(new_text), profile=profile)
+    finished = await wait_for_image_job(job["id"], wait)
+    if finished is None:
+        return JSONResponse(
+            status_code=status.HTTP_202_ACCEPTED,
+            content={
+                "message": "Image generation queued.",
+                "highlight_id": highlight_id,
+                "imageExists": image_exists,
+                "jobId": job["id"]
+            }
+        )
 
-    # Construct the image URL
-    img_url = f"https://{S3_BUCKET_NAME}.s3.{AWS_REGION}.amazonaws.com/{s3_key}"
+    img_url = finished["result"]["imgUrl"]
 
     return JSONResponse(
         status_code=200,
@@ -136,82 +309,76 @@ async def regenerate_highlight_image(
                        else "Image successfully generated and uploaded to S3.",
             "highlight_id": highlight_id,
             "imgUrl": img_url,
-            "imageExists": image_exists
+            "imgProfile": finished["result"].get("imgProfile"),
+            "imageExists": image_exists,
+            "jobId": job["id"],
+            "upgradeJobId": finished["result"].get("upgradeJobId")
         }
     )
 
 @router.post("/highlight/{highlight_id}/generate", tags=["highlight"])
-async def generate_new_image(request: Request, book_id: str, highlight_id: str):
+async def generate_new_image(request: Request, book_id: str, highlight_id: str, wait: bool = False, profile: ImageProfile = None):
     owner_id = request.state.user["id"]
     
-    # Query the MongoDB for the book document and find the highlight by ID
-    collection = get_mongodb_collection(owner_id)
-    book_metadata = collection.find_one({"_id": book_id})
-    
-    if not book_metadata:
-        raise HTTPException(status_code=404, detail="Book not found")
-    
-    # Extract the highlight data based on highlight_id
-    highlight_data = next(
-        (highlight for highlight in book_metadata.get("highlights", []) if highlight["id"] == highlight_id), 
-        None
-    )
-    if not highlight_data:
-        raise HTTPException(status_code=404, detail="Highlight not found")
+    # Find the highlight by ID (404 if the book or highlight doesn't exist)
+    highlight_instance = Highlight(id=highlight_id, book_id=book_id, owner_id=owner_id)
+    highlight_data = await highlight_instance.get_highlight_by_id()
 
     # Generate the new image
     prompt = highlight_data.get("text")
     if not prompt:
         raise HTTPException(status_code=500, detail="Highlight text is missing")
     
-    s3_key = f"{owner_id}/{book_id}/images/{highlight_id}.png"
-    img_url = generate_image(prompt, owner_id, highlight_id, book_id)
-    
-    # Update the highlight in MongoDB with the new imgUrl
-    collection.update_one(
-        {"_id": book_id, "highlights.id": highlight_id},
-        {"$set": {"highlights.$.imgUrl": img_url}}
-    )
-    
+    # The job saves the new imgUrl on the highlight once the image is uploaded
+    job = await enqueue_highlight_image(owner_id, book_id, highlight_id, prompt, profile=profile)
+    finished = await wait_for_image_job(job["id"], wait)
+    if finished is None:
+        return JSONResponse(
+            status_code=status.HTTP_202_ACCEPTED,
+            content={"message": "Image generation queued.", "jobId": job["id"]}
+        )
+
     return JSONResponse(
         status_code=200,
-        content={"message": "Image successfully generated.", "imgUrl": img_url}
+        content={
+            "message": "Image successfully generated.",
+            "imgUrl": finished["result"]["imgUrl"],
+            "imgProfile": finished["result"].get("imgProfile"),
+            "jobId": job["id"],
+            "upgradeJobId": finished["result"].get("upgradeJobId")
+        }
     )
 
 
-@router.delete("/highlight/{highlight_id}/image", tags=["highlight"])
-async def delete_highlight_image(request: Request, book_id: str, highlight_id: str):
+# GET /book/:id/highlight/:id/image - Redirect to the smallest rendition at least `width` pixels wide
+# in a format the client accepts, falling back to the original PNG
+@router.get("/highlight/{highlight_id}/image", tags=["highlight"])
+async def get_highlight_image(request: Request, book_id: str, highlight_id: str, width: Optional[int] = None, redirect: bool = True):
     owner_id = request.state.user["id"]
 
-    # Query the MongoDB for the book document and find the highlight by ID
-    collection = get_mongodb_collection(owner_id)
-    book_metadata = collection.find_one({"_id": book_id})
+    highlight_instance = Highlight(id=highlight_id, book_id=book_id, owner_id=owner_id)
+    highlight = await highlight_instance.get_highlight_by_id()
+    if not highlight.get("imgUrl"):
+        raise HTTPException(status_code=404, detail="Image not found")
+
+    variant = best_variant(highlight.get("imgVariants"), width, request.headers.get("Accept"))
+    image = variant or {"url": highlight["imgUrl"], "width": None, "format": "png"}
 
-    # Extract the highlight based on highlight_id
-    if book_metadata:
-        highlight_data = next((highlight for highlight in book_metadata.get("highlights", []) if highlight["id"] == highlight_id), None)
-    else:
-        raise HTTPException(status_code=404, detail="Book not found")
+    if not redirect:
+        return JSONResponse(content=image, headers={"Vary": "Accept"})
+    return RedirectResponse(image["url"], status_code=status.HTTP_307_TEMPORARY_REDIRECT, headers={"Vary": "Accept"})
 
-    if not highlight_data:
-        raise HTTPException(status_code=404, detail="Highlight not found")
 
-    # Delete the image from S3 if it exists
-    img_url = highlight_data.get("imgUrl")
-    if img_url:
-        s3_key = f"{owner_id}/{book_id}/images/{highlight_id}.png"
-        try:
-            s3_client.delete_object(Bucket=S3_BUCKET_NAME, Key=s3_key)
-        except s3_client.exceptions.NoSuchKey:
-            raise HTTPException(status_code=404, detail="Image not found in S3")
-
-        # Set the image URL to null in the database
-        highlight_data["imgUrl"] = None
-        collection.update_one(
-            {"_id": book_id, "highlights.id": highlight_id},
-            {"$set": {"highlights.$.imgUrl": None}}
-        )
-    else:
+@router.delete("/highlight/{highlight_id}/image", tags=["highlight"])
+async def delete_highlight_image(request: Request, book_id: str, highlight_id: str):
+    owner_id = request.state.user["id"]
+
+    # Find the highlight by ID (404 if the book or highlight doesn't exist)
+    highlight_instance = Highlight(id=highlight_id, book_id=book_id, owner_id=owner_id)
+    await highlight_instance.get_highlight_by_id()
+
+    # Unset the image on the highlight, then delete it and its renditions from S3
+    if not await highlight_instance.remove_image():
         raise HTTPException(status_code=404, detail="Image not found")
 
     return JSONResponse(
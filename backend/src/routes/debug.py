@@ -0,0 +1,48 @@
+import io
+import os
+import pstats
+from dotenv import load_dotenv
+from fastapi import APIRouter, HTTPException, Request, status
+from fastapi.responses import FileResponse, PlainTextResponse
+
+from ..utils import tracing
+
+load_dotenv()
+# Emails of users who may see every saved profile; others only see profiles of their own requests
+DEBUG_USERS = {email.strip().lower() for email in os.getenv("DEBUG_USERS", "").split(",") if email.strip()}
+
+router = APIRouter(prefix="/debug")
+
+
+
+
+def can_read(request: Request, profile: dict) -> bool:
+    user = request.state.user
+    return profile.get("owner") == user["id"] or user.get("email", "").lower() in DEBUG_USERS
+
+
+def readable_profile(request: Request, profile_id: str) -> dict:
+    profile = tracing.get_profile(profile_id)
+    if not profile or not can_read(request, profile) or not os.path.exists(tracing.profile_path(profile_id)):
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Profile not found")
+    return profile
+
+
+# GET /debug/profiles - Saved CPU profiles of slow or X-Profile requests, newest first
+@router.get("/profiles", tags=["debug"])
+async def list_profiles(request: Request):
+    return [profile for profile in tracing.list_profiles() if can_read(request, profile)]
+
+
+# GET /debug/profiles/:id - Download a profile (pstats format, e.g. for snakeviz), or with
+# ?format=text the top functions by cumulative time
+@router.get("/profiles/{profile_id}", tags=["debug"])
+async def get_profile(request: Request, profile_id: str, format: str = "pstats", limit: int = 40):
+    readable_profile(request, profile_id)
+    path = tracing.profile_path(profile_id)
+
+    if format == "text":
+        output = io.StringIO()
+        pstats.Stats(path, stream=output).sort_stats("cumulative").print_stats(limit)
+        return PlainTextResponse(output.getvalue())
+    return FileResponse(path, media_type="application/octet-stream", filename=f"{profile_id}.prof")
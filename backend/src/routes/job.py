@@ -0,0 +1,19 @@
+from fastapi import APIRouter, HTTPException, Request, status
+
+from ..jobs.store import job_store, public_job
+
+router = APIRouter()
+
+
+
+
+# GET /job/:id - Status of a background job (queued, running, done or failed) and its result
+@router.get("/job/{job_id}", tags=["job"])
+async def get_job(request: Request, job_id: str):
+    owner_id = request.state.user["id"]
+
+    job = await job_store.get(job_id)
+    if not job or job["ownerId"] != owner_id:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Job not found")
+
+    return public_job(job)
@@ -0,0 +1,41 @@
+import os
+from fastapi import APIRouter, Request, Query, status, Response
+from dotenv import load_dotenv
+from typing import Literal, Optional
+
+from ..utils import search
+from ..utils.pagination import decode_cursor, encode_cursor, page_response
+
+load_dotenv()
+SEARCH_PAGE_SIZE = int(os.getenv("SEARCH_PAGE_SIZE", "20"))
+SEARCH_MAX_PAGE_SIZE = int(os.getenv("SEARCH_MAX_PAGE_SIZE", "100"))
+# Ranked results are paged by position, so the depth of a search is capped
+SEARCH_MAX_RESULTS = int(os.getenv("SEARCH_MAX_RESULTS", "1000"))
+
+router = APIRouter()
+
+
+
+
+# GET /search?q= - Search the text of the user's books and highlights, best match first.
+# Each result has a snippet with the [start, end) offsets of the matched terms and the
+# snippet's offset in its chapter. The cursor of the next page is in the X-Next-Cursor header.
+@router.get("/search", tags=["search"])
+async def search_library(
+    request: Request,
+    q: str = Query(..., min_length=1, max_length=200),
+    book_id: Optional[str] = None,
+    kind: Optional[Literal["book", "highlight"]] = None,
+    limit: int = Query(SEARCH_PAGE_SIZE, ge=1, le=SEARCH_MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+):
+    owner_id = request.state.user["id"]
+    skip = decode_cursor(cursor, 1)[0] if cursor else 0
+
+    results, more = await search.search(owner_id, q, book_id, kind, skip, limit)
+    if not results:
+        return Response(status_code=status.HTTP_204_NO_CONTENT)
+
+    next_skip = skip + len(results)
+    next_cursor = encode_cursor([next_skip]) if more and next_skip < SEARCH_MAX_RESULTS else None
+    return page_response(results, next_cursor)
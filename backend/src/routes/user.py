@@ -1,8 +1,10 @@
 import os
-import boto3
 from fastapi import APIRouter, Request, HTTPException, status
+from fastapi.responses import JSONResponse
 from pydantic import BaseModel
 from dotenv import load_dotenv
+from ..jobs.maintenance import maintenance_jobs
+from ..utils.aws import get_async_client
 
 # Load environment variables from the .env file
 load_dotenv()
@@ -11,7 +13,7 @@ COGNITO_USERPOOL_ID = os.getenv("COGNITO_USERPOOL_ID")
 print(f"COGNITO_REGION loaded: {COGNITO_REGION}")
 
 # Initialize Cognito Identity Provider client
-cognito_client = boto3.client('cognito-idp', region_name=COGNITO_REGION)
+cognito_client = get_async_client('cognito-idp', region_name=COGNITO_REGION)
 
 router = APIRouter()
 
@@ -25,18 +27,18 @@ async def read_user_me(request: Request):
 
 
 
+# Deleting an account purges the user's books, highlights and S3 objects in the
+# background and removes the Cognito user last. Progress is at GET /job/{jobId}.
 @router.delete("/user", tags=["user"])
 async def delete_user(request: Request):
+    user = request.state.user
     try:
-        # Delete the user from the Cognito User Pool
-        cognito_client.admin_delete_user(
-            UserPoolId=COGNITO_USERPOOL_ID,
-            Username=request.state.user["username"]
+        job = await maintenance_jobs.enqueue("purge_user", user["id"], {"username": user["username"]})
+        return JSONResponse(
+            content={"message": "User deletion started", "jobId": job["id"]},
+            status_code=status.HTTP_202_ACCEPTED
         )
-        return {"message": "User successfully deleted"}
-    
-    except cognito_client.exceptions.UserNotFoundException:
-        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="User not found")
+
     except Exception as e:
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=str(e))
 
@@ -55,7 +57,7 @@ async def update_user(request: Request, updated_info: UpdateUserModel):
     ]
 
     try:
-        cognito_client.admin_update_user_attributes(
+        await cognito_client.admin_update_user_attributes(
             UserPoolId=COGNITO_USERPOOL_ID,
             Username=request.state.user["username"],
             UserAttributes=user_attributes
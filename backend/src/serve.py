@@ -0,0 +1,125 @@
+# src/serve.py
+# Production entrypoint: uvicorn serving src.server:app from several worker processes.
+#
+#   python -m src.serve
+#   SERVER_WORKERS=4 SERVER_PORT=8080 python -m src.serve
+import math
+import os
+import tempfile
+from dotenv import load_dotenv
+
+load_dotenv()
+APP = "src.server:app"
+SERVER_HOST = os.getenv("SERVER_HOST", "0.0.0.0")
+SERVER_PORT = int(os.getenv("SERVER_PORT", "8000"))
+# Worker processes, each with its own event loop, I/O executor, job queues and MongoDB/S3
+# connection pools. 0 means one per CPU available to the container.
+SERVER_WORKERS = int(os.getenv("SERVER_WORKERS", "0"))
+# Event loop and HTTP parser: "auto" picks uvloop and httptools (uvicorn[standard]) when
+# they are installed, and falls back to asyncio and h11
+SERVER_LOOP = os.getenv("SERVER_LOOP", "auto")
+SERVER_HTTP = os.getenv("SERVER_HTTP", "auto")
+# Connections waiting to be accepted; the kernel caps it at net.core.somaxconn
+SERVER_BACKLOG = int(os.getenv("SERVER_BACKLOG", "2048"))
+# Seconds an idle keep-alive connection stays open. Longer than the load balancer's idle
+# timeout (60s on an AWS ALB), so the balancer never reuses a connection being closed.
+SERVER_KEEPALIVE_TIMEOUT = int(os.getenv("SERVER_KEEPALIVE_TIMEOUT", "75"))
+# On shutdown, seconds in-flight requests get to finish. Image routes answer right away
+# unless called with ?wait=true, which waits up to IMAGE_JOB_WAIT_TIMEOUT (20s).
+# Background jobs then get JOB_SHUTDOWN_TIMEOUT (see jobs/queue.py).
+SERVER_GRACEFUL_TIMEOUT = int(os.getenv("SERVER_GRACEFUL_TIMEOUT", "30"))
+# Each worker is replaced after serving this many requests, plus a random 0 to JITTER so
+# workers don't all restart at once. This bounds memory that pymupdf and Pillow leave
+# fragmented. 0 disables it; it only applies with 2+ workers, so a replacement is serving.
+SERVER_MAX_REQUESTS = int(os.getenv("SERVER_MAX_REQUESTS", "10000"))
+SERVER_MAX_REQUESTS_JITTER = int(os.getenv("SERVER_MAX_REQUESTS_JITTER", "1000"))
+SERVER_ACCESS_LOG = os.getenv("SERVER_ACCESS_LOG", "true").lower() == "true"
+SERVER_LOG_LEVEL = os.getenv("SERVER_LOG_LEVEL", "info")
+
+
+# CPU quota of the container (cgroup v2, then v1), in CPUs; None without a limit
+def cgroup_cpu_limit() -> float | None:
+    try:
+        with open("/sys/fs/cgroup/cpu.max") as file:
+            quota, period = file.read().split()
+        return None if quota == "max" else int(quota) / int(period)
+    except (OSError, ValueError):
+        pass
+    try:
+        with open("/sys/fs/cgroup/cpu/cpu.cfs_quota_us") as file:
+            quota = int(file.read())
+        with open("/sys/fs/cgroup/cpu/cpu.cfs_period_us") as file:
+            period = int(file.read())
+        return quota / period if quota > 0 else None
+    except (OSError, ValueError):
+        return None
+
+
+# CPUs this process may run on, capped by the container's quota. os.cpu_count() is the
+# host's count, which oversubscribes a container limited to a few CPUs.
+def available_cpus() -> int:
+    cpus = len(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else os.cpu_count() or 1
+    limit = cgroup_cpu_limit()
+    if limit:
+        cpus = min(cpus, math.ceil(limit))
+    return max(1, cpus)
+
+
+def worker_count() -> int:
+    return SERVER_WORKERS or available_cpus()
+
+
+def installed(module: str) -> bool:
+    try:
+        __import__(module)
+        return True
+    except ImportError:
+        return False
+
+
+# With several workers, every worker writes its metrics to files in a shared directory
+# so /metrics reports all of them (see utils/metrics.py). Files left by an earlier run
+# would be counted again, so they are removed first.
+def prepare_metrics_dir() -> str:
+    directory = os.environ.setdefault("PROMETHEUS_MULTIPROC_DIR", os.path.join(tempfile.gettempdir(), "wordvision-metrics"))
+    os.makedirs(directory, exist_ok=True)
+    for name in os.listdir(directory):
+        if name.endswith(".db"):
+            os.remove(os.path.join(directory, name))
+    return directory
+
+
+def main(app: str = APP):
+    import uvicorn
+
+    workers = worker_count()
+    if workers > 1:
+        # Workers are spawned after this, so they inherit the variable
+        prepare_metrics_dir()
+    loop = SERVER_LOOP if SERVER_LOOP != "auto" else ("uvloop" if installed("uvloop") else "asyncio")
+    http = SERVER_HTTP if SERVER_HTTP != "auto" else ("httptools" if installed("httptools") else "h11")
+    max_requests = SERVER_MAX_REQUESTS if workers > 1 and SERVER_MAX_REQUESTS > 0 else None
+    print(
+        f"Serving {app} on {SERVER_HOST}:{SERVER_PORT} with {workers} worker{'s' * (workers != 1)} ({loop}, {http}), "
+        f"recycled after {f'{max_requests}+{SERVER_MAX_REQUESTS_JITTER}' if max_requests else 'no'} requests"
+    )
+
+    uvicorn.run(
+        app,
+        host=SERVER_HOST,
+        port=SERVER_PORT,
+        workers=workers,
+        loop=loop,
+        http=http,
+        backlog=SERVER_BACKLOG,
+        timeout_keep_alive=SERVER_KEEPALIVE_TIMEOUT,
+        timeout_graceful_shutdown=SERVER_GRACEFUL_TIMEOUT,
+        limit_max_requests=max_requests,
+        limit_max_requests_jitter=SERVER_MAX_REQUESTS_JITTER if max_requests else 0,
+        access_log=SERVER_ACCESS_LOG,
+        log_level=SERVER_LOG_LEVEL,
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -1,22 +1,75 @@
+import asyncio
 import os
 import requests
+from contextlib import asynccontextmanager
 from fastapi import FastAPI, HTTPException, status, Depends, Request
-from fastapi.responses import RedirectResponse
+from fastapi.responses import JSONResponse, RedirectResponse, Response
 from fastapi.middleware.cors import CORSMiddleware
 from datetime import datetime, timezone
 from urllib.parse import urlencode
 from dotenv import load_dotenv
 from urllib.parse import urlencode
-from .auth import auth_middleware
+from .auth import auth_middleware, jwks_cache
+from .database.executor import run_blocking
+from .database.mongodb import close_mongo_client, ensure_books_indexes, ensure_highlight_indexes
+from .jobs.images import image_jobs
+from .jobs.maintenance import maintenance_jobs
+from .jobs.queue import JOB_SHUTDOWN_TIMEOUT
+from .jobs.store import job_store
 from .routes import user
 from .routes import book
+from .routes import job
+from .routes import search
+from .routes import debug
+from .utils import image_cache
+from .utils.search import ensure_indexes as ensure_search_indexes
+from .utils.book_cache import book_cache, BOOK_CACHE_ENABLED
+from .utils.readiness import check_dependencies, startup
+from .utils.text2image import get_space_client
+from .utils.metrics import MetricsMiddleware, METRICS_ENABLED, mark_worker_stopped, metrics_response
+from .utils.tracing import TracingMiddleware, TRACE_ID_HEADER, PROFILE_ID_HEADER, exporter
 
 load_dotenv()
 COGNITO_CLIENT_ID = os.getenv("COGNITO_CLIENT_ID")
 COGNITO_DOMAIN = os.getenv("COGNITO_DOMAIN")
 REDIRECT_URI = os.getenv("REDIRECT_URI")
 
-app = FastAPI()
+# Nothing here waits on MongoDB, S3, Cognito or the Space, so a worker starts serving
+# (and answers /healthcheck) even while one of them is briefly down. Creating indexes
+# and resuming unfinished jobs run in the background, retried until they succeed;
+# /readyz reports ready once they have. Clients are created on first use.
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    await image_jobs.start()
+    await maintenance_jobs.start()
+
+    startup.reset()
+    if hasattr(job_store, "ensure_indexes"):
+        startup.add("job indexes", job_store.ensure_indexes)
+    startup.add("image cache indexes", lambda: run_blocking(image_cache.ensure_indexes))
+    startup.add("book indexes", lambda: run_blocking(ensure_books_indexes))
+    startup.add("highlight indexes", lambda: run_blocking(ensure_highlight_indexes))
+    startup.add("search indexes", lambda: run_blocking(ensure_search_indexes))
+    startup.add("resume image jobs", image_jobs.resume)
+    startup.add("resume maintenance jobs", maintenance_jobs.resume)
+    # Warm-ups, so the first requests don't pay for them
+    if BOOK_CACHE_ENABLED:
+        startup.add("book cache", lambda: run_blocking(book_cache.load), required=False)
+    startup.add("JWKS", lambda: run_blocking(jwks_cache.refresh), required=False)
+    startup.add("Hugging Face Space", lambda: run_blocking(get_space_client), required=False)
+
+    startup_task = asyncio.create_task(startup.run(), name="startup")
+    startup.mark_serving()
+    yield
+    startup_task.cancel()
+    await asyncio.gather(startup_task, return_exceptions=True)
+    # Running jobs get JOB_SHUTDOWN_TIMEOUT to finish; both queues drain at the same time
+    await asyncio.gather(maintenance_jobs.stop(JOB_SHUTDOWN_TIMEOUT), image_jobs.stop(JOB_SHUTDOWN_TIMEOUT))
+    await run_blocking(exporter.flush)
+    await run_blocking(close_mongo_client)
+    mark_worker_stopped()
+
+app = FastAPI(lifespan=lifespan)
 
 app.add_middleware(
     CORSMiddleware,
@@ -24,11 +77,18 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor", TRACE_ID_HEADER, PROFILE_ID_HEADER],
 )
+# Added last so they wrap everything else, CORS included
+app.add_middleware(MetricsMiddleware)
+app.add_middleware(TracingMiddleware)
 
 # Include routes and protect with auth_middleware 
 app.include_router(user.router, dependencies=[Depends(auth_middleware)])
 app.include_router(book.router, dependencies=[Depends(auth_middleware)])
+app.include_router(job.router, dependencies=[Depends(auth_middleware)])
+app.include_router(search.router, dependencies=[Depends(auth_middleware)])
+app.include_router(debug.router, dependencies=[Depends(auth_middleware)])
 
 # Public Route Example (no authentication required)
 @app.get("/public")
@@ -54,6 +114,26 @@ async def root():
         "timestamp": datetime.now(timezone.utc).isoformat()
     }
 
+# Readiness (see utils/readiness.py): 200 once startup has finished and MongoDB and S3
+# answer, 503 otherwise. /healthcheck above is liveness only.
+@app.get("/readyz")
+async def readiness():
+    checks = await check_dependencies()
+    ready = startup.ready and all(check["ok"] for check in checks.values())
+    return JSONResponse(
+        status_code=status.HTTP_200_OK if ready else status.HTTP_503_SERVICE_UNAVAILABLE,
+        content={"status": "ready" if ready else "not ready", "startup": startup.status(), "checks": checks},
+    )
+
+# Prometheus metrics (see utils/metrics.py). Not behind auth, like /healthcheck;
+# keep the port private or set METRICS_ENABLED=false.
+@app.get("/metrics", include_in_schema=False)
+async def metrics():
+    if not METRICS_ENABLED:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Not Found")
+    body, content_type = metrics_response()
+    return Response(content=body, media_type=content_type)
+
 # Login
 # Note: delete this once frontend login has been implemented
 @app.get("/login")
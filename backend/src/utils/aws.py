@@ -0,0 +1,96 @@
+# src/utils/aws.py
+import os
+import threading
+import boto3
+from botocore.config import Config
+from dotenv import load_dotenv
+
+from ..database.executor import IO_EXECUTOR_WORKERS, run_blocking
+from . import metrics, tracing
+
+load_dotenv()
+# Each client keeps a pool of HTTPS connections. It has to be at least as large as the
+# number of threads that may call it at once, otherwise requests queue for a connection
+# and open new ones (with a fresh TLS handshake) once the pool overflows.
+AWS_MAX_POOL_CONNECTIONS = int(os.getenv("AWS_MAX_POOL_CONNECTIONS", str(max(50, IO_EXECUTOR_WORKERS))))
+# "adaptive" adds client-side rate limiting on top of "standard" retries when AWS throttles
+AWS_RETRY_MODE = os.getenv("AWS_RETRY_MODE", "adaptive")
+AWS_MAX_ATTEMPTS = int(os.getenv("AWS_MAX_ATTEMPTS", "5"))
+AWS_CONNECT_TIMEOUT = float(os.getenv("AWS_CONNECT_TIMEOUT", "5"))
+AWS_READ_TIMEOUT = float(os.getenv("AWS_READ_TIMEOUT", "60"))
+AWS_TCP_KEEPALIVE = os.getenv("AWS_TCP_KEEPALIVE", "true").lower() == "true"
+
+# Endpoints can still be overridden with botocore's own AWS_ENDPOINT_URL / AWS_ENDPOINT_URL_S3
+client_config = Config(
+    max_pool_connections=AWS_MAX_POOL_CONNECTIONS,
+    retries={"mode": AWS_RETRY_MODE, "max_attempts": AWS_MAX_ATTEMPTS},
+    connect_timeout=AWS_CONNECT_TIMEOUT,
+    read_timeout=AWS_READ_TIMEOUT,
+    tcp_keepalive=AWS_TCP_KEEPALIVE,
+)
+
+# boto3 clients are thread-safe once created, but creating them (and the default
+# session) is not, so clients are built once per (service, region) under a lock.
+# They are built on first use, not at import: loading a service model takes a while
+# and startup shouldn't pay for clients a worker may never need.
+_session = None
+_clients: dict = {}
+_lock = threading.Lock()
+
+
+# Shared, pooled client for an AWS service
+def get_client(service: str, region_name: str | None = None):
+    global _session
+    key = (service, region_name)
+    client = _clients.get(key)
+    if client is None:
+        with _lock:
+            client = _clients.get(key)
+            if client is None:
+                if _session is None:
+                    _session = boto3.session.Session()
+                client = _session.client(service, region_name=region_name, config=client_config)
+                metrics.instrument_boto_client(client)
+                if tracing.TRACING_ENABLED:
+                    tracing.instrument_boto_client(client)
+                _clients[key] = client
+    return client
+
+
+# A forked worker builds its own clients rather than sharing the parent's connection pools
+def _forget_clients_after_fork():
+    global _session, _lock
+    _session = None
+    _clients.clear()
+    _lock = threading.Lock()
+
+
+os.register_at_fork(after_in_child=_forget_clients_after_fork)
+
+
+# Awaitable view of a client: every API call runs on the I/O executor.
+#   await get_async_client("s3").head_object(Bucket=..., Key=...)
+# The client itself is only looked up on first use, so modules can create these at import.
+class AsyncClient:
+    def __init__(self, service: str, region_name: str | None = None):
+        self.service = service
+        self.region_name = region_name
+
+    @property
+    def client(self):
+        return get_client(self.service, self.region_name)
+
+    @property
+    def exceptions(self):
+        return self.client.exceptions
+
+    def __getattr__(self, name):
+        method = getattr(self.client, name)
+
+        async def call(*args, **kwargs):
+            return await run_blocking(method, *args, **kwargs)
+        return call
+
+
+def get_async_client(service: str, region_name: str | None = None) -> AsyncClient:
+    return AsyncClient(service, region_name)
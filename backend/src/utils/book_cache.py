@@ -0,0 +1,212 @@
+# src/utils/book_cache.py
+import asyncio
+import hashlib
+import json
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+from dotenv import load_dotenv
+
+from .aws import get_client
+from ..database.executor import run_blocking
+
+load_dotenv()
+S3_BUCKET_NAME = os.getenv("S3_BUCKET_NAME")
+BOOK_CACHE_ENABLED = os.getenv("BOOK_CACHE_ENABLED", "true").lower() == "true"
+BOOK_CACHE_DIR = os.getenv("BOOK_CACHE_DIR", os.path.join(tempfile.gettempdir(), "book-cache"))
+BOOK_CACHE_MAX_BYTES = int(os.getenv("BOOK_CACHE_MAX_MB", "2048")) * 1024 * 1024
+
+
+# Read-through cache of S3 book objects on local disk.
+# Each object is stored as {dir}/{sha256(key)} with a {sha256(key)}.json sidecar
+# holding its key, size, ETag and content type. Book files never change once
+# uploaded, so a cached copy is valid until the book is deleted. The least recently
+# used files are removed once the total size goes over max_bytes. The budget is per
+# process: other workers sharing the directory pick up each other's files on a miss.
+class BookFileCache:
+    def __init__(self, directory: str, max_bytes: int):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.entries: OrderedDict = OrderedDict()
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._downloads: dict = {}
+
+    def path(self, key: str) -> str:
+        return os.path.join(self.directory, hashlib.sha256(key.encode()).hexdigest())
+
+    # Index the files already in the directory, least recently used first
+    def load(self):
+        os.makedirs(self.directory, exist_ok=True)
+        found = []
+        for name in os.listdir(self.directory):
+            if name.endswith(".json"):
+                entry = self._read_sidecar(os.path.join(self.directory, name[:-5]))
+                if entry:
+                    found.append((os.path.getatime(entry["path"]), entry))
+        with self._lock:
+            for _, entry in sorted(found, key=lambda item: item[0]):
+                self._add(entry)
+            self._evict()
+        print(f"Book cache: {len(self.entries)} files, {self.size // (1024 * 1024)} MB in {self.directory}")
+
+    def lookup(self, key: str) -> dict | None:
+        with self._lock:
+            entry = self.entries.get(key)
+            if entry and os.path.exists(entry["path"]):
+                self.entries.move_to_end(key)
+                return entry
+            if entry:
+                # Evicted by another worker
+                self._remove(key)
+
+        # Downloaded by another worker sharing the directory
+        entry = self._read_sidecar(self.path(key))
+        if entry:
+            with self._lock:
+                self._add(entry)
+                self._evict()
+        return entry
+
+    # Stream the object from S3 into the cache directory (one GET, never held in memory)
+    def download(self, key: str) -> dict:
+        path = self.path(key)
+        response = get_client('s3').get_object(Bucket=S3_BUCKET_NAME, Key=key)
+        os.makedirs(self.directory, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix=".part")
+        try:
+            with os.fdopen(fd, "wb") as file:
+                for chunk in response["Body"].iter_chunks(1024 * 1024):
+                    file.write(chunk)
+            entry = {
+                "key": key,
+                "path": path,
+                "size": os.path.getsize(tmp_path),
+                "etag": response["ETag"].strip('"'),
+                "content_type": response.get("ContentType") or "application/octet-stream",
+            }
+            os.replace(tmp_path, path)
+        except Exception:
+            os.unlink(tmp_path)
+            raise
+
+        with open(path + ".json", "w") as sidecar:
+            json.dump({name: value for name, value in entry.items() if name != "path"}, sidecar)
+        with self._lock:
+            self._add(entry)
+            self._evict()
+        return entry
+
+    # Cached entry for the key, downloading it first on a miss. Concurrent requests
+    # for the same missing key wait for a single download.
+    async def get(self, key: str) -> dict:
+        entry = await run_blocking(self.lookup, key)
+        if entry:
+            self.hits += 1
+            return entry
+
+        download = self._downloads.get(key)
+        if download is None:
+            self.misses += 1
+            download = asyncio.ensure_future(run_blocking(self.download, key))
+            self._downloads[key] = download
+            download.add_done_callback(lambda _: self._downloads.pop(key, None))
+        return await asyncio.shield(download)
+
+    # Cached entry and an open handle on its file. The handle keeps the data readable
+    # even if the entry is evicted while it is being served.
+    async def open(self, key: str) -> tuple:
+        entry = await self.get(key)
+        try:
+            return entry, await run_blocking(open, entry["path"], "rb")
+        except FileNotFoundError:
+            # Evicted between the lookup and the open
+            await run_blocking(self.discard, key)
+            entry = await self.get(key)
+            return entry, await run_blocking(open, entry["path"], "rb")
+
+    def discard(self, key: str):
+        with self._lock:
+            self._remove(key)
+        for path in (self.path(key), self.path(key) + ".json"):
+            try:
+                os.unlink(path)
+            except FileNotFoundError:
+                pass
+
+    # Drop every cached object under a prefix, e.g. all books of a deleted user
+    def discard_prefix(self, prefix: str):
+        with self._lock:
+            keys = [key for key in self.entries if key.startswith(prefix)]
+        for key in keys:
+            self.discard(key)
+
+    def stats(self) -> dict:
+        return {"files": len(self.entries), "bytes": self.size, "hits": self.hits, "misses": self.misses}
+
+    def _read_sidecar(self, path: str) -> dict | None:
+        try:
+            with open(path + ".json") as sidecar:
+                entry = json.load(sidecar)
+            if os.path.getsize(path) != entry["size"]:
+                return None
+        except (OSError, ValueError, KeyError):
+            return None
+        return {**entry, "path": path}
+
+    def _add(self, entry: dict):
+        self._remove(entry["key"])
+        self.entries[entry["key"]] = entry
+        self.size += entry["size"]
+
+    def _remove(self, key: str):
+        entry = self.entries.pop(key, None)
+        if entry:
+            self.size -= entry["size"]
+        return entry
+
+    # Unlinking a file that is being served is safe: open handles and maps keep it alive
+    def _evict(self):
+        while self.size > self.max_bytes and len(self.entries) > 1:
+            _, entry = self.entries.popitem(last=False)
+            self.size -= entry["size"]
+            for path in (entry["path"], entry["path"] + ".json"):
+                try:
+                    os.unlink(path)
+                except FileNotFoundError:
+                    pass
+
+
+book_cache = BookFileCache(BOOK_CACHE_DIR, BOOK_CACHE_MAX_BYTES)
+
+
+# Download an S3 object into an anonymous temporary file, deleted once it is closed.
+# Returns an entry like the cache's and the open file.
+def download_temporary(key: str) -> tuple:
+    response = get_client('s3').get_object(Bucket=S3_BUCKET_NAME, Key=key)
+    file = tempfile.TemporaryFile()
+    try:
+        for chunk in response["Body"].iter_chunks(1024 * 1024):
+            file.write(chunk)
+        entry = {
+            "key": key,
+            "size": file.tell(),
+            "etag": response["ETag"].strip('"'),
+            "content_type": response.get("ContentType") or "application/octet-stream",
+        }
+        file.seek(0)
+    except Exception:
+        file.close()
+        raise
+    return entry, file
+
+
+# Entry and open handle on a book file: from the cache, or with BOOK_CACHE_ENABLED=false
+# from a temporary download that goes away when the handle is closed
+async def open_book_file(key: str) -> tuple:
+    if BOOK_CACHE_ENABLED:
+        return await book_cache.open(key)
+    return await run_blocking(download_temporary, key)
@@ -0,0 +1,85 @@
+# src/utils/chapters.py
+import asyncio
+import gzip
+import hashlib
+import os
+import zipfile
+from typing import BinaryIO
+from dotenv import load_dotenv
+
+from .aws import get_client
+from .epub import EpubError, open_archive, read_spine
+from ..database.executor import run_blocking
+
+load_dotenv()
+S3_BUCKET_NAME = os.getenv("S3_BUCKET_NAME")
+# Chapter uploads in flight per book upload
+CHAPTER_UPLOAD_CONCURRENCY = int(os.getenv("CHAPTER_UPLOAD_CONCURRENCY", "8"))
+CHAPTER_GZIP_LEVEL = int(os.getenv("CHAPTER_GZIP_LEVEL", "6"))
+
+
+# Each spine item of an EPUB is stored gzipped as its own object, next to the
+# book file, so a reader can show the first page after fetching one chapter
+# instead of the whole book. The spine and TOC are saved on the book document.
+
+
+def chapter_key(owner_id: str, book_id: str, index: int) -> str:
+    return f"{owner_id}/{book_id}/chapters/{index}.xhtml.gz"
+
+
+def compress_chapter(archive: zipfile.ZipFile, path: str) -> tuple:
+    data = archive.read(path)
+    # mtime=0 keeps the output (and so its ETag) the same for the same chapter
+    return len(data), gzip.compress(data, compresslevel=CHAPTER_GZIP_LEVEL, mtime=0)
+
+
+def put_chapter(key: str, media_type: str, compressed: bytes):
+    get_client('s3').put_object(
+        Bucket=S3_BUCKET_NAME,
+        Key=key,
+        Body=compressed,
+        ContentType=media_type,
+        ContentEncoding="gzip",
+    )
+
+
+# Index the spine and TOC of an uploaded EPUB and store its chapters.
+# Chapters are read and compressed one at a time while earlier ones upload.
+# Returns the spine with each chapter's size, compressed size and ETag, or None
+# when the book can't be split (it is still readable as a whole file).
+async def store_chapters(owner_id: str, book_id: str, file: BinaryIO) -> dict | None:
+    try:
+        archive = await run_blocking(open_archive, file)
+    except EpubError as e:
+        print(f"Not indexing chapters of {book_id}: {e}")
+        return None
+
+    slots = asyncio.Semaphore(CHAPTER_UPLOAD_CONCURRENCY)
+    uploads = []
+
+    async def upload(key: str, media_type: str, compressed: bytes):
+        try:
+            await run_blocking(put_chapter, key, media_type, compressed)
+        finally:
+            slots.release()
+
+    try:
+        spine = await run_blocking(read_spine, archive)
+        for chapter in spine["chapters"]:
+            size, compressed = await run_blocking(compress_chapter, archive, chapter["path"])
+            chapter.update(size=size, compressedSize=len(compressed), etag=hashlib.md5(compressed).hexdigest())
+
+            await slots.acquire()
+            uploads.append(asyncio.create_task(upload(
+                chapter_key(owner_id, book_id, chapter["index"]), chapter["mediaType"], compressed
+            )))
+        await asyncio.gather(*uploads)
+    except Exception as e:
+        await asyncio.gather(*uploads, return_exceptions=True)
+        print(f"Failed to store chapters of {book_id}: {e}")
+        return None
+    finally:
+        archive.close()
+
+    print(f"Stored {len(spine['chapters'])} chapters of {book_id}")
+    return spine
@@ -0,0 +1,219 @@
+# src/utils/epub.py
+import posixpath
+import zipfile
+import zlib
+from typing import BinaryIO
+from urllib.parse import unquote
+from xml.etree import ElementTree
+
+CONTAINER_PATH = "META-INF/container.xml"
+NAMESPACES = {
+    "container": "urn:oasis:names:tc:opendocument:xmlns:container",
+    "opf": "http://www.idpf.org/2007/opf",
+    "dc": "http://purl.org/dc/elements/1.1/",
+    "xhtml": "http://www.w3.org/1999/xhtml",
+    "epub": "http://www.idpf.org/2007/ops",
+    "ncx": "http://www.daisy.org/z3986/2005/ncx/",
+}
+# Raised by ZipFile.read for a member that is corrupt (bad CRC or deflate stream, truncated)
+# or compressed/encrypted in a way zipfile doesn't support
+MEMBER_ERRORS = (zipfile.BadZipFile, zlib.error, EOFError, NotImplementedError)
+
+
+# Raised for files that aren't a readable EPUB (not a zip, no container or package document)
+class EpubError(Exception):
+    pass
+
+
+# Path of the OPF package document inside the archive, as declared by META-INF/container.xml
+def package_path(archive: zipfile.ZipFile) -> str:
+    try:
+        container = ElementTree.fromstring(archive.read(CONTAINER_PATH))
+    except (KeyError, ElementTree.ParseError, *MEMBER_ERRORS) as e:
+        raise EpubError(f"Invalid {CONTAINER_PATH}: {e}")
+
+    rootfile = container.find("container:rootfiles/container:rootfile", NAMESPACES)
+    if rootfile is None or not rootfile.get("full-path"):
+        raise EpubError("No rootfile declared in container.xml")
+    return rootfile.get("full-path")
+
+
+# Parsed OPF package document and its directory (manifest hrefs are relative to it)
+def read_package(archive: zipfile.ZipFile) -> tuple:
+    path = package_path(archive)
+    try:
+        package = ElementTree.fromstring(archive.read(path))
+    except (KeyError, ElementTree.ParseError, *MEMBER_ERRORS) as e:
+        raise EpubError(f"Invalid package document {path}: {e}")
+    return package, posixpath.dirname(path)
+
+
+def open_archive(file: BinaryIO) -> zipfile.ZipFile:
+    try:
+        file.seek(0)
+        return zipfile.ZipFile(file)
+    except zipfile.BadZipFile as e:
+        raise EpubError(f"Not an EPUB archive: {e}")
+
+
+# Data of a file in the archive: KeyError if there is no such file, EpubError if it is
+# corrupt or compressed in a way zipfile can't read
+def read_member(archive: zipfile.ZipFile, path: str) -> bytes:
+    try:
+        return archive.read(path)
+    except MEMBER_ERRORS as e:
+        raise EpubError(f"Unreadable {path}: {e}")
+
+
+# Dublin Core metadata of an EPUB. Only container.xml and the OPF are read from
+# the zip's central directory; chapters and images are never decompressed.
+def read_metadata(file: BinaryIO) -> dict:
+    with open_archive(file) as archive:
+        package, _ = read_package(archive)
+
+    metadata = package.find("opf:metadata", NAMESPACES)
+    if metadata is None:
+        raise EpubError("Package document has no metadata")
+
+    def values(name):
+        return [element.text.strip() for element in metadata.findall(f"dc:{name}", NAMESPACES) if element.text and element.text.strip()]
+
+    def first(name):
+        found = values(name)
+        return found[0] if found else None
+
+    return {
+        "title": first("title"),
+        "authors": values("creator"),
+        "publisher": first("publisher"),
+        "language": first("language"),
+        "identifier": first("identifier"),
+        "description": first("description"),
+    }
+
+
+# Resolve a manifest/TOC href against the directory of the document it appears in.
+# Returns the archive path and the #fragment (or None).
+def resolve_href(base_dir: str, href: str) -> tuple:
+    path, _, fragment = href.partition("#")
+    return posixpath.normpath(posixpath.join(base_dir, unquote(path))), fragment or None
+
+
+# Reading order and table of contents of an EPUB:
+#   {"chapters": [{"index", "id", "path", "mediaType", "linear", "cfiSteps"}],
+#    "toc": [{"title", "chapter", "fragment", "level"}]}
+# chapter paths are archive paths, and toc entries point at a chapter index.
+# Itemrefs without a manifest item are skipped, so cfiSteps records where each chapter
+# really is in the package: the CFI steps of the spine and of its itemref ([6, 4] is /6/4).
+def read_spine(archive: zipfile.ZipFile) -> dict:
+    package, opf_dir = read_package(archive)
+
+    manifest = {}
+    for item in package.iterfind("opf:manifest/opf:item", NAMESPACES):
+        path, _ = resolve_href(opf_dir, item.get("href", ""))
+        manifest[item.get("id")] = {
+            "path": path,
+            "mediaType": item.get("media-type"),
+            "properties": (item.get("properties") or "").split(),
+        }
+
+    spine = package.find("opf:spine", NAMESPACES)
+    if spine is None:
+        raise EpubError("Package document has no spine")
+
+    # A CFI step counts element children from 1, at even numbers
+    spine_step = (list(package).index(spine) + 1) * 2
+    chapters = []
+    for position, itemref in enumerate(spine):
+        if itemref.tag != f"{{{NAMESPACES['opf']}}}itemref":
+            continue
+        item = manifest.get(itemref.get("idref"))
+        if item is None:
+            continue
+        chapters.append({
+            "index": len(chapters),
+            "id": itemref.get("idref"),
+            "path": item["path"],
+            "mediaType": item["mediaType"],
+            "linear": itemref.get("linear", "yes") != "no",
+            "cfiSteps": [spine_step, (position + 1) * 2],
+        })
+    if not chapters:
+        raise EpubError("Spine has no readable items")
+
+    chapter_index = {chapter["path"]: chapter["index"] for chapter in chapters}
+    nav = next((item for item in manifest.values() if "nav" in item["properties"]), None)
+    ncx = manifest.get(spine.get("toc"))
+    try:
+        if nav:
+            toc = read_nav(archive, nav["path"], chapter_index)
+        elif ncx:
+            toc = read_ncx(archive, ncx["path"], chapter_index)
+        else:
+            toc = []
+    except (KeyError, ElementTree.ParseError, *MEMBER_ERRORS) as e:
+        # A broken TOC shouldn't stop the book from being read chapter by chapter
+        print(f"Ignoring unreadable table of contents: {e}")
+        toc = []
+
+    return {"chapters": chapters, "toc": toc}
+
+
+# EPUB 3 navigation document: the nested <ol> of <nav epub:type="toc">
+def read_nav(archive: zipfile.ZipFile, path: str, chapter_index: dict) -> list:
+    document = ElementTree.fromstring(archive.read(path))
+    base_dir = posixpath.dirname(path)
+    toc_type = f"{{{NAMESPACES['epub']}}}type"
+    nav = next((element for element in document.iter(f"{{{NAMESPACES['xhtml']}}}nav") if element.get(toc_type) == "toc"), None)
+    if nav is None:
+        return []
+
+    entries = []
+
+    def walk(ol, level):
+        for li in ol.iterfind("xhtml:li", NAMESPACES):
+            link = li.find("xhtml:a", NAMESPACES)
+            if link is not None and link.get("href"):
+                target, fragment = resolve_href(base_dir, link.get("href"))
+                if target in chapter_index:
+                    entries.append({
+                        "title": " ".join("".join(link.itertext()).split()),
+                        "chapter": chapter_index[target],
+                        "fragment": fragment,
+                        "level": level,
+                    })
+            child = li.find("xhtml:ol", NAMESPACES)
+            if child is not None:
+                walk(child, level + 1)
+
+    root = nav.find("xhtml:ol", NAMESPACES)
+    if root is not None:
+        walk(root, 0)
+    return entries
+
+
+# EPUB 2 NCX: nested <navPoint>s of the <navMap>
+def read_ncx(archive: zipfile.ZipFile, path: str, chapter_index: dict) -> list:
+    document = ElementTree.fromstring(archive.read(path))
+    base_dir = posixpath.dirname(path)
+    entries = []
+
+    def walk(parent, level):
+        for point in parent.iterfind("ncx:navPoint", NAMESPACES):
+            content = point.find("ncx:content", NAMESPACES)
+            label = point.find("ncx:navLabel/ncx:text", NAMESPACES)
+            if content is not None and content.get("src"):
+                target, fragment = resolve_href(base_dir, content.get("src"))
+                if target in chapter_index:
+                    entries.append({
+                        "title": " ".join((label.text or "").split()) if label is not None else "",
+                        "chapter": chapter_index[target],
+                        "fragment": fragment,
+                        "level": level,
+                    })
+            walk(point, level + 1)
+
+    nav_map = document.find("ncx:navMap", NAMESPACES)
+    if nav_map is not None:
+        walk(nav_map, 0)
+    return entries
@@ -0,0 +1,137 @@
+# src/utils/image_cache.py
+import hashlib
+import json
+import os
+import unicodedata
+from datetime import datetime
+from botocore.exceptions import ClientError
+from dotenv import load_dotenv
+from pymongo import ASCENDING
+
+from ..database.mongodb import get_db
+from .aws import get_client
+from .image_variants import variant_key, variant_keys
+
+load_dotenv()
+S3_BUCKET_NAME = os.getenv("S3_BUCKET_NAME")
+IMAGE_CACHE_ENABLED = os.getenv("IMAGE_CACHE_ENABLED", "true").lower() == "true"
+IMAGE_CACHE_PREFIX = os.getenv("IMAGE_CACHE_PREFIX", "cache/images")
+IMAGE_CACHE_MAX_ENTRIES = int(os.getenv("IMAGE_CACHE_MAX_ENTRIES", "10000"))
+MONGODB_IMAGE_CACHE_COLLECTION = os.getenv("MONGODB_IMAGE_CACHE_COLLECTION", "image_cache")
+
+
+# Content-addressed cache of generated images.
+# A render is identified by a hash of the normalized prompt and every generation
+# parameter, stored once under {IMAGE_CACHE_PREFIX}/{hash}.png and copied
+# server-side, together with its WebP/AVIF renditions ({hash}_{width}w.webp), to
+# each highlight that asks for the same render. The Mongo index tracks last use,
+# and the least recently used entries are evicted once it holds more than
+# IMAGE_CACHE_MAX_ENTRIES. Highlights keep their own copies, so eviction never
+# breaks an existing imgUrl.
+
+
+def get_index():
+    return get_db()[MONGODB_IMAGE_CACHE_COLLECTION]
+
+
+# Same passage with different whitespace or capitalisation renders the same image
+def normalize_prompt(prompt: str) -> str:
+    return " ".join(unicodedata.normalize("NFKC", prompt).split()).casefold()
+
+
+def generation_key(prompt: str, params: dict) -> str:
+    data = json.dumps({"prompt": normalize_prompt(prompt), **params}, sort_keys=True)
+    return hashlib.sha256(data.encode()).hexdigest()
+
+
+def cache_object_key(key: str) -> str:
+    return f"{IMAGE_CACHE_PREFIX}/{key}.png"
+
+
+# Server-side copy of one object in the bucket
+def copy_object(source_key: str, s3_key: str, content_type: str):
+    get_client('s3').copy_object(
+        Bucket=S3_BUCKET_NAME,
+        Key=s3_key,
+        CopySource={"Bucket": S3_BUCKET_NAME, "Key": source_key},
+        ContentType=content_type,
+        MetadataDirective="REPLACE",
+    )
+
+
+# Copy a cached render and its renditions to s3_key.
+# Returns the renditions ([{"width", "format"}]), or None on a cache miss.
+def copy_cached(key: str, s3_key: str) -> list | None:
+    entry = get_index().find_one_and_update(
+        {"_id": key},
+        {"$set": {"lastUsed": datetime.now().isoformat()}, "$inc": {"hits": 1}}
+    )
+    if not entry:
+        return None
+
+    variants = entry.get("variants", [])
+    try:
+        copy_object(entry["s3Key"], s3_key, "image/png")
+        for variant in variants:
+            copy_object(
+                variant_key(entry["s3Key"], variant["width"], variant["format"]),
+                variant_key(s3_key, variant["width"], variant["format"]),
+                f"image/{variant['format']}",
+            )
+        return variants
+    except ClientError as e:
+        # The object was evicted (or removed) behind the index's back
+        print(f"Image cache entry {key} could not be copied: {e}")
+        get_index().delete_one({"_id": key})
+        return None
+
+
+# Store a render and its renditions under its content address and record it in the index
+def store(key: str, img_data: bytes, renditions: list) -> str:
+    cache_key = cache_object_key(key)
+    get_client('s3').put_object(Bucket=S3_BUCKET_NAME, Key=cache_key, ContentType="image/png", Body=img_data)
+    for rendition in renditions:
+        get_client('s3').put_object(
+            Bucket=S3_BUCKET_NAME,
+            Key=variant_key(cache_key, rendition["width"], rendition["format"]),
+            ContentType=rendition["content_type"],
+            Body=rendition["data"],
+        )
+
+    now = datetime.now().isoformat()
+    variants = [{"width": rendition["width"], "format": rendition["format"]} for rendition in renditions]
+    size = len(img_data) + sum(len(rendition["data"]) for rendition in renditions)
+    get_index().update_one(
+        {"_id": key},
+        {"$set": {"s3Key": cache_key, "variants": variants, "size": size, "lastUsed": now}, "$setOnInsert": {"created": now, "hits": 0}},
+        upsert=True
+    )
+    evict()
+    return cache_key
+
+
+# Drop the least recently used entries beyond IMAGE_CACHE_MAX_ENTRIES
+def evict():
+    index = get_index()
+    excess = index.estimated_document_count() - IMAGE_CACHE_MAX_ENTRIES
+    if excess <= 0:
+        return
+
+    stale = list(index.find({}, {"s3Key": 1, "variants": 1}).sort("lastUsed", ASCENDING).limit(excess))
+    if not stale:
+        return
+
+    index.delete_many({"_id": {"$in": [entry["_id"] for entry in stale]}})
+    keys = [key for entry in stale for key in [entry["s3Key"], *variant_keys(entry["s3Key"], entry.get("variants"))]]
+    try:
+        get_client('s3').delete_objects(
+            Bucket=S3_BUCKET_NAME,
+            Delete={"Objects": [{"Key": key} for key in keys], "Quiet": True}
+        )
+    except ClientError as e:
+        print(f"Failed to delete evicted image cache objects: {e}")
+    print(f"Evicted {len(stale)} image cache entries")
+
+
+def ensure_indexes():
+    get_index().create_index([("lastUsed", ASCENDING)])
@@ -0,0 +1,75 @@
+# src/utils/image_variants.py
+import io
+import os
+from dotenv import load_dotenv
+from PIL import Image, features
+
+load_dotenv()
+# Widths of the downscaled renditions stored next to each highlight's original PNG
+IMAGE_VARIANT_WIDTHS = sorted(int(width) for width in os.getenv("IMAGE_VARIANT_WIDTHS", "256,512,1024").split(","))
+IMAGE_VARIANT_QUALITY = int(os.getenv("IMAGE_VARIANT_QUALITY", "80"))
+# AVIF renditions are smaller still but slower to encode, and need Pillow built with libavif
+IMAGE_VARIANT_AVIF = os.getenv("IMAGE_VARIANT_AVIF", "false").lower() == "true"
+
+CONTENT_TYPES = {"webp": "image/webp", "avif": "image/avif"}
+
+
+def variant_formats() -> list:
+    formats = ["webp"]
+    if IMAGE_VARIANT_AVIF and features.check("avif"):
+        formats.append("avif")
+    return formats
+
+
+# {owner}/{book}/images/{highlight}.png -> {owner}/{book}/images/{highlight}_512w.webp
+def variant_key(s3_key: str, width: int, fmt: str) -> str:
+    return f"{s3_key.rsplit('.', 1)[0]}_{width}w.{fmt}"
+
+
+def variant_keys(s3_key: str, variants: list | None) -> list:
+    return [variant_key(s3_key, variant["width"], variant["format"]) for variant in variants or []]
+
+
+# Encode the image at every configured width (never upscaling) in every enabled format.
+# Returns [{"width", "format", "content_type", "data"}].
+def render_variants(img_data: bytes) -> list:
+    renditions = []
+    with Image.open(io.BytesIO(img_data)) as img:
+        img = img.convert("RGB")
+        widths = sorted({min(width, img.width) for width in IMAGE_VARIANT_WIDTHS})
+        for width in widths:
+            height = round(img.height * width / img.width)
+            resized = img if width == img.width else img.resize((width, height), Image.LANCZOS)
+            for fmt in variant_formats():
+                buffer = io.BytesIO()
+                resized.save(buffer, format=fmt.upper(), quality=IMAGE_VARIANT_QUALITY)
+                renditions.append({
+                    "width": width,
+                    "format": fmt,
+                    "content_type": CONTENT_TYPES[fmt],
+                    "data": buffer.getvalue(),
+                })
+    return renditions
+
+
+def _accepts(accept: str | None, fmt: str) -> bool:
+    if fmt == "avif":
+        # Only serve AVIF to clients that ask for it explicitly
+        return accept is not None and "image/avif" in accept
+    return accept is None or any(mime in accept for mime in (CONTENT_TYPES[fmt], "image/*", "*/*"))
+
+
+# Pick the smallest acceptable variant at least `width` wide (the largest if none is wide enough),
+# preferring AVIF over WebP at the same width. Returns None when no variant fits the Accept header.
+def best_variant(variants: list | None, width: int | None, accept: str | None) -> dict | None:
+    candidates = [variant for variant in variants or [] if _accepts(accept, variant["format"])]
+    if not candidates:
+        return None
+
+    preference = {"avif": 0, "webp": 1}
+    candidates.sort(key=lambda variant: (variant["width"], preference.get(variant["format"], 2)))
+    if width:
+        for variant in candidates:
+            if variant["width"] >= width:
+                return variant
+    return max(candidates, key=lambda variant: (variant["width"], -preference.get(variant["format"], 2)))
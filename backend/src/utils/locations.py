@@ -0,0 +1,98 @@
+# src/utils/locations.py
+import re
+
+# Highlight locations are EPUB CFIs (epubcfi(/6/4!/4/2,/1:0,/1:12) for a range)
+# or PDF page numbers. location_key() turns them into strings that sort in
+# reading order, so highlights can be listed and range-queried on an index:
+#   epubcfi(/6/4[ch1]!/4/2/1:3)  ->  c.000006.000004.000004.000002.000001.000003
+#   page 12                       ->  p.000012
+# Every CFI step (and the final character offset) is a fixed-width number, so
+# comparing keys as strings compares the steps as numbers, and a position always
+# sorts before the positions inside it. Locations that can't be parsed sort last.
+STEP_WIDTH = 6
+CFI_PATTERN = re.compile(r"^epubcfi\((.*)\)$", re.DOTALL)
+PAGE_PATTERN = re.compile(r"^(?:page[:= ]?)?(\d+)$", re.IGNORECASE)
+# Greater than every character used in keys, to build "everything under this prefix" bounds
+KEY_END = "~"
+
+
+def _number(value: int) -> str:
+    return str(min(value, 10 ** STEP_WIDTH - 1)).zfill(STEP_WIDTH)
+
+
+# Split a CFI on its top-level commas (parent path, range start, range end)
+def _cfi_parts(body: str) -> list:
+    parts, depth, current = [], 0, ""
+    for char in body:
+        if char == "[":
+            depth += 1
+        elif char == "]":
+            depth = max(depth - 1, 0)
+        if char == "," and depth == 0:
+            parts.append(current)
+            current = ""
+        else:
+            current += char
+    parts.append(current)
+    return parts
+
+
+# Steps and character offset of the start of a CFI (or CFI range); None if it isn't one
+def parse_cfi(location: str) -> tuple | None:
+    match = CFI_PATTERN.match(location.strip())
+    if not match:
+        return None
+
+    parts = _cfi_parts(match.group(1))
+    path = parts[0] + (parts[1] if len(parts) > 1 else "")
+    # Drop id assertions ([chap01ref]) and parameters (;s=b)
+    path = re.sub(r"\[[^\]]*\]", "", path)
+    path = path.split(";", 1)[0]
+
+    # Temporal (~) and spatial (@x:y) offsets are not positions in the text
+    path = re.split(r"[~@]", path, maxsplit=1)[0]
+    offset_match = re.search(r":(\d+)", path)
+    offset = int(offset_match.group(1)) if offset_match else None
+    path = path.split(":", 1)[0]
+
+    try:
+        steps = [int(step) for step in re.split(r"[/!]", path) if step]
+    except ValueError:
+        return None
+    if not steps:
+        return None
+    return steps, offset
+
+
+def location_key(location: str | None) -> str:
+    if not location:
+        return "z."
+
+    parsed = parse_cfi(location)
+    if parsed:
+        steps, offset = parsed
+        numbers = steps + ([offset] if offset is not None else [])
+        return "c." + ".".join(_number(number) for number in numbers)
+
+    page = PAGE_PATTERN.match(location.strip())
+    if page:
+        return "p." + _number(int(page.group(1)))
+    return "z." + location
+
+
+# Bounds [lower, upper) of the keys of every location in an EPUB spine item, given
+# the chapter's entry in the book's spine (see utils/epub.read_spine). Entries saved
+# before they recorded cfiSteps assume the usual layout: the spine is the package's
+# third child and every itemref is a chapter (/6/2 is the first).
+def chapter_key_range(chapter: int, entry: dict | None = None) -> tuple:
+    steps = (entry or {}).get("cfiSteps") or [6, (chapter + 1) * 2]
+    prefix = "c." + ".".join(_number(step) for step in steps)
+    return prefix, prefix + KEY_END
+
+
+# Bounds [lower, upper) of the keys from start to end, both inclusive. end includes
+# every position inside it, e.g. all of a paragraph or page.
+def location_key_range(start: str | None, end: str | None) -> tuple:
+    lower = location_key(start) if start else None
+    upper = location_key(end) + KEY_END if end else None
+    return lower, upper
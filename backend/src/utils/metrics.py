@@ -0,0 +1,163 @@
+# src/utils/metrics.py
+import os
+import time
+from contextlib import contextmanager
+from dotenv import load_dotenv
+from prometheus_client import CollectorRegistry, Counter, Gauge, Histogram, CONTENT_TYPE_LATEST, generate_latest, multiprocess
+from pymongo import monitoring
+
+load_dotenv()
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "true").lower() == "true"
+# Set by src.serve when several worker processes serve the app. Each worker writes its
+# metrics to files in this directory, and /metrics adds them up across the live workers.
+PROMETHEUS_MULTIPROC_DIR = os.getenv("PROMETHEUS_MULTIPROC_DIR")
+
+# Prometheus metrics, served at GET /metrics:
+#   http_*        every request, labelled by route template (/book/{book_id}), not raw path
+#   dependency_*  every outbound call: Cognito JWKS and userInfo, MongoDB commands,
+#                 AWS API calls (S3, Cognito admin) and the Hugging Face Space, whose
+#                 calls are split into time waiting in the Space's queue and inference
+#   *_depth       work waiting on the I/O executor and the job queues
+# Gauges are summed over live workers (multiprocess_mode); app_startup_seconds is per worker.
+
+# Dependency calls range from sub-millisecond Mongo lookups to minute-long renders
+DEPENDENCY_BUCKETS = (.001, .0025, .005, .01, .025, .05, .1, .25, .5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+
+http_requests = Counter(
+    "http_requests_total", "HTTP requests handled", ["method", "route", "status"]
+)
+http_errors = Counter(
+    "http_request_errors_total", "HTTP requests that failed with a 5xx or an unhandled exception", ["method", "route"]
+)
+http_duration = Histogram(
+    "http_request_duration_seconds", "Time to handle a request, until its last body chunk is sent", ["method", "route"]
+)
+http_in_flight = Gauge("http_requests_in_flight", "Requests being handled", multiprocess_mode="livesum")
+
+dependency_duration = Histogram(
+    "dependency_duration_seconds", "Duration of calls to external services",
+    ["dependency", "operation", "outcome"], buckets=DEPENDENCY_BUCKETS,
+)
+
+io_executor_pending = Gauge(
+    "io_executor_pending", "Blocking calls submitted to the I/O executor and not finished yet", multiprocess_mode="livesum"
+)
+io_executor_depth = Gauge(
+    "io_executor_queue_depth", "Blocking calls waiting for a free I/O executor thread", multiprocess_mode="livesum"
+)
+job_queue_depth = Gauge("job_queue_depth", "Jobs waiting for a worker", ["queue"], multiprocess_mode="livesum")
+jobs_running = Gauge("jobs_running", "Jobs being run by a worker", ["queue"], multiprocess_mode="livesum")
+app_startup_seconds = Gauge(
+    "app_startup_seconds", "Seconds from process start until the worker was serving, and until it was ready", ["phase"],
+    multiprocess_mode="liveall",
+)
+job_duration = Histogram(
+    "job_duration_seconds", "Duration of job attempts", ["queue", "type", "outcome"], buckets=DEPENDENCY_BUCKETS
+)
+
+
+def observe_dependency(dependency: str, operation: str, seconds: float, outcome: str = "ok"):
+    if METRICS_ENABLED:
+        dependency_duration.labels(dependency, operation, outcome).observe(seconds)
+
+
+# Time the block as one call to an external service. The outcome is "error" if it raises;
+# the block can also set call["outcome"] itself, e.g. for an unsuccessful HTTP status.
+@contextmanager
+def track_dependency(dependency: str, operation: str):
+    start = time.perf_counter()
+    call = {"outcome": None}
+    try:
+        yield call
+    except BaseException:
+        call["outcome"] = "error"
+        raise
+    finally:
+        observe_dependency(dependency, operation, time.perf_counter() - start, call["outcome"] or "ok")
+
+
+def metrics_response() -> tuple:
+    if PROMETHEUS_MULTIPROC_DIR:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry, PROMETHEUS_MULTIPROC_DIR)
+        return generate_latest(registry), CONTENT_TYPE_LATEST
+    return generate_latest(), CONTENT_TYPE_LATEST
+
+
+# Drop this worker's live gauges from the totals once it stops; its counters and
+# histograms stay, so totals don't go backwards when a worker is replaced
+def mark_worker_stopped():
+    if PROMETHEUS_MULTIPROC_DIR:
+        multiprocess.mark_process_dead(os.getpid(), PROMETHEUS_MULTIPROC_DIR)
+
+
+# ASGI middleware recording the http_* metrics. Routes are labelled with their path
+# template, found on the scope once the router has matched the request.
+class MetricsMiddleware:
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not METRICS_ENABLED:
+            await self.app(scope, receive, send)
+            return
+
+        start = time.perf_counter()
+        status_code = 500
+        http_in_flight.inc()
+
+        async def send_and_record(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_and_record)
+        except Exception:
+            status_code = 500
+            raise
+        finally:
+            http_in_flight.dec()
+            route = scope.get("route")
+            route = getattr(route, "path", None) or "unmatched"
+            method = scope["method"]
+            http_duration.labels(method, route).observe(time.perf_counter() - start)
+            http_requests.labels(method, route, str(status_code)).inc()
+            if status_code >= 500:
+                http_errors.labels(method, route).inc()
+
+
+# pymongo command listener: times every command (find, insert, update, aggregate, ...)
+# from the driver's own duration measurement
+class MongoCommandMetrics(monitoring.CommandListener):
+    def started(self, event):
+        pass
+
+    def succeeded(self, event):
+        observe_dependency("mongodb", event.command_name, event.duration_micros / 1e6)
+
+    def failed(self, event):
+        observe_dependency("mongodb", event.command_name, event.duration_micros / 1e6, "error")
+
+
+# botocore event hooks timing every API call of a client, retries included
+def _before_call(context, **kwargs):
+    context["metrics_start"] = time.perf_counter()
+
+
+def _after_call(event_name, context, http_response=None, exception=None, **kwargs):
+    start = context.pop("metrics_start", None)
+    if start is None:
+        return
+    # after-call.{service}.{operation} / after-call-error.{service}.{operation}
+    _, service, operation = event_name.split(".", 2)
+    failed = exception is not None or (http_response is not None and http_response.status_code >= 400)
+    observe_dependency(service, operation, time.perf_counter() - start, "error" if failed else "ok")
+
+
+def instrument_boto_client(client):
+    events = client.meta.events
+    events.register("before-call.*.*", _before_call)
+    events.register("after-call.*.*", _after_call)
+    events.register("after-call-error.*.*", _after_call)
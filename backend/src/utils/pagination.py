@@ -0,0 +1,96 @@
+# src/utils/pagination.py
+import base64
+import json
+from fastapi import HTTPException, status
+from fastapi.responses import JSONResponse
+
+# Keyset pagination: a page is sorted on a fixed list of fields ending with _id,
+# and the cursor holds the sort values of the last item returned. The next page
+# starts strictly after them, so every page is an index range scan no matter how
+# deep into the listing it is. The cursor is handed back in the X-Next-Cursor
+# header so list responses stay plain JSON arrays.
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+
+
+def encode_cursor(values: list) -> str:
+    return base64.urlsafe_b64encode(json.dumps(values).encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str, size: int) -> list:
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+    except ValueError:
+        values = None
+    if not isinstance(values, list) or len(values) != size:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid cursor")
+    return values
+
+
+# Conditions on field matching the values that sort after value. MongoDB sorts null
+# (and missing) fields before everything else, but $gt/$lt only compare values of the
+# same type, so nulls need their own condition.
+def _after(field: str, direction: int, value) -> list:
+    if direction > 0:
+        return [{field: {"$ne": None}}] if value is None else [{field: {"$gt": value}}]
+    return [] if value is None else [{field: {"$lt": value}}, {field: None}]
+
+
+# Filter matching the items after the cursor for a sort like [("updated", -1), ("_id", -1)]:
+# (a > x) or (a == x and b > y) or ..., with > flipped to < on descending fields
+def keyset_filter(sort: list, cursor: str | None) -> dict:
+    if not cursor:
+        return {}
+
+    values = decode_cursor(cursor, len(sort))
+    clauses = []
+    for i, (field, direction) in enumerate(sort):
+        equal = {sort[j][0]: values[j] for j in range(i)}
+        clauses.extend({**equal, **condition} for condition in _after(field, direction, values[i]))
+    # Only possible when every sort value is null and the last sort is descending
+    if not clauses:
+        return {"_id": {"$in": []}}
+    return {"$or": clauses}
+
+
+# Projection for a comma separated ?fields= list, restricted to the allowed fields.
+# Without one, the summary fields are returned.
+def fields_projection(fields: str | None, summary: list, allowed: list) -> dict:
+    requested = [field.strip() for field in fields.split(",") if field.strip()] if fields else summary
+    unknown = [field for field in requested if field not in allowed]
+    if unknown:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Unknown fields: {', '.join(unknown)}. Allowed fields: {', '.join(allowed)}"
+        )
+    return {field: 1 for field in requested}
+
+
+# Fetch one page. limit + 1 items are read to learn whether there is a next page;
+# the sort fields are always read so the cursor can be built, then dropped if not requested.
+async def find_page(collection, query: dict, sort: list, projection: dict, limit: int, cursor: str | None) -> tuple:
+    keyset = keyset_filter(sort, cursor)
+    if keyset:
+        query = {"$and": [query, keyset]}
+
+    items = await collection.find(
+        query,
+        {**projection, **{field: 1 for field, _ in sort}},
+        sort=sort,
+        limit=limit + 1,
+    )
+
+    next_cursor = None
+    if len(items) > limit:
+        items = items[:limit]
+        next_cursor = encode_cursor([items[-1].get(field) for field, _ in sort])
+
+    for item in items:
+        for field, _ in sort:
+            if field not in projection:
+                item.pop(field, None)
+    return items, next_cursor
+
+
+def page_response(items: list, next_cursor: str | None) -> JSONResponse:
+    headers = {NEXT_CURSOR_HEADER: next_cursor} if next_cursor else None
+    return JSONResponse(content=items, headers=headers)
@@ -0,0 +1,79 @@
+# src/utils/ranges.py
+import mmap
+import re
+from fastapi import HTTPException
+
+RANGE_PATTERN = re.compile(r"^bytes=(\d*)-(\d*)$")
+CHUNK_SIZE = 256 * 1024
+
+
+# (start, end) inclusive for a single-range "bytes=..." header, or None to send the whole file.
+# Multiple ranges aren't supported and get the whole file too, which RFC 9110 allows.
+def parse_range(header: str | None, size: int) -> tuple | None:
+    if not header:
+        return None
+    match = RANGE_PATTERN.match(header.strip())
+    if not match or match.groups() == ("", ""):
+        return None
+
+    first, last = match.groups()
+    if first:
+        start = int(first)
+        end = min(int(last), size - 1) if last else size - 1
+    else:
+        # Suffix range: the last N bytes
+        start = max(size - int(last), 0)
+        end = size - 1
+
+    if start >= size or start > end:
+        raise HTTPException(
+            status_code=416,
+            detail="Requested range not satisfiable",
+            headers={"Content-Range": f"bytes */{size}"},
+        )
+    return start, end
+
+
+# Whether an If-None-Match header matches the ETag (weak comparison, as for GET)
+def etag_matches(header: str | None, etag: str) -> bool:
+    if not header:
+        return False
+    if header.strip() == "*":
+        return True
+    return any(tag.strip().removeprefix("W/") == etag for tag in header.split(","))
+
+
+# Whether an Accept-Encoding header accepts the content coding (RFC 9110 12.5.3): its own
+# entry's q-value if listed, else that of "*"; q=0 means "not acceptable". Entries with
+# a malformed q-value are ignored.
+def accepts_encoding(header: str | None, coding: str) -> bool:
+    weights = {}
+    for entry in (header or "").split(","):
+        name, *params = [part.strip() for part in entry.split(";")]
+        if not name:
+            continue
+        weight = 1.0
+        for param in params:
+            key, _, value = param.partition("=")
+            if key.strip().lower() == "q":
+                try:
+                    weight = float(value.strip())
+                except ValueError:
+                    weight = None
+        if weight is not None:
+            weights[name.lower()] = weight
+
+    weight = weights.get(coding, weights.get("*", 0))
+    return weight > 0
+
+
+# Bytes start..end (inclusive) of an open file, read through a memory map in CHUNK_SIZE
+# pieces; the file is closed once the iterator is exhausted or discarded. Meant for
+# StreamingResponse, which runs sync iterators on its thread pool.
+def mmap_chunks(file, start: int, end: int):
+    with file:
+        if end < start:
+            return
+        with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            for offset in range(start, end + 1, CHUNK_SIZE):
+                yield mapped[offset:min(offset + CHUNK_SIZE, end + 1)]
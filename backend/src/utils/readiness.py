@@ -0,0 +1,164 @@
+# src/utils/readiness.py
+import asyncio
+import os
+import time
+import pymongo
+from dotenv import load_dotenv
+
+from ..database.executor import run_blocking
+from ..database.mongodb import get_mongo_client
+from .aws import get_client
+from .metrics import app_startup_seconds
+
+load_dotenv()
+S3_BUCKET_NAME = os.getenv("S3_BUCKET_NAME")
+# Dependencies GET /readyz checks on every call, from: mongodb, s3
+READINESS_CHECKS = [check for check in os.getenv("READINESS_CHECKS", "mongodb,s3").split(",") if check]
+# Seconds each readiness check may take before it counts as failed
+READINESS_CHECK_TIMEOUT = float(os.getenv("READINESS_CHECK_TIMEOUT", "2"))
+# Failed startup steps (e.g. MongoDB still starting) are retried, waiting this long
+# at first and twice as long after every failure, up to STARTUP_RETRY_MAX_DELAY
+STARTUP_RETRY_DELAY = float(os.getenv("STARTUP_RETRY_DELAY", "1"))
+STARTUP_RETRY_MAX_DELAY = float(os.getenv("STARTUP_RETRY_MAX_DELAY", "30"))
+# A worker that takes longer than this from process start to serving requests logs a warning
+WORKER_BOOT_TARGET_SECONDS = float(os.getenv("WORKER_BOOT_TARGET_SECONDS", "5"))
+
+# Liveness and readiness are separate:
+#   GET /healthcheck  the process is up and serving; never touches a dependency
+#   GET /readyz       startup steps (indexes, resuming jobs) are done and MongoDB and S3
+#                     answer, so the worker can take traffic
+# Startup steps run in the background after the app starts serving. Required steps are
+# retried until they succeed and gate readiness; optional ones (warm-ups) run once after.
+
+
+PROCESS_IMPORTED = time.monotonic()
+
+
+# Seconds since the process started, so boot time includes interpreter start and imports
+def process_age() -> float:
+    try:
+        with open("/proc/self/stat") as file:
+            # Field 22, start time in clock ticks after boot; the command name may contain spaces
+            start_ticks = int(file.read().rsplit(")", 1)[1].split()[19])
+        return time.clock_gettime(time.CLOCK_BOOTTIME) - start_ticks / os.sysconf("SC_CLK_TCK")
+    except (OSError, ValueError, IndexError, AttributeError):
+        return time.monotonic() - PROCESS_IMPORTED
+
+
+class Startup:
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.required = []
+        self.optional = []
+        self.pending = []
+        self.errors = {}
+        self.serving_seconds = None
+        self.ready_seconds = None
+
+    # step is a coroutine function taking no arguments
+    def add(self, name: str, step, required: bool = True):
+        (self.required if required else self.optional).append((name, step))
+
+    @property
+    def ready(self) -> bool:
+        return self.ready_seconds is not None
+
+    def mark_serving(self):
+        self.serving_seconds = process_age()
+        app_startup_seconds.labels("serving").set(self.serving_seconds)
+        print(f"Worker {os.getpid()} serving {self.serving_seconds:.2f}s after process start")
+        if self.serving_seconds > WORKER_BOOT_TARGET_SECONDS:
+            print(f"Worker boot took longer than WORKER_BOOT_TARGET_SECONDS ({WORKER_BOOT_TARGET_SECONDS}s)")
+
+    async def run(self):
+        self.pending = [name for name, _ in self.required]
+        for name, step in self.required:
+            await self._run_required(name, step)
+            self.pending.remove(name)
+
+        self.ready_seconds = process_age()
+        app_startup_seconds.labels("ready").set(self.ready_seconds)
+        print(f"Worker {os.getpid()} ready {self.ready_seconds:.2f}s after process start")
+
+        for name, step in self.optional:
+            try:
+                await step()
+            except Exception as e:
+                print(f"Startup step {name} failed: {e}")
+
+    async def _run_required(self, name: str, step):
+        delay = STARTUP_RETRY_DELAY
+        while True:
+            try:
+                await step()
+                self.errors.pop(name, None)
+                return
+            except Exception as e:
+                self.errors[name] = str(e)
+                print(f"Startup step {name} failed, retrying in {delay:.0f}s: {e}")
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, STARTUP_RETRY_MAX_DELAY)
+
+    def status(self) -> dict:
+        return {
+            "pending": list(self.pending),
+            "errors": dict(self.errors),
+            "servingSeconds": self.serving_seconds and round(self.serving_seconds, 3),
+            "readySeconds": self.ready_seconds and round(self.ready_seconds, 3),
+        }
+
+
+startup = Startup()
+
+
+def ping_mongodb():
+    # Bounds server selection too, so a down server fails the check quickly
+    with pymongo.timeout(READINESS_CHECK_TIMEOUT):
+        get_mongo_client().admin.command("ping")
+
+
+def head_bucket():
+    get_client("s3").head_bucket(Bucket=S3_BUCKET_NAME)
+
+
+CHECKS = {
+    "mongodb": ping_mongodb,
+    "s3": head_bucket,
+}
+
+
+# Probes arrive every few seconds from every load balancer. While a check's call is
+# still running (e.g. against a dependency that hangs), later probes wait on that
+# same call instead of piling more blocked threads onto the I/O executor.
+_running: dict = {}
+
+
+def _retrieve(task):
+    # Mark the outcome as seen even if every probe waiting for it has timed out
+    if not task.cancelled():
+        task.exception()
+
+
+async def _check(name: str) -> dict:
+    task = _running.get(name)
+    if task is None or task.done():
+        task = _running[name] = asyncio.ensure_future(run_blocking(CHECKS[name]))
+        task.add_done_callback(_retrieve)
+
+    start = time.perf_counter()
+    try:
+        await asyncio.wait_for(asyncio.shield(task), READINESS_CHECK_TIMEOUT)
+        result = {"ok": True}
+    except asyncio.TimeoutError:
+        result = {"ok": False, "error": f"no answer within {READINESS_CHECK_TIMEOUT}s"}
+    except Exception as e:
+        result = {"ok": False, "error": str(e)}
+    result["ms"] = round((time.perf_counter() - start) * 1000, 1)
+    return result
+
+
+async def check_dependencies() -> dict:
+    results = await asyncio.gather(*(_check(name) for name in READINESS_CHECKS))
+    return dict(zip(READINESS_CHECKS, results))
@@ -0,0 +1,342 @@
+# src/utils/search.py
+import gzip
+import mmap
+import os
+import re
+import threading
+import unicodedata
+import zipfile
+from functools import lru_cache
+from typing import BinaryIO
+from html.parser import HTMLParser
+from dotenv import load_dotenv
+from pymongo import ASCENDING, TEXT, UpdateOne
+import pymupdf
+import snowballstemmer
+
+from ..database.mongodb import get_db, AsyncCollection
+from ..database.s3_db import read_file_data
+from .chapters import chapter_key
+from .epub import MEMBER_ERRORS, EpubError, read_spine
+
+load_dotenv()
+MONGODB_SEARCH_COLLECTION = os.getenv("MONGODB_SEARCH_COLLECTION", "search")
+# Book text is indexed in passages of about this many characters
+SEARCH_PASSAGE_SIZE = int(os.getenv("SEARCH_PASSAGE_SIZE", "1000"))
+SEARCH_SNIPPET_SIZE = int(os.getenv("SEARCH_SNIPPET_SIZE", "160"))
+INSERT_BATCH_SIZE = 500
+
+# Full-text search over book contents and highlights.
+# Every passage of a book (a slice of one chapter, or one PDF page) and every
+# highlight is a document in MONGODB_SEARCH_COLLECTION:
+#   { _id, ownerId, bookId, kind: "book" | "highlight", chapter, offset, text, highlightId }
+# A text index led by ownerId serves as the inverted index, so a query only
+# scans the index entries of the user's own documents. It lives in MongoDB,
+# is updated incrementally as books and highlights come and go, and survives restarts.
+
+# How the english text index sees text: words are runs of letters and digits, compared
+# without case or diacritics; stop words are left out and the rest are stemmed with
+# the Snowball English stemmer. Snippets find their matches the same way.
+WORD = re.compile(r"[^\W_]+")
+STOP_WORDS = frozenset("""
+    a about above after again against all am an and any are as at be because been before being
+    below between both but by can cannot could did do does doing down during each few for from
+    further had has have having he her here hers herself him himself his how i if in into is it
+    its itself let me more most my myself no nor not of off on once only or other ought our ours
+    ourselves out over own same she should so some such than that the their theirs them
+    themselves then there these they this those through to too under until up very was we were
+    what when where which while who whom why with would you your yours yourself yourselves
+""".split())
+_stemmers = threading.local()
+
+
+def fold(word: str) -> str:
+    if word.isascii():
+        return word.lower()
+    return "".join(c for c in unicodedata.normalize("NFKD", word) if not unicodedata.combining(c)).casefold()
+
+
+# Stem of a folded word. Stemmer objects keep state between calls, so each thread has its own.
+@lru_cache(maxsize=65536)
+def stem(word: str) -> str:
+    stemmer = getattr(_stemmers, "english", None)
+    if stemmer is None:
+        stemmer = _stemmers.english = snowballstemmer.stemmer("english")
+    return stemmer.stemWord(word)
+
+
+def get_passages() -> AsyncCollection:
+    return AsyncCollection(get_db()[MONGODB_SEARCH_COLLECTION])
+
+
+def ensure_indexes():
+    collection = get_db()[MONGODB_SEARCH_COLLECTION]
+    collection.create_index([("ownerId", ASCENDING), ("text", TEXT)], default_language="english")
+    collection.create_index([("ownerId", ASCENDING), ("bookId", ASCENDING)])
+
+
+# Visible text of an (X)HTML chapter; script and style contents are skipped
+class TextExtractor(HTMLParser):
+    SKIPPED = {"script", "style", "head"}
+    BLOCKS = {"p", "div", "br", "li", "h1", "h2", "h3", "h4", "h5", "h6", "tr", "blockquote", "section"}
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.parts = []
+        self.skipping = 0
+
+    def handle_starttag(self, tag, attrs):
+        if tag in self.SKIPPED:
+            self.skipping += 1
+        elif tag in self.BLOCKS:
+            self.parts.append("\n")
+
+    def handle_endtag(self, tag):
+        if tag in self.SKIPPED and self.skipping:
+            self.skipping -= 1
+
+    def handle_data(self, data):
+        if not self.skipping:
+            self.parts.append(data)
+
+    def text(self) -> str:
+        return re.sub(r"[ \t\r\f\v]+", " ", re.sub(r"\s*\n\s*", "\n", "".join(self.parts))).strip()
+
+
+def html_text(data: bytes) -> str:
+    parser = TextExtractor()
+    parser.feed(data.decode("utf-8", errors="replace"))
+    parser.close()
+    return parser.text()
+
+
+# Split text into passages of about SEARCH_PASSAGE_SIZE characters at whitespace.
+# Yields (offset of the passage in the text, passage).
+def split_passages(text: str):
+    start = 0
+    while start < len(text):
+        end = min(start + SEARCH_PASSAGE_SIZE, len(text))
+        if end < len(text):
+            # Cut at the last whitespace in the second half of the passage, if there is one
+            cut = max(text.rfind(" ", start + SEARCH_PASSAGE_SIZE // 2, end), text.rfind("\n", start + SEARCH_PASSAGE_SIZE // 2, end))
+            if cut > start:
+                end = cut
+        yield start, text[start:end]
+        start = end
+        while start < len(text) and text[start].isspace():
+            start += 1
+
+
+# Text of each chapter of an open book file: spine items of an EPUB, pages of a PDF
+def book_chapters(file: BinaryIO, book_type: str):
+    try:
+        file.seek(0)
+        archive = zipfile.ZipFile(file)
+        chapters = read_spine(archive)["chapters"]
+    except (zipfile.BadZipFile, EpubError) as e:
+        if book_type != "application/pdf":
+            print(f"Falling back to pymupdf for book text: {e}")
+    else:
+        with archive:
+            for chapter in chapters:
+                if chapter["mediaType"] not in ("application/xhtml+xml", "text/html"):
+                    continue
+                try:
+                    yield chapter["index"], html_text(archive.read(chapter["path"]))
+                except KeyError:
+                    print(f"Skipping missing chapter {chapter['path']}")
+                except MEMBER_ERRORS as e:
+                    print(f"Skipping unreadable chapter {chapter['path']}: {e}")
+        return
+
+    with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as mapped, memoryview(mapped) as view:
+        doc = pymupdf.open(stream=view, filetype=book_type)
+        try:
+            for number, page in enumerate(doc):
+                yield number, page.get_text()
+        finally:
+            doc.close()
+
+
+# Text of each chapter of an EPUB whose chapters are stored separately (see utils/chapters.py),
+# read from those small chapter objects rather than the whole book file
+def stored_chapters(owner_id: str, book_id: str, spine: dict):
+    for chapter in spine["chapters"]:
+        if chapter["mediaType"] not in ("application/xhtml+xml", "text/html"):
+            continue
+        compressed = read_file_data(chapter_key(owner_id, book_id, chapter["index"]))
+        if compressed is None:
+            raise RuntimeError(f"Failed to read chapter {chapter['index']} of {book_id}")
+        yield chapter["index"], html_text(gzip.decompress(compressed))
+
+
+# Search documents of every passage of the (chapter number, text) pairs of a book
+def passage_documents(owner_id: str, book_id: str, chapters):
+    for chapter, text in chapters:
+        for number, (offset, passage) in enumerate(split_passages(text)):
+            yield {
+                "_id": f"{owner_id}:{book_id}:{chapter}:{number}",
+                "ownerId": owner_id,
+                "bookId": book_id,
+                "kind": "book",
+                "chapter": chapter,
+                "offset": offset,
+                "text": passage,
+            }
+
+
+# (Re)index the text of a book, given as (chapter number, text) pairs (see book_chapters
+# and stored_chapters); returns the number of passages
+def index_book(owner_id: str, book_id: str, chapters) -> int:
+    collection = get_db()[MONGODB_SEARCH_COLLECTION]
+    collection.delete_many({"ownerId": owner_id, "bookId": book_id, "kind": "book"})
+
+    count = 0
+    batch = []
+    for document in passage_documents(owner_id, book_id, chapters):
+        batch.append(document)
+        if len(batch) >= INSERT_BATCH_SIZE:
+            collection.insert_many(batch, ordered=False)
+            count += len(batch)
+            batch = []
+    if batch:
+        collection.insert_many(batch, ordered=False)
+        count += len(batch)
+    return count
+
+
+# Highlight ids are only unique within a book, so the _id includes the owner and book
+def highlight_update(owner_id: str, book_id: str, highlight_id: str, text: str) -> UpdateOne:
+    return UpdateOne(
+        {"_id": f"highlight:{owner_id}:{book_id}:{highlight_id}"},
+        {"$set": {
+            "ownerId": owner_id,
+            "bookId": book_id,
+            "kind": "highlight",
+            "highlightId": highlight_id,
+            "offset": 0,
+            "text": text,
+        }},
+        upsert=True,
+    )
+
+
+async def index_highlight(owner_id: str, book_id: str, highlight_id: str, text: str):
+    await index_highlights(owner_id, book_id, [(highlight_id, text)])
+
+
+# Index (highlight id, text) pairs of one book in a single bulk write
+async def index_highlights(owner_id: str, book_id: str, highlights: list):
+    if highlights:
+        await get_passages().bulk_write(
+            [highlight_update(owner_id, book_id, highlight_id, text) for highlight_id, text in highlights], ordered=False
+        )
+
+
+# Matched by fields rather than _id, so entries saved under the older highlight:{id} _id go too
+async def unindex_highlight(owner_id: str, book_id: str, highlight_id: str):
+    await get_passages().delete_many({"ownerId": owner_id, "bookId": book_id, "kind": "highlight", "highlightId": highlight_id})
+
+
+async def unindex_book(owner_id: str, book_id: str):
+    await get_passages().delete_many({"ownerId": owner_id, "bookId": book_id})
+
+
+async def unindex_owner(owner_id: str):
+    await get_passages().delete_many({"ownerId": owner_id})
+
+
+# What a $text query matches: the stems of its words, and its phrases as folded words
+# (phrases match exactly, without stemming). Negated words and phrases (-word,
+# -"some phrase") only exclude documents, and stop words match nothing.
+def query_terms(query: str) -> dict:
+    phrases = []
+    for negated, phrase in re.findall(r'(-?)"([^"]*)"', query):
+        words = tuple(fold(word) for word in WORD.findall(phrase))
+        if words and not negated:
+            phrases.append(words)
+
+    stems = set()
+    for term in re.sub(r'-?"[^"]*"', " ", query).split():
+        if term.startswith("-"):
+            continue
+        for word in WORD.findall(term):
+            word = fold(word)
+            if word not in STOP_WORDS:
+                stems.add(stem(word))
+    return {"stems": stems, "phrases": phrases}
+
+
+# [start, end) offsets of the words and phrases of the query in the text, in order,
+# with overlapping matches (a word inside a matched phrase) merged
+def find_matches(text: str, terms: dict) -> list:
+    words = [(match.start(), match.end(), fold(match.group())) for match in WORD.finditer(text)]
+    matches = []
+    if terms["stems"]:
+        matches = [(start, end) for start, end, word in words if word not in STOP_WORDS and stem(word) in terms["stems"]]
+    for phrase in terms["phrases"]:
+        length = len(phrase)
+        for i in range(len(words) - length + 1):
+            if words[i][2] == phrase[0] and all(words[i + j][2] == phrase[j] for j in range(1, length)):
+                matches.append((words[i][0], words[i + length - 1][1]))
+    matches.sort()
+
+    merged = []
+    for start, end in matches:
+        if merged and start < merged[-1][1]:
+            merged[-1] = (merged[-1][0], max(end, merged[-1][1]))
+        else:
+            merged.append((start, end))
+    return merged
+
+
+# Window of the passage around its first match, with the [start, end) offsets of
+# every match inside the snippet. offset is where the snippet starts in the passage.
+def snippet(text: str, terms: dict) -> dict:
+    matches = find_matches(text, terms)
+
+    first = matches[0][0] if matches else 0
+    start = max(0, min(first - SEARCH_SNIPPET_SIZE // 4, len(text) - SEARCH_SNIPPET_SIZE))
+    if start > 0:
+        space = text.find(" ", start, first)
+        start = space + 1 if space != -1 else start
+    end = min(len(text), start + SEARCH_SNIPPET_SIZE)
+    return {
+        "snippet": text[start:end],
+        "offset": start,
+        "matches": [[s - start, e - start] for s, e in matches if s >= start and e <= end],
+    }
+
+
+# One page of results, best match first. Returns the results and whether there are more.
+async def search(owner_id: str, query: str, book_id: str | None, kind: str | None, skip: int, limit: int) -> tuple:
+    criteria = {"ownerId": owner_id, "$text": {"$search": query}}
+    if book_id:
+        criteria["bookId"] = book_id
+    if kind:
+        criteria["kind"] = kind
+
+    documents = await get_passages().find(
+        criteria,
+        {"score": {"$meta": "textScore"}, "bookId": 1, "kind": 1, "chapter": 1, "offset": 1, "highlightId": 1, "text": 1},
+        sort=[("score", {"$meta": "textScore"})],
+        skip=skip,
+        limit=limit + 1,
+    )
+
+    terms = query_terms(query)
+    results = []
+    for document in documents[:limit]:
+        found = snippet(document["text"], terms)
+        results.append({
+            "kind": document["kind"],
+            "bookId": document["bookId"],
+            "chapter": document.get("chapter"),
+            "highlightId": document.get("highlightId"),
+            "score": round(document["score"], 4),
+            "snippet": found["snippet"],
+            "matches": found["matches"],
+            # Offset of the snippet in the chapter's text
+            "offset": document.get("offset", 0) + found["offset"],
+        })
+    return results, len(documents) > limit
@@ -1,23 +1,100 @@
-# src/routes/text2image.py
+# src/utils/text2image.py
+import hashlib
 import io
 import os
-import boto3
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from types import SimpleNamespace
 from gradio_client import Client
+from gradio_client.utils import Status
 from botocore.exceptions import NoCredentialsError
 from dotenv import load_dotenv
 from PIL import Image
 
+from . import image_cache
+from .aws import get_client
+from .image_variants import render_variants, variant_key
+from .metrics import observe_dependency, track_dependency
+from .tracing import span, start_span, traced
+
 load_dotenv()
 hf_api_token = os.getenv("HF_API_TOKEN")
 hf_space = os.getenv("HF_SPACE")
+# Set HF_SPACE_STUB=true to render placeholder images locally instead of calling the Space
+HF_SPACE_STUB = os.getenv("HF_SPACE_STUB", "false").lower() == "true"
+HF_STUB_LATENCY = float(os.getenv("HF_STUB_LATENCY", "2"))
+# Renders the stub runs at once, like the Space's GPU slots; calls beyond that wait in its queue
+HF_STUB_CONCURRENCY = int(os.getenv("HF_STUB_CONCURRENCY", "4"))
+# How often a submitted call is checked for having left the Space's queue
+HF_STATUS_POLL_INTERVAL = float(os.getenv("HF_STATUS_POLL_INTERVAL", "0.1"))
+# Generation profiles: a quick low-resolution draft, and the full-quality final render
+IMAGE_DRAFT_SIZE = int(os.getenv("IMAGE_DRAFT_SIZE", "512"))
+IMAGE_DRAFT_STEPS = int(os.getenv("IMAGE_DRAFT_STEPS", "8"))
+IMAGE_FINAL_SIZE = int(os.getenv("IMAGE_FINAL_SIZE", "1024"))
+IMAGE_FINAL_STEPS = int(os.getenv("IMAGE_FINAL_STEPS", "40"))
 
 # AWS S3 Configuration
 S3_BUCKET_NAME = os.getenv("S3_BUCKET_NAME")
 AWS_REGION = os.getenv("COGNITO_REGION")
-s3_client = boto3.client('s3', region_name=os.getenv(AWS_REGION))
 
-# Initialize the Hugging Face Space client
-client = Client(hf_space, hf_api_token)
+
+# Stand-in for the Gradio Space client used for local development and benchmarks.
+# It waits HF_STUB_LATENCY seconds and returns a solid-colour .webp derived from the prompt,
+# in a temporary file that hugging_face_call removes once it has read it.
+class StubSpaceClient:
+    def __init__(self, latency: float = HF_STUB_LATENCY):
+        self.latency = latency
+        self._slots = ThreadPoolExecutor(max_workers=HF_STUB_CONCURRENCY, thread_name_prefix="hf-stub")
+
+    # Like Client.submit: returns a job whose status() goes IN_QUEUE -> PROCESSING -> FINISHED
+    def submit(self, *args, **kwargs):
+        return StubJob(self._slots.submit(self.predict, *args, **kwargs))
+
+    def predict(self, prompt: str, width: int = 1024, height: int = 1024, seed: int = 0, num_inference_steps: int = 40, **kwargs):
+        # Latency scales with the step count, like the real model
+        time.sleep(self.latency * num_inference_steps / 40)
+        color = tuple(hashlib.sha256(prompt.encode()).digest()[:3])
+        with tempfile.NamedTemporaryFile(suffix=".webp", delete=False) as tmp:
+            Image.new("RGB", (width, height), color).save(tmp, format="WEBP")
+        return tmp.name, seed
+
+
+class StubJob:
+    def __init__(self, future):
+        self.future = future
+
+    def done(self) -> bool:
+        return self.future.done()
+
+    def status(self):
+        if self.future.done():
+            return SimpleNamespace(code=Status.FINISHED)
+        return SimpleNamespace(code=Status.PROCESSING if self.future.running() else Status.IN_QUEUE)
+
+    def result(self, timeout: float | None = None):
+        return self.future.result(timeout)
+
+
+# Hugging Face Space client. Connecting fetches the Space's API description, so it
+# happens on first use (or in the startup warm-up), never at import, and a Space
+# that is asleep or down doesn't stop the server from starting.
+_space_client = None
+_space_client_lock = threading.Lock()
+
+
+def get_space_client():
+    global _space_client
+    if _space_client is None:
+        with _space_client_lock:
+            if _space_client is None:
+                if HF_SPACE_STUB:
+                    _space_client = StubSpaceClient()
+                else:
+                    with track_dependency("huggingface", "connect"), span("huggingface connect", "client"):
+                        _space_client = Client(hf_space, hf_api_token)
+    return _space_client
 
 default_negative_prompt = (
     "blurry, out of focus, low quality, pixelated, distorted, overly saturated, "
@@ -26,18 +103,52 @@ default_negative_prompt = (
     "grainy, noisy, cartoonish, text, watermark"
 )
 
-def hugging_face_call(prompt: str):
+# Everything besides the prompt that determines a render; part of the image cache key.
+# Highlights record the profile their current image was rendered with as imgProfile.
+GENERATION_PROFILES = {
+    "draft": {
+        "negative_prompt": default_negative_prompt,
+        "width": IMAGE_DRAFT_SIZE,
+        "height": IMAGE_DRAFT_SIZE,
+        "guidance_scale": 4.5,
+        "num_inference_steps": IMAGE_DRAFT_STEPS,
+    },
+    "final": {
+        "negative_prompt": default_negative_prompt,
+        "width": IMAGE_FINAL_SIZE,
+        "height": IMAGE_FINAL_SIZE,
+        "guidance_scale": 4.5,
+        "num_inference_steps": IMAGE_FINAL_STEPS,
+    },
+}
+
+# Job states of a Space call that has left the queue
+HF_STARTED_STATES = {Status.PROCESSING, Status.ITERATING, Status.PROGRESS, Status.FINISHED, Status.CANCELLED}
+
+# Submit a call to the Space and wait for its result. The wait is recorded in two parts:
+# time in the Space's queue (until the job starts processing) and inference time.
+def predict_timed(**kwargs):
+    space = get_space_client()
+    start = time.perf_counter()
+    queued = start_span("huggingface queue", "client")
+    job = space.submit(api_name="/infer", **kwargs)
+    while not job.done() and job.status().code not in HF_STARTED_STATES:
+        time.sleep(HF_STATUS_POLL_INTERVAL)
+    observe_dependency("huggingface", "queue", time.perf_counter() - start)
+    if queued is not None:
+        queued.end()
+
+    with track_dependency("huggingface", "inference"), span("huggingface inference", "client"):
+        return job.result()
+
+@traced("hugging_face_call")
+def hugging_face_call(prompt: str, profile: str = "final"):
      # Send prompt to Hugging Face Space and receive the result
-    result = client.predict(
+    result = predict_timed(
         prompt=prompt,
-        negative_prompt=default_negative_prompt,
         seed=0,
         randomize_seed=True,
-        width=1024,
-		height=1024,
-		guidance_scale=4.5,
-		num_inference_steps=40,
-        api_name="/infer"
+        **GENERATION_PROFILES[profile]
     )
 
     # Check if result is a file path and handle cases where it's a tuple
@@ -48,6 +159,16 @@ def hugging_face_call(prompt: str):
     else:
         raise ValueError(f"Unexpected response format or file not found. Response: {result}")
 
+    try:
+        return read_image(result_path)
+    finally:
+        if isinstance(get_space_client(), StubSpaceClient):
+            # The stub's renders are temporary files of ours; gradio_client manages its own downloads
+            os.remove(result_path)
+
+
+# Image data of a file returned by the Space
+def read_image(result_path: str) -> bytes:
     # Convert image to PNG if it’s a .webp file to ensure compatibility
     if result_path.endswith(".webp"):
         with Image.open(result_path) as img:
@@ -60,36 +181,82 @@ def hugging_face_call(prompt: str):
     with open(result_path, "rb") as img_file:
         return img_file.read()
 
-def generate_image(prompt: str, owner_id: str, highlight_id: str, book_id: str):
+# S3 key of a highlight's generated image. Image jobs render each generation to its own
+# key (version = job id), so a late render can never overwrite a newer image; the
+# unversioned key is where images generated before that live.
+def highlight_image_key(owner_id: str, book_id: str, highlight_id: str, version: str | None = None) -> str:
+    return f"{owner_id}/{book_id}/images/{highlight_id}{f'-{version}' if version else ''}.png"
+
+# Key of the image currently saved on a highlight document (imgKey, or the unversioned key)
+def current_image_key(owner_id: str, book_id: str, highlight_id: str, highlight: dict) -> str:
+    return highlight.get("imgKey") or highlight_image_key(owner_id, book_id, highlight_id)
 
-    img_data = hugging_face_call(prompt)
+# Public URL of an object in the bucket
+def image_url(s3_key: str) -> str:
+    return f"https://{S3_BUCKET_NAME}.s3.{AWS_REGION}.amazonaws.com/{s3_key}"
 
-    # Prepare file name and S3 path
-    file_name = f"{highlight_id}.png"
-    s3_key = f"{owner_id}/{book_id}/images/{file_name}"
+# Upload a render and its WebP/AVIF renditions next to each other
+def upload_image(s3_key: str, img_data: bytes, renditions: list):
+    get_client('s3').put_object(Bucket=S3_BUCKET_NAME, Key=s3_key, ContentType="image/png", Body=img_data)
+    for rendition in renditions:
+        get_client('s3').put_object(
+            Bucket=S3_BUCKET_NAME,
+            Key=variant_key(s3_key, rendition["width"], rendition["format"]),
+            ContentType=rendition["content_type"],
+            Body=rendition["data"],
+        )
 
-    # Upload the image data to S3 with public-read access
-    s3_client.upload_fileobj(io.BytesIO(img_data), S3_BUCKET_NAME, s3_key)
+# Render the prompt into s3_key, reusing a cached render of the same prompt and parameters.
+# With use_cache=False the Space is always called (the fresh render still replaces the cached one).
+# still_wanted, if given, is asked before copying a cached render and again once the Space
+# has answered; when it returns False nothing is uploaded and None is returned.
+# Returns the renditions stored next to the PNG as [{"width", "format"}].
+def render_to_s3(prompt: str, s3_key: str, use_cache: bool = True, profile: str = "final", still_wanted=None) -> list | None:
+    key = image_cache.generation_key(prompt, GENERATION_PROFILES[profile])
+    if image_cache.IMAGE_CACHE_ENABLED and use_cache:
+        if still_wanted and not still_wanted():
+            print(f"Skipping render for {s3_key}: no longer wanted")
+            return None
+        variants = image_cache.copy_cached(key, s3_key)
+        if variants is not None:
+            print(f"Reused cached image {key} for {s3_key}")
+            return variants
 
-    # Construct URL to access the uploaded image
-    return f"https://{S3_BUCKET_NAME}.s3.{AWS_REGION}.amazonaws.com/{s3_key}"
+    img_data = hugging_face_call(prompt, profile)
+    if still_wanted and not still_wanted():
+        print(f"Discarding render for {s3_key}: no longer wanted")
+        return None
+    renditions = render_variants(img_data)
+    if image_cache.IMAGE_CACHE_ENABLED:
+        cache_key = image_cache.store(key, img_data, renditions)
+        image_cache.copy_object(cache_key, s3_key, "image/png")
+        for rendition in renditions:
+            image_cache.copy_object(
+                variant_key(cache_key, rendition["width"], rendition["format"]),
+                variant_key(s3_key, rendition["width"], rendition["format"]),
+                rendition["content_type"],
+            )
+    else:
+        upload_image(s3_key, img_data, renditions)
 
+    return [{"width": rendition["width"], "format": rendition["format"]} for rendition in renditions]
 
-# Get the first image_id/name/s3_key
-# Get the same prompt
-# Generate the image with the same image_id/name/s3_key
-# Save in a way to overwrite the previous image --> In this way, I dont need to create a new url and delete the previous one.
+# URLs of the renditions returned by render_to_s3, as recorded on the highlight
+def variant_urls(s3_key: str, variants: list) -> list:
+    return [
+        {**variant, "url": image_url(variant_key(s3_key, variant["width"], variant["format"]))}
+        for variant in variants
+    ]
 
-def overwrite_image(prompt: str, s3_key: str):
-    img_data = hugging_face_call(prompt)
-    
+# Render the prompt into s3_key (see render_to_s3), logging why an upload failed.
+# Used by the image jobs, which render each generation to its own key.
+def overwrite_image(prompt: str, s3_key: str, use_cache: bool = True, profile: str = "final", still_wanted=None):
     try:
-        s3_client.put_object(
-            Bucket=S3_BUCKET_NAME,
-            Key=s3_key,
-            Body=io.BytesIO(img_data)
-        )
+        variants = render_to_s3(prompt, s3_key, use_cache, profile, still_wanted)
+        if variants is None:
+            return None
         print(f"File successfully overwritten at s3://{S3_BUCKET_NAME}/{s3_key}")
+        return variants
     except NoCredentialsError:
         print("Error: AWS credentials are missing or invalid.")
         raise
@@ -0,0 +1,510 @@
+# src/utils/tracing.py
+import contextvars
+import cProfile
+import functools
+import json
+import os
+import pstats
+import queue
+import random
+import re
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from dotenv import load_dotenv
+from pymongo import monitoring
+import requests
+
+load_dotenv()
+TRACING_ENABLED = os.getenv("TRACING_ENABLED", "false").lower() == "true"
+# Fraction of requests traced; requests with a sampled traceparent header, X-Trace: 1
+# or X-Profile: 1 are always traced
+TRACE_SAMPLE_RATE = float(os.getenv("TRACE_SAMPLE_RATE", "1.0"))
+# "file" appends spans as JSON lines to TRACE_FILE, "otlp" posts them to an OTLP/HTTP collector
+TRACE_EXPORTER = os.getenv("TRACE_EXPORTER", "file")
+TRACE_FILE = os.getenv("TRACE_FILE", "traces.jsonl")
+TRACE_OTLP_ENDPOINT = os.getenv("TRACE_OTLP_ENDPOINT", "http://localhost:4318/v1/traces")
+TRACE_SERVICE_NAME = os.getenv("TRACE_SERVICE_NAME", "wordvision-backend")
+TRACE_EXPORT_INTERVAL = float(os.getenv("TRACE_EXPORT_INTERVAL", "2"))
+TRACE_EXPORT_BATCH = int(os.getenv("TRACE_EXPORT_BATCH", "512"))
+# Profiling: a request is profiled when it has X-Profile: 1 or is picked at PROFILE_SAMPLE_RATE.
+# Sampled profiles are only kept for requests slower than PROFILE_MIN_SECONDS.
+PROFILE_SAMPLE_RATE = float(os.getenv("PROFILE_SAMPLE_RATE", "0"))
+PROFILE_MIN_SECONDS = float(os.getenv("PROFILE_MIN_SECONDS", "1"))
+PROFILE_DIR = os.getenv("PROFILE_DIR", os.path.join("/tmp", "wordvision-profiles"))
+PROFILE_MAX_FILES = int(os.getenv("PROFILE_MAX_FILES", "100"))
+
+TRACE_ID_HEADER = "X-Trace-Id"
+PROFILE_ID_HEADER = "X-Profile-Id"
+# version, trace id, parent span id and flags of a W3C traceparent header
+TRACEPARENT_FIELD = tuple(re.compile(f"[0-9a-f]{{{length}}}") for length in (2, 32, 16, 2))
+# Profile ids are generated by the server (uuid4 hex)
+PROFILE_ID = re.compile("[0-9a-f]{32}")
+
+# Opt-in request tracing. Each traced request gets a trace id (taken from an incoming
+# W3C traceparent header when there is one) and a root span; spans for auth, MongoDB
+# commands, AWS calls and Hugging Face calls nest under it through a context variable.
+# run_blocking copies the context onto executor threads, and jobs carry the trace of
+# the request that queued them. Finished spans are exported in batches by a
+# background thread, so tracing never waits on the collector.
+
+_current_span: contextvars.ContextVar = contextvars.ContextVar("current_span", default=None)
+
+
+class Span:
+    def __init__(self, name: str, trace_id: str, parent_id: str | None, kind: str, attributes: dict):
+        self.name = name
+        self.trace_id = trace_id
+        self.span_id = os.urandom(8).hex()
+        self.parent_id = parent_id
+        self.kind = kind
+        self.attributes = attributes
+        self.start_ns = time.time_ns()
+        self.end_ns = None
+        self.error = None
+
+    def set(self, key: str, value):
+        self.attributes[key] = value
+
+    def end(self, error: BaseException | str | None = None):
+        if self.end_ns is not None:
+            return
+        self.end_ns = time.time_ns()
+        if error is not None:
+            self.error = str(error) or type(error).__name__
+        exporter.submit(self)
+
+    def to_dict(self) -> dict:
+        return {
+            "traceId": self.trace_id,
+            "spanId": self.span_id,
+            "parentSpanId": self.parent_id,
+            "name": self.name,
+            "kind": self.kind,
+            "start": self.start_ns,
+            "end": self.end_ns,
+            "durationMs": round((self.end_ns - self.start_ns) / 1e6, 3),
+            "attributes": self.attributes,
+            "error": self.error,
+        }
+
+
+def current_span() -> Span | None:
+    return _current_span.get()
+
+
+# Child of the current span, or None when the current request isn't traced.
+# The caller ends it; it doesn't become the current span.
+def start_span(name: str, kind: str = "internal", **attributes) -> Span | None:
+    parent = _current_span.get()
+    if parent is None:
+        return None
+    return Span(name, parent.trace_id, parent.span_id, kind, attributes)
+
+
+# Run the block in a child span of the current one (a no-op when not tracing)
+@contextmanager
+def span(name: str, kind: str = "internal", **attributes):
+    child = start_span(name, kind, **attributes)
+    if child is None:
+        yield None
+        return
+
+    token = _current_span.set(child)
+    try:
+        yield child
+    except BaseException as e:
+        child.end(e)
+        raise
+    finally:
+        _current_span.reset(token)
+        child.end()
+
+
+# Decorator running every call of the function in a span
+def traced(name: str, kind: str = "internal"):
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with span(name, kind):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+# Start a new local root span, e.g. for a request or a job, continuing the trace in
+# traceparent if given (W3C format: 00-<trace id>-<parent span id>-<flags>)
+@contextmanager
+def root_span(name: str, traceparent: str | None = None, kind: str = "server", **attributes):
+    trace_id, parent_id = parse_traceparent(traceparent) or (os.urandom(16).hex(), None)
+    root = Span(name, trace_id, parent_id, kind, attributes)
+    token = _current_span.set(root)
+    try:
+        yield root
+    except BaseException as e:
+        root.end(e)
+        raise
+    finally:
+        _current_span.reset(token)
+        root.end()
+
+
+# Trace and span ids from a traceparent header, or None unless it follows the W3C rules
+# (lowercase hex, ids not all zeros). The ids end up in file names and responses, so
+# anything else starts a new trace instead.
+def parse_traceparent(header: str | None) -> tuple | None:
+    parts = (header or "").strip().split("-")
+    if len(parts) != 4 or not TRACEPARENT_FIELD[0].fullmatch(parts[0]) or parts[0] == "ff":
+        return None
+    for part, pattern in zip(parts[1:], TRACEPARENT_FIELD[1:]):
+        if not pattern.fullmatch(part) or not part.strip("0"):
+            return None
+    return parts[1], parts[2]
+
+
+def traceparent_sampled(header: str | None) -> bool:
+    parts = (header or "").strip().split("-")
+    return parse_traceparent(header) is not None and parts[3][-1:] in ("1", "3", "5", "7", "9", "b", "d", "f")
+
+
+# traceparent of the current span, to hand to work that continues the trace elsewhere
+def current_traceparent() -> str | None:
+    current = _current_span.get()
+    return current and f"00-{current.trace_id}-{current.span_id}-01"
+
+
+# Background exporter: spans are queued by the threads that end them and written in batches
+class SpanExporter:
+    def __init__(self):
+        self._queue: queue.Queue = queue.Queue(maxsize=TRACE_EXPORT_BATCH * 20)
+        self._thread = None
+        self._lock = threading.Lock()
+        self.dropped = 0
+
+    def submit(self, finished: Span):
+        self._ensure_thread()
+        try:
+            self._queue.put_nowait(finished)
+        except queue.Full:
+            self.dropped += 1
+
+    def _ensure_thread(self):
+        if self._thread is None:
+            with self._lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._run, name="trace-exporter", daemon=True)
+                    self._thread.start()
+
+    def _run(self):
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.monotonic() + TRACE_EXPORT_INTERVAL
+            while len(batch) < TRACE_EXPORT_BATCH:
+                try:
+                    batch.append(self._queue.get(timeout=max(deadline - time.monotonic(), 0)))
+                except queue.Empty:
+                    break
+            try:
+                self.export(batch)
+            except Exception as e:
+                print(f"Failed to export {len(batch)} spans: {e}")
+
+    # Export whatever is queued right away (used at shutdown)
+    def flush(self):
+        batch = []
+        while True:
+            try:
+                batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        if batch:
+            self.export(batch)
+
+    def export(self, batch: list):
+        if TRACE_EXPORTER == "otlp":
+            response = requests.post(TRACE_OTLP_ENDPOINT, json=otlp_payload(batch), timeout=10)
+            response.raise_for_status()
+        elif TRACE_EXPORTER == "file":
+            with open(TRACE_FILE, "a") as f:
+                for finished in batch:
+                    f.write(json.dumps(finished.to_dict(), default=str) + "\n")
+
+
+exporter = SpanExporter()
+
+OTLP_KINDS = {"internal": 1, "server": 2, "client": 3, "consumer": 5}
+
+
+def _otlp_value(value) -> dict:
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)}
+
+
+# OTLP/HTTP JSON request body (ExportTraceServiceRequest) for a batch of spans
+def otlp_payload(batch: list) -> dict:
+    spans = []
+    for finished in batch:
+        spans.append({
+            "traceId": finished.trace_id,
+            "spanId": finished.span_id,
+            **({"parentSpanId": finished.parent_id} if finished.parent_id else {}),
+            "name": finished.name,
+            "kind": OTLP_KINDS.get(finished.kind, 1),
+            "startTimeUnixNano": str(finished.start_ns),
+            "endTimeUnixNano": str(finished.end_ns),
+            "attributes": [{"key": key, "value": _otlp_value(value)} for key, value in finished.attributes.items()],
+            "status": {"code": 2, "message": finished.error} if finished.error else {"code": 1},
+        })
+    return {"resourceSpans": [{
+        "resource": {"attributes": [{"key": "service.name", "value": {"stringValue": TRACE_SERVICE_NAME}}]},
+        "scopeSpans": [{"scope": {"name": "wordvision"}, "spans": spans}],
+    }]}
+
+
+# pymongo command listener recording a client span per command of a traced request.
+# Events are delivered on the thread that runs the command, so the context is the caller's.
+class MongoCommandTracer(monitoring.CommandListener):
+    def __init__(self):
+        self._spans: dict = {}
+
+    def started(self, event):
+        started = start_span(
+            f"mongodb {event.command_name}", "client",
+            **{"db.system": "mongodb", "db.name": event.database_name, "db.operation": event.command_name},
+        )
+        if started is not None:
+            collection = event.command.get(event.command_name)
+            if isinstance(collection, str):
+                started.set("db.collection", collection)
+            self._spans[(event.connection_id, event.request_id)] = started
+
+    def succeeded(self, event):
+        finished = self._spans.pop((event.connection_id, event.request_id), None)
+        if finished is not None:
+            finished.end()
+
+    def failed(self, event):
+        finished = self._spans.pop((event.connection_id, event.request_id), None)
+        if finished is not None:
+            finished.end(event.failure.get("errmsg") if isinstance(event.failure, dict) else str(event.failure))
+
+
+# botocore event hooks recording a client span per AWS API call
+def _before_call(event_name, context, params=None, **kwargs):
+    _, service, operation = event_name.split(".", 2)
+    started = start_span(f"{service} {operation}", "client", **{"rpc.system": "aws-api", "rpc.service": service, "rpc.method": operation})
+    if started is not None:
+        if isinstance(params, dict) and isinstance(params.get("url_path"), str):
+            started.set("aws.path", params["url_path"])
+        context["trace_span"] = started
+
+
+def _after_call(context, http_response=None, exception=None, **kwargs):
+    started = context.pop("trace_span", None)
+    if started is None:
+        return
+    if http_response is not None:
+        started.set("http.status_code", http_response.status_code)
+    failed = exception or (http_response is not None and http_response.status_code >= 400 and f"HTTP {http_response.status_code}")
+    started.end(failed or None)
+
+
+def instrument_boto_client(client):
+    events = client.meta.events
+    events.register("before-call.*.*", _before_call)
+    events.register("after-call.*.*", _after_call)
+    events.register("after-call-error.*.*", _after_call)
+
+
+# Only one request is profiled at a time: cProfile profiles the whole event loop
+# thread, so concurrent profiles would each contain the others' work anyway
+_profile_lock = threading.Lock()
+
+
+# Profiles of the blocking calls a profiled request ran on executor threads. The event loop
+# profiler only sees the request waiting on them, so run_blocking profiles each call on its
+# own thread (the context, and so this variable, is copied there) and finish_profile merges
+# the profiles into the request's.
+class ThreadProfiles:
+    def __init__(self):
+        self.profilers = []
+        self.closed = False
+        self.lock = threading.Lock()
+
+    def add(self, profiler: cProfile.Profile):
+        with self.lock:
+            # Calls still running when the request finished (e.g. fire-and-forget work) are left out
+            if not self.closed:
+                self.profilers.append(profiler)
+
+    def close(self) -> list:
+        with self.lock:
+            self.closed = True
+            return self.profilers
+
+
+_thread_profiles: contextvars.ContextVar = contextvars.ContextVar("thread_profiles", default=None)
+
+
+# Run func, profiling it if it runs on behalf of a profiled request
+def profiled_call(func, *args, **kwargs):
+    thread_profiles = _thread_profiles.get()
+    if thread_profiles is None:
+        return func(*args, **kwargs)
+    profiler = cProfile.Profile()
+    try:
+        profiler.enable()
+    except ValueError:
+        return func(*args, **kwargs)
+    try:
+        return func(*args, **kwargs)
+    finally:
+        profiler.disable()
+        thread_profiles.add(profiler)
+
+
+def should_sample(rate: float) -> bool:
+    return rate > 0 and random.random() < rate
+
+
+def start_profile() -> cProfile.Profile | None:
+    if not _profile_lock.acquire(blocking=False):
+        return None
+    profiler = cProfile.Profile()
+    try:
+        profiler.enable()
+    except ValueError:
+        # Another profiler is already active on this thread
+        _profile_lock.release()
+        return None
+    return profiler
+
+
+# Stop the profiler and, if keep, save it merged with the request's executor thread
+# profiles as {PROFILE_DIR}/{profile_id}.prof, with a .json sidecar describing the
+# request (info). Returns the id of the saved profile or None.
+def finish_profile(profiler: cProfile.Profile, thread_profiles: ThreadProfiles, profile_id: str, keep: bool, info: dict) -> str | None:
+    try:
+        profiler.disable()
+    finally:
+        _profile_lock.release()
+    thread_profilers = thread_profiles.close()
+    if not keep:
+        return None
+
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    stats = pstats.Stats(profiler)
+    if thread_profilers:
+        stats.add(*thread_profilers)
+    stats.dump_stats(profile_path(profile_id))
+    with open(profile_path(profile_id, ".json"), "w") as f:
+        json.dump({"id": profile_id, "created": time.time(), "threadCalls": len(thread_profilers), **info}, f)
+    prune_profiles()
+    return profile_id
+
+
+# Raises ValueError for anything but a server-generated id, so a path can't leave PROFILE_DIR
+def profile_path(profile_id: str, suffix: str = ".prof") -> str:
+    if not PROFILE_ID.fullmatch(profile_id):
+        raise ValueError(f"Invalid profile id: {profile_id!r}")
+    return os.path.join(PROFILE_DIR, f"{profile_id}{suffix}")
+
+
+# Saved profiles, newest first: [{"id", "created", "threadCalls", "owner", "route", "status", "durationMs"}]
+def list_profiles() -> list:
+    if not os.path.isdir(PROFILE_DIR):
+        return []
+    profiles = []
+    for name in os.listdir(PROFILE_DIR):
+        if name.endswith(".json"):
+            try:
+                with open(os.path.join(PROFILE_DIR, name)) as f:
+                    profiles.append(json.load(f))
+            except (OSError, ValueError):
+                continue
+    return sorted(profiles, key=lambda profile: profile.get("created", 0), reverse=True)
+
+
+def get_profile(profile_id: str) -> dict | None:
+    try:
+        with open(profile_path(profile_id, ".json")) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def prune_profiles():
+    for profile in list_profiles()[PROFILE_MAX_FILES:]:
+        for suffix in (".prof", ".json"):
+            try:
+                os.remove(profile_path(profile["id"], suffix))
+            except (FileNotFoundError, ValueError):
+                pass
+
+
+# ASGI middleware: traces sampled requests and profiles the ones asking for it (or sampled).
+# The trace id is returned in X-Trace-Id, and the id of a kept profile in X-Profile-Id
+# (for header-triggered profiles) and on the root span as profile.id. X-Profile is only
+# honoured for requests that authenticated; other header-triggered profiles are discarded.
+class TracingMiddleware:
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not TRACING_ENABLED:
+            await self.app(scope, receive, send)
+            return
+
+        headers = {key.decode("latin-1").lower(): value.decode("latin-1") for key, value in scope["headers"]}
+        traceparent = headers.get("traceparent")
+        profile_requested = headers.get("x-profile") == "1"
+        if not (traceparent_sampled(traceparent) or profile_requested or headers.get("x-trace") == "1" or should_sample(TRACE_SAMPLE_RATE)):
+            await self.app(scope, receive, send)
+            return
+
+        profiler = start_profile() if profile_requested or should_sample(PROFILE_SAMPLE_RATE) else None
+        profile_id = uuid.uuid4().hex
+        thread_profiles = ThreadProfiles()
+        thread_profiles_token = _thread_profiles.set(thread_profiles) if profiler is not None else None
+        start = time.perf_counter()
+
+        # Set by auth_middleware on request.state, which lives in the scope
+        def authenticated_user() -> dict | None:
+            return scope.get("state", {}).get("user")
+
+        with root_span(f"{scope['method']} {scope['path']}", traceparent, **{"http.method": scope["method"], "http.target": scope["path"]}) as root:
+            async def send_with_ids(message):
+                if message["type"] == "http.response.start":
+                    root.set("http.status_code", message["status"])
+                    extra = [(TRACE_ID_HEADER.encode(), root.trace_id.encode())]
+                    if profiler is not None and profile_requested and authenticated_user():
+                        extra.append((PROFILE_ID_HEADER.encode(), profile_id.encode()))
+                    message = {**message, "headers": list(message.get("headers", [])) + extra}
+                await send(message)
+
+            try:
+                await self.app(scope, receive, send_with_ids)
+            finally:
+                route = getattr(scope.get("route"), "path", None)
+                if route:
+                    root.name = f"{scope['method']} {route}"
+                    root.set("http.route", route)
+                if profiler is not None:
+                    duration = time.perf_counter() - start
+                    user = authenticated_user() or {}
+                    info = {
+                        "owner": user.get("id"),
+                        "route": f"{scope['method']} {route or scope['path']}",
+                        "status": root.attributes.get("http.status_code"),
+                        "durationMs": round(duration * 1000, 1),
+                    }
+                    keep = (profile_requested and bool(user)) or duration >= PROFILE_MIN_SECONDS
+                    _thread_profiles.reset(thread_profiles_token)
+                    if finish_profile(profiler, thread_profiles, profile_id, keep, info):
+                        root.set("profile.id", profile_id)
@@ -0,0 +1,186 @@
+# tests/test_auth.py
+import threading
+import time
+
+import pytest
+import requests
+
+from src import auth
+from src.utils import cache
+from src.utils.cache import TTLCache
+
+JWKS_URL = "https://cognito.example.com/.well-known/jwks.json"
+
+
+# Stands in for the time module, so tests can move the clock
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def monotonic(self) -> float:
+        return self.now
+
+    def time(self) -> float:
+        return self.now
+
+
+class FakeResponse:
+    def __init__(self, body: dict):
+        self.body = body
+
+    def raise_for_status(self):
+        pass
+
+    def json(self) -> dict:
+        return self.body
+
+
+# Serves the current key set as the JWKS endpoint would and counts the fetches.
+# Fetches wait for `release` while it is cleared.
+class FakeJWKS:
+    def __init__(self, *kids: str):
+        self.kids = list(kids)
+        self.fetches = 0
+        self.failing = False
+        self.release = threading.Event()
+        self.release.set()
+
+    def get(self, url, timeout=None):
+        self.release.wait(5)
+        self.fetches += 1
+        if self.failing:
+            raise requests.ConnectionError("Cognito is down")
+        return FakeResponse({"keys": [{"kid": kid, "kty": "RSA"} for kid in self.kids]})
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(auth, "time", clock)
+    monkeypatch.setattr(cache, "time", clock)
+    return clock
+
+
+@pytest.fixture
+def jwks(monkeypatch):
+    jwks = FakeJWKS("key-1")
+    monkeypatch.setattr(auth.requests, "get", jwks.get)
+    return jwks
+
+
+def wait_until(condition, timeout: float = 5):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "Timed out"
+        time.sleep(0.01)
+
+
+def test_keys_are_fetched_once(clock, jwks):
+    keys = auth.JWKSCache(JWKS_URL, ttl=3600, min_refresh_interval=30)
+
+    assert keys.get_key("key-1")["kid"] == "key-1"
+    assert keys.get_key("key-1")["kid"] == "key-1"
+    assert jwks.fetches == 1
+    assert keys.stats()["hits"] == 2
+
+
+def test_unknown_kid_refetches_at_most_once_per_interval(clock, jwks):
+    keys = auth.JWKSCache(JWKS_URL, ttl=3600, min_refresh_interval=30)
+    keys.get_key("key-1")
+
+    # Cognito rotated its keys
+    jwks.kids.append("key-2")
+    assert keys.get_key("key-2")["kid"] == "key-2"
+    assert jwks.fetches == 2
+
+    # Within the interval of that refetch, forged kids don't cause any
+    for _ in range(5):
+        assert keys.get_key("forged") is None
+    clock.now += 29
+    assert keys.get_key("forged") is None
+    assert jwks.fetches == 2
+
+    # After it, only the first of them does
+    clock.now += 1
+    for _ in range(5):
+        assert keys.get_key("forged") is None
+    assert jwks.fetches == 3
+    assert keys.stats()["misses"] == 12
+
+
+def test_stale_keys_are_served_while_refreshing_in_background(clock, jwks):
+    keys = auth.JWKSCache(JWKS_URL, ttl=3600, min_refresh_interval=30)
+    keys.get_key("key-1")
+
+    clock.now += 3601
+    jwks.kids = ["key-2"]
+    jwks.release.clear()
+    try:
+        # The refresh is held, so these lookups are answered from the stale key set
+        assert keys.get_key("key-1")["kid"] == "key-1"
+        assert keys.get_key("key-1")["kid"] == "key-1"
+    finally:
+        jwks.release.set()
+    wait_until(lambda: keys.refreshes == 2 and not keys._refreshing)
+
+    # One background refresh for both stale lookups
+    assert jwks.fetches == 2
+    assert keys.get_key("key-2")["kid"] == "key-2"
+
+
+def test_failed_refresh_keeps_the_keys(clock, jwks):
+    keys = auth.JWKSCache(JWKS_URL, ttl=3600, min_refresh_interval=30)
+    keys.get_key("key-1")
+
+    clock.now += 3601
+    jwks.failing = True
+    assert keys.get_key("key-1")["kid"] == "key-1"
+    wait_until(lambda: keys.refresh_errors == 1 and not keys._refreshing)
+    assert keys.has_keys()
+    assert keys.get_key("key-1")["kid"] == "key-1"
+
+
+@pytest.fixture
+def user_info(monkeypatch, clock):
+    calls = []
+
+    def get_user_info(token):
+        calls.append(token)
+        return {"sub": "sub-1", "email": "reader@example.com", "username": "reader"}
+
+    monkeypatch.setattr(auth, "AUTH_IDENTITY_MODE", "claims")
+    monkeypatch.setattr(auth, "get_user_info", get_user_info)
+    monkeypatch.setattr(auth, "user_info_cache", TTLCache(100, ttl=3600))
+    return calls
+
+
+def test_id_token_claims_need_no_user_info_call(user_info):
+    claims = {"token_use": "id", "sub": "sub-1", "email": "reader@example.com", "cognito:username": "reader", "exp": 2000}
+    user = auth.get_user("id-token", claims)
+
+    assert user["username"] == "reader"
+    assert user["id"] == auth.hash_email("reader@example.com")
+    assert user_info == []
+
+
+def test_user_info_is_cached_until_the_token_expires(clock, user_info):
+    claims = {"token_use": "access", "sub": "sub-1", "exp": clock.now + 60}
+
+    user = auth.get_user("access-token", claims)
+    user["id"] = "changed by a route"
+    assert auth.get_user("access-token", claims)["id"] == auth.hash_email("reader@example.com")
+    assert user_info == ["access-token"]
+
+    clock.now += 59
+    auth.get_user("access-token", claims)
+    assert user_info == ["access-token"]
+
+    clock.now += 1
+    auth.get_user("access-token", claims)
+    assert user_info == ["access-token", "access-token"]
+
+
+def test_user_info_is_cached_per_token(clock, user_info):
+    auth.get_user("token-1", {"token_use": "access", "sub": "sub-1", "exp": clock.now + 60})
+    auth.get_user("token-2", {"token_use": "access", "sub": "sub-1", "exp": clock.now + 60})
+    assert user_info == ["token-1", "token-2"]
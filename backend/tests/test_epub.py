@@ -0,0 +1,103 @@
+# tests/test_epub.py
+import io
+import zipfile
+
+import pytest
+
+from src.utils.epub import EpubError, read_member, read_metadata, read_spine
+from src.utils.locations import chapter_key_range, location_key
+
+CONTAINER = """<?xml version="1.0"?>
+<container version="1.0" xmlns="urn:oasis:names:tc:opendocument:xmlns:container">
+  <rootfiles><rootfile full-path="OEBPS/content.opf" media-type="application/oebps-package+xml"/></rootfiles>
+</container>"""
+
+
+def epub(package_children: str) -> zipfile.ZipFile:
+    data = io.BytesIO()
+    with zipfile.ZipFile(data, "w") as archive:
+        archive.writestr("mimetype", "application/epub+zip")
+        archive.writestr("META-INF/container.xml", CONTAINER)
+        archive.writestr("OEBPS/content.opf", (
+            '<?xml version="1.0"?><package xmlns="http://www.idpf.org/2007/opf" version="3.0">'
+            f"{package_children}</package>"
+        ))
+    return zipfile.ZipFile(data)
+
+
+METADATA = '<metadata xmlns:dc="http://purl.org/dc/elements/1.1/"><dc:title>T</dc:title></metadata>'
+MANIFEST = (
+    '<manifest><item id="c1" href="c1.xhtml" media-type="application/xhtml+xml"/>'
+    '<item id="c2" href="c2.xhtml" media-type="application/xhtml+xml"/></manifest>'
+)
+
+
+def test_cfi_steps_of_the_usual_layout():
+    spine = read_spine(epub(METADATA + MANIFEST + '<spine><itemref idref="c1"/><itemref idref="c2"/></spine>'))
+    assert [chapter["cfiSteps"] for chapter in spine["chapters"]] == [[6, 2], [6, 4]]
+
+
+def test_skipped_itemrefs_keep_the_cfi_steps_of_the_rest():
+    spine = read_spine(epub(
+        METADATA + MANIFEST + '<spine><itemref idref="missing"/><itemref idref="c1"/><itemref idref="c2"/></spine>'
+    ))
+    chapters = spine["chapters"]
+    assert [(chapter["index"], chapter["id"], chapter["cfiSteps"]) for chapter in chapters] == [(0, "c1", [6, 4]), (1, "c2", [6, 6])]
+
+    # Chapter 1 is c2, at /6/6: its highlights are in its range, c1's are not
+    lower, upper = chapter_key_range(1, chapters[1])
+    assert lower <= location_key("epubcfi(/6/6[c2]!/4/2/1:0)") < upper
+    assert not lower <= location_key("epubcfi(/6/4[c1]!/4/2/1:0)") < upper
+
+
+def test_spine_step_follows_the_package_layout():
+    # A collection element before the spine moves it to /8
+    spine = read_spine(epub(METADATA + MANIFEST + "<collection/>" + '<spine><itemref idref="c1"/></spine>'))
+    assert spine["chapters"][0]["cfiSteps"] == [8, 2]
+
+
+def corrupt(archive: zipfile.ZipFile, name: str) -> io.BytesIO:
+    data = bytearray(archive.fp.getvalue())
+    info = archive.getinfo(name)
+    start = info.header_offset + 30 + len(info.filename.encode()) + len(info.extra)
+    data[start:start + info.compress_size] = b"\xff" * info.compress_size
+    return io.BytesIO(bytes(data))
+
+
+def deflated_epub() -> zipfile.ZipFile:
+    data = io.BytesIO()
+    with zipfile.ZipFile(data, "w", zipfile.ZIP_DEFLATED) as archive:
+        archive.writestr("META-INF/container.xml", CONTAINER)
+        archive.writestr("OEBPS/content.opf", (
+            '<?xml version="1.0"?><package xmlns="http://www.idpf.org/2007/opf" version="3.0">'
+            f"{METADATA}{MANIFEST}</package>"
+        ))
+    return zipfile.ZipFile(data)
+
+
+@pytest.mark.parametrize("name", ["META-INF/container.xml", "OEBPS/content.opf"])
+def test_corrupt_members_raise_epub_error(name):
+    with pytest.raises(EpubError):
+        read_metadata(corrupt(deflated_epub(), name))
+
+
+def test_unsupported_compression_raises_epub_error():
+    archive = deflated_epub()
+    data = archive.fp.getvalue()
+    # Compression method 99 (AES) in the local and central headers of the package document
+    info = archive.getinfo("OEBPS/content.opf")
+    data = bytearray(data)
+    data[info.header_offset + 8:info.header_offset + 10] = (99).to_bytes(2, "little")
+    central = data.rindex(b"PK\x01\x02")
+    data[central + 10:central + 12] = (99).to_bytes(2, "little")
+    with pytest.raises(EpubError):
+        read_metadata(io.BytesIO(bytes(data)))
+
+
+def test_read_member():
+    archive = zipfile.ZipFile(corrupt(deflated_epub(), "OEBPS/content.opf"))
+    assert b"rootfile" in read_member(archive, "META-INF/container.xml")
+    with pytest.raises(EpubError):
+        read_member(archive, "OEBPS/content.opf")
+    with pytest.raises(KeyError):
+        read_member(archive, "OEBPS/missing.xhtml")
@@ -0,0 +1,70 @@
+# tests/test_highlights.py
+import asyncio
+
+import mongomock
+import pytest
+from fastapi import HTTPException
+from pymongo import ASCENDING
+
+from src.database.mongodb import AsyncCollection
+from src.models import highlight as highlight_model
+from src.models.highlight import Highlight
+
+
+@pytest.fixture
+def highlights(monkeypatch):
+    collection = mongomock.MongoClient().db.highlights
+    collection.create_index([("ownerId", ASCENDING), ("bookId", ASCENDING), ("id", ASCENDING)], unique=True)
+    monkeypatch.setattr(highlight_model, "get_highlights_collection", lambda: AsyncCollection(collection))
+
+    async def book_exists(self, detail="Book not found"):
+        pass
+
+    async def index(*args):
+        pass
+
+    monkeypatch.setattr(Highlight, "check_book_exists", book_exists)
+    monkeypatch.setattr(highlight_model.search, "index_highlight", index)
+    monkeypatch.setattr(highlight_model.search, "index_highlights", index)
+    return collection
+
+
+def create(owner_id: str, book_id: str, highlight_id: str) -> dict:
+    highlight = Highlight(id=highlight_id, text="A whale", location="epubcfi(/6/2!/4/2/1:0)", owner_id=owner_id, book_id=book_id)
+    return asyncio.run(highlight.create_highlight())
+
+
+def test_same_id_in_other_books_and_libraries(highlights):
+    create("alice", "book-1", "h1")
+    create("alice", "book-2", "h1")
+    create("bob", "book-1", "h1")
+    assert sorted((document["ownerId"], document["bookId"]) for document in highlights.find({"id": "h1"})) == [
+        ("alice", "book-1"), ("alice", "book-2"), ("bob", "book-1"),
+    ]
+
+
+def test_same_id_in_the_same_book_is_a_conflict(highlights):
+    create("alice", "book-1", "h1")
+    with pytest.raises(HTTPException) as error:
+        create("alice", "book-1", "h1")
+    assert error.value.status_code == 409
+    assert highlights.count_documents({}) == 1
+
+
+def create_many(owner_id: str, book_id: str, highlight_ids: list) -> list:
+    highlights = [
+        Highlight(id=highlight_id, text="A whale", location="epubcfi(/6/2!/4/2/1:0)", owner_id=owner_id, book_id=book_id)
+        for highlight_id in highlight_ids
+    ]
+    results = asyncio.run(highlight_model.create_highlights(owner_id, book_id, highlights))
+    return [result["status"] for result in results]
+
+
+def test_bulk_duplicates_are_only_those_of_the_same_book(highlights):
+    assert create_many("alice", "book-1", ["h1", "h2"]) == ["created", "created"]
+    # Re-sent batch
+    assert create_many("alice", "book-1", ["h1", "h2", "h3"]) == ["duplicate", "duplicate", "created"]
+    # Another book and another user's library don't see alice's ids
+    assert create_many("alice", "book-2", ["h1"]) == ["created"]
+    assert create_many("bob", "book-1", ["h1", "h2"]) == ["created", "created"]
+    assert highlights.count_documents({"ownerId": "bob"}) == 2
@@ -0,0 +1,288 @@
+# tests/test_jobs.py
+import asyncio
+import threading
+import time
+
+import mongomock
+import pytest
+
+from src.database.mongodb import AsyncCollection
+from src.jobs import images
+from src.jobs import queue as job_queue
+from src.jobs.queue import JobQueue, PermanentJobError
+from src.jobs.store import MemoryJobStore, new_job
+
+RETRY_DELAY = 0.05
+
+
+@pytest.fixture
+def store(monkeypatch):
+    store = MemoryJobStore()
+    monkeypatch.setattr(job_queue, "job_store", store)
+    monkeypatch.setattr(job_queue, "JOB_RETRY_DELAY", RETRY_DELAY)
+    return store
+
+
+# Handler failing its first `failures` attempts and succeeding after that
+class FlakyHandler:
+    def __init__(self, failures: int, error: type = RuntimeError):
+        self.failures = failures
+        self.error = error
+        self.attempts = []
+
+    async def __call__(self, job: dict) -> dict:
+        self.attempts.append((time.monotonic(), dict(job)))
+        if len(self.attempts) <= self.failures:
+            raise self.error(f"attempt {len(self.attempts)} failed")
+        return {"ok": True}
+
+
+async def run_job(handler, max_attempts: int = 3, timeout: float = 5) -> dict:
+    jobs = JobQueue("test", workers=1, max_attempts=max_attempts)
+    jobs.register("flaky")(handler)
+    await jobs.start()
+    try:
+        job = await jobs.enqueue("flaky", "alice", {})
+        return await jobs.wait(job["id"], timeout)
+    finally:
+        await jobs.stop()
+
+
+def test_failing_job_is_retried_with_backoff(store):
+    handler = FlakyHandler(failures=2)
+    job = asyncio.run(run_job(handler))
+
+    assert job["status"] == "done"
+    assert job["result"] == {"ok": True}
+    assert job["error"] is None
+    assert job["attempts"] == 3
+    # The error of a failed attempt stays on the job until it succeeds
+    assert handler.attempts[1][1]["error"] == "attempt 1 failed"
+    # The delay doubles with every attempt
+    times = [attempt_time for attempt_time, _ in handler.attempts]
+    assert times[1] - times[0] >= RETRY_DELAY
+    assert times[2] - times[1] >= 2 * RETRY_DELAY
+
+
+def test_job_fails_after_max_attempts(store):
+    handler = FlakyHandler(failures=5)
+    job = asyncio.run(run_job(handler, max_attempts=2))
+
+    assert job["status"] == "failed"
+    assert job["error"] == "attempt 2 failed"
+    assert len(handler.attempts) == 2
+
+
+def test_permanent_error_is_not_retried(store):
+    handler = FlakyHandler(failures=1, error=PermanentJobError)
+    job = asyncio.run(run_job(handler))
+
+    assert job["status"] == "failed"
+    assert job["attempts"] == 1
+    assert len(handler.attempts) == 1
+
+
+def test_claim_takes_a_lease(store):
+    async def claims():
+        await store.create(new_job("job-1", "test", "flaky", "alice", {}, 3))
+        first = await store.claim("job-1", lease_seconds=60)
+        second = await store.claim("job-1", lease_seconds=60)
+        # The worker holding the lease died
+        await store.update("job-1", {"leaseUntil": time.time() - 1})
+        third = await store.claim("job-1", lease_seconds=60)
+        return first, second, third
+
+    first, second, third = asyncio.run(claims())
+    assert first["status"] == "running" and first["attempts"] == 1
+    assert second is None
+    assert third["attempts"] == 2
+
+
+def test_resume_runs_unfinished_jobs(store):
+    def stored_job(job_id: str, **fields) -> dict:
+        return {**new_job(job_id, "test", "flaky", "alice", {}, 3), **fields}
+
+    store.jobs = {job["_id"]: job for job in [
+        stored_job("queued"),
+        stored_job("expired", status="running", attempts=1, leaseUntil=time.time() - 1),
+        stored_job("leased", status="running", attempts=1, leaseUntil=time.time() + 60),
+        stored_job("done", status="done", attempts=1),
+        {**stored_job("other"), "queue": "other"},
+    ]}
+    handler = FlakyHandler(failures=0)
+
+    async def resume():
+        jobs = JobQueue("test", workers=1)
+        jobs.register("flaky")(handler)
+        await jobs.start()
+        try:
+            await jobs.resume()
+            return [await jobs.wait(job_id, 5) for job_id in ("queued", "expired")]
+        finally:
+            await jobs.stop()
+
+    queued, expired = asyncio.run(resume())
+    assert queued["status"] == "done" and queued["attempts"] == 1
+    assert expired["status"] == "done" and expired["attempts"] == 2
+    assert sorted(job["_id"] for _, job in handler.attempts) == ["expired", "queued"]
+    assert store.jobs["leased"]["status"] == "running"
+    assert store.jobs["other"]["status"] == "queued"
+
+
+def test_enqueue_with_an_existing_id_returns_the_job(store):
+    handler = FlakyHandler(failures=0)
+
+    async def enqueue_twice():
+        jobs = JobQueue("test", workers=1)
+        jobs.register("flaky")(handler)
+        await jobs.start()
+        try:
+            first = await jobs.enqueue("flaky", "alice", {"n": 1}, job_id="fixed")
+            await jobs.wait("fixed", 5)
+            second = await jobs.enqueue("flaky", "alice", {"n": 2}, job_id="fixed")
+            return first, second
+        finally:
+            await jobs.stop()
+
+    first, second = asyncio.run(enqueue_twice())
+    assert first["id"] == second["id"] == "fixed"
+    assert second["status"] == "done"
+    assert len(handler.attempts) == 1
+
+
+# Stand-in for overwrite_image: fails its first `failures` renders, and holds final
+# renders until release is set so a test can change the highlight meanwhile
+class FakeRenderer:
+    def __init__(self, failures: int = 0, hold_final: bool = False):
+        self.failures = failures
+        self.hold_final = hold_final
+        self.rendered = []
+        self.holding = threading.Event()
+        self.release = threading.Event()
+
+    def __call__(self, prompt, s3_key, use_cache=True, profile="final", still_wanted=None):
+        if len(self.rendered) < self.failures:
+            self.rendered.append(None)
+            raise RuntimeError("The Space is busy")
+        if profile == "final" and self.hold_final:
+            self.holding.set()
+            self.release.wait(5)
+        if still_wanted and not still_wanted():
+            return None
+        self.rendered.append(s3_key)
+        return []
+
+
+@pytest.fixture
+def image_env(store, monkeypatch):
+    collection = mongomock.MongoClient().db.highlights
+    collection.insert_one({"ownerId": "alice", "bookId": "book-1", "id": "h1", "text": "A whale"})
+    deleted = []
+
+    async def delete_files(keys):
+        deleted.extend(keys)
+
+    monkeypatch.setattr(images, "get_highlights_collection", lambda: AsyncCollection(collection))
+    monkeypatch.setattr(images, "delete_files_async", delete_files)
+    return collection, deleted
+
+
+def use_renderer(monkeypatch, renderer: FakeRenderer):
+    monkeypatch.setattr(images, "overwrite_image", renderer)
+
+
+async def with_image_jobs(test):
+    await images.image_jobs.start()
+    try:
+        return await test()
+    finally:
+        await images.image_jobs.stop()
+
+
+def highlight(collection) -> dict:
+    return collection.find_one({"id": "h1"})
+
+
+def test_draft_is_upgraded_to_final(image_env, monkeypatch):
+    collection, deleted = image_env
+    use_renderer(monkeypatch, FakeRenderer())
+
+    async def generate():
+        draft = await images.enqueue_highlight_image("alice", "book-1", "h1", "A whale", profile="draft")
+        draft = await images.image_jobs.wait(draft["id"], 5)
+        upgrade = await images.image_jobs.wait(draft["result"]["upgradeJobId"], 5)
+        return draft, upgrade
+
+    draft, upgrade = asyncio.run(with_image_jobs(generate))
+    assert draft["status"] == "done" and draft["result"]["imgProfile"] == "draft"
+    assert upgrade["id"] == f"{draft['id']}-final"
+    assert upgrade["status"] == "done" and upgrade["result"]["imgProfile"] == "final"
+
+    document = highlight(collection)
+    assert document["imgProfile"] == "final"
+    assert document["imgKey"] == f"alice/book-1/images/h1-{upgrade['id']}.png"
+    assert "imgDraftJob" not in document
+    # The draft's render is deleted once the final one replaces it
+    assert deleted == [f"alice/book-1/images/h1-{draft['id']}.png"]
+
+
+def test_retried_draft_is_upgraded_once(image_env, monkeypatch):
+    collection, _ = image_env
+    use_renderer(monkeypatch, FakeRenderer(failures=1))
+
+    async def generate():
+        draft = await images.enqueue_highlight_image("alice", "book-1", "h1", "A whale", profile="draft")
+        draft = await images.image_jobs.wait(draft["id"], 5)
+        await images.image_jobs.wait(draft["result"]["upgradeJobId"], 5)
+        return draft
+
+    draft = asyncio.run(with_image_jobs(generate))
+    assert draft["status"] == "done" and draft["attempts"] == 2
+    assert sorted(job["_id"] for job in job_queue.job_store.jobs.values()) == sorted([draft["id"], f"{draft['id']}-final"])
+    assert highlight(collection)["imgProfile"] == "final"
+
+
+def test_upgrade_of_a_replaced_draft_is_not_saved(image_env, monkeypatch):
+    collection, deleted = image_env
+    renderer = FakeRenderer(hold_final=True)
+    use_renderer(monkeypatch, renderer)
+
+    async def generate():
+        draft = await images.enqueue_highlight_image("alice", "book-1", "h1", "A whale", profile="draft")
+        draft = await images.image_jobs.wait(draft["id"], 5)
+        # The upgrade is rendering when the reader regenerates the image
+        while not renderer.holding.is_set():
+            await asyncio.sleep(0.01)
+        renderer.hold_final = False
+        regenerated = await images.enqueue_highlight_image("alice", "book-1", "h1", "A whale", profile="final")
+        regenerated = await images.image_jobs.wait(regenerated["id"], 5)
+        renderer.release.set()
+        upgrade = await images.image_jobs.wait(draft["result"]["upgradeJobId"], 5)
+        return draft, regenerated, upgrade
+
+    draft, regenerated, upgrade = asyncio.run(with_image_jobs(generate))
+    assert regenerated["status"] == "done"
+    assert upgrade["status"] == "done" and "skipped" in upgrade["result"]
+    assert upgrade["id"] not in "".join(renderer.rendered)
+
+    document = highlight(collection)
+    assert document["imgKey"] == f"alice/book-1/images/h1-{regenerated['id']}.png"
+    assert "imgDraftJob" not in document
+    assert deleted == [f"alice/book-1/images/h1-{draft['id']}.png"]
+
+
+def test_upgrade_queued_for_another_draft_is_skipped(image_env, monkeypatch):
+    collection, _ = image_env
+    renderer = FakeRenderer()
+    use_renderer(monkeypatch, renderer)
+
+    async def upgrade():
+        job = await images.image_jobs.enqueue("highlight_image", "alice", {
+            "bookId": "book-1", "highlightId": "h1", "prompt": "A whale", "profile": "final", "upgrades": "an-old-draft",
+        })
+        return await images.image_jobs.wait(job["id"], 5)
+
+    job = asyncio.run(with_image_jobs(upgrade))
+    assert job["status"] == "done" and "skipped" in job["result"]
+    assert renderer.rendered == []
+    assert "imgUrl" not in highlight(collection)
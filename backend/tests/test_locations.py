@@ -0,0 +1,79 @@
+# tests/test_locations.py
+import pytest
+
+from src.utils.locations import chapter_key_range, location_key, location_key_range, parse_cfi
+
+
+def test_cfi_steps_and_offset():
+    assert location_key("epubcfi(/6/4[ch1]!/4/2/1:3)") == "c.000006.000004.000004.000002.000001.000003"
+
+
+def test_cfi_range_is_keyed_by_its_start():
+    assert location_key("epubcfi(/6/4[ch1]!/4/2,/1:0,/1:12)") == "c.000006.000004.000004.000002.000001.000000"
+
+
+def test_cfi_id_assertions_and_parameters_are_ignored():
+    assert parse_cfi("epubcfi(/6/4[chap,01]!/4[body;x]/2/1:3;s=b)") == ([6, 4, 4, 2, 1], 3)
+    assert parse_cfi("epubcfi(/6/4[ch1]!/4/2/1~4.5@1:2)") == ([6, 4, 4, 2, 1], None)
+
+
+def test_pages():
+    assert location_key("12") == "p.000012"
+    assert location_key("page:12") == location_key("Page 12") == "p.000012"
+
+
+@pytest.mark.parametrize("location", [None, "", "epubcfi()", "epubcfi(/6/x)", "chapter one"])
+def test_unparseable_locations_sort_last(location):
+    key = location_key(location)
+    assert key.startswith("z.")
+    assert key > location_key("epubcfi(/6/999998!/4)") and key > location_key("999999")
+
+
+def test_keys_sort_in_reading_order():
+    locations = [
+        "epubcfi(/6/2!/4/2/1:0)",
+        "epubcfi(/6/2!/4/2/1:5)",
+        "epubcfi(/6/2!/4/10/1:0)",
+        "epubcfi(/6/4!/4/2,/1:0,/1:9)",
+        "epubcfi(/6/4!/4/2/1:10)",
+        "epubcfi(/6/12!/4)",
+    ]
+    keys = [location_key(location) for location in locations]
+    assert keys == sorted(keys)
+
+
+def test_position_sorts_before_positions_inside_it():
+    assert location_key("epubcfi(/6/4!/4)") < location_key("epubcfi(/6/4!/4/2/1:0)") < location_key("epubcfi(/6/6!/4)")
+
+
+def test_steps_beyond_the_width_are_capped():
+    assert location_key("epubcfi(/6/12345678)") == "c.000006.999999"
+
+
+def test_chapter_key_range_uses_the_spine_entry():
+    lower, upper = chapter_key_range(1, {"index": 1, "cfiSteps": [6, 8]})
+    assert lower <= location_key("epubcfi(/6/8!/4/2/1:0)") < upper
+    assert not lower <= location_key("epubcfi(/6/4!/4/2/1:0)") < upper
+
+
+def test_chapter_key_range_without_cfi_steps_assumes_the_usual_layout():
+    lower, upper = chapter_key_range(1)
+    assert lower <= location_key("epubcfi(/6/4[ch2]!/4/2,/1:0,/1:3)") < upper
+    assert not lower <= location_key("epubcfi(/6/40!/4)") < upper
+    assert not lower <= location_key("epubcfi(/6/2!/4)") < upper
+
+
+def test_location_key_range_includes_positions_inside_end():
+    lower, upper = location_key_range("epubcfi(/6/4!/4/2)", "epubcfi(/6/4!/4/6)")
+    assert lower <= location_key("epubcfi(/6/4!/4/2/1:0)") < upper
+    assert lower <= location_key("epubcfi(/6/4!/4/6/3:40)") < upper
+    assert not lower <= location_key("epubcfi(/6/4!/4/8)") < upper
+    assert not lower <= location_key("epubcfi(/6/4!/2)") < upper
+
+
+def test_location_key_range_open_ends():
+    assert location_key_range(None, None) == (None, None)
+    lower, upper = location_key_range("3", None)
+    assert lower == "p.000003" and upper is None
+    lower, upper = location_key_range(None, "epubcfi(/6/4)")
+    assert lower is None and location_key("epubcfi(/6/4!/4/2/1:0)") < upper
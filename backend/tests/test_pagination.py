@@ -0,0 +1,112 @@
+# tests/test_pagination.py
+import asyncio
+
+import mongomock
+import pytest
+from fastapi import HTTPException
+
+from src.database.mongodb import AsyncCollection
+from src.utils.pagination import decode_cursor, encode_cursor, fields_projection, find_page, keyset_filter
+
+BOOK_SORT = [("updated", -1), ("_id", -1)]
+HIGHLIGHT_SORT = [("locationKey", 1), ("_id", 1)]
+
+
+def collection(documents: list) -> AsyncCollection:
+    books = mongomock.MongoClient().db.books
+    if documents:
+        books.insert_many(documents)
+    return AsyncCollection(books)
+
+
+# Every page, following the cursors; returns the ids in order
+def all_pages(books: AsyncCollection, sort: list, limit: int) -> list:
+    async def run():
+        ids, cursor = [], None
+        while True:
+            items, cursor = await find_page(books, {}, sort, {"_id": 1}, limit, cursor)
+            ids += [item["_id"] for item in items]
+            if not cursor:
+                return ids
+    return asyncio.run(run())
+
+
+def test_cursor_round_trip():
+    values = ["2026-10-18T01:00:00", "a/b?c", None]
+    assert decode_cursor(encode_cursor(values), 3) == values
+
+
+@pytest.mark.parametrize("cursor", ["not base64!", encode_cursor(["only one"]), encode_cursor({"a": 1})])
+def test_invalid_cursor(cursor):
+    with pytest.raises(HTTPException) as error:
+        decode_cursor(cursor, 2)
+    assert error.value.status_code == 400
+
+
+def test_no_cursor_is_the_first_page():
+    assert keyset_filter(BOOK_SORT, None) == {}
+
+
+@pytest.mark.parametrize("limit", [1, 2, 3, 10])
+def test_pages_cover_every_item_once_in_order(limit):
+    documents = [{"_id": f"b{i}", "updated": f"2026-01-0{i % 3}"} for i in range(8)]
+    expected = [d["_id"] for d in sorted(documents, key=lambda d: (d["updated"], d["_id"]), reverse=True)]
+    assert all_pages(collection(documents), BOOK_SORT, limit) == expected
+
+
+@pytest.mark.parametrize("limit", [1, 2, 3])
+def test_null_and_missing_sort_values_descending(limit):
+    # Nulls sort lowest, so they come last in a descending listing
+    documents = [
+        {"_id": "a", "updated": "2026-01-02"},
+        {"_id": "b", "updated": None},
+        {"_id": "c", "updated": "2026-01-01"},
+        {"_id": "d"},
+        {"_id": "e", "updated": "2026-01-02"},
+    ]
+    assert all_pages(collection(documents), BOOK_SORT, limit) == ["e", "a", "c", "d", "b"]
+
+
+@pytest.mark.parametrize("limit", [1, 2, 3])
+def test_null_and_missing_sort_values_ascending(limit):
+    documents = [
+        {"_id": "a", "locationKey": "c.000006.000004"},
+        {"_id": "b", "locationKey": None},
+        {"_id": "c"},
+        {"_id": "d", "locationKey": "c.000006.000002"},
+    ]
+    assert all_pages(collection(documents), HIGHLIGHT_SORT, limit) == ["b", "c", "d", "a"]
+
+
+def test_cfi_range_pages_stay_in_range():
+    from src.utils.locations import location_key, location_key_range
+
+    locations = ["epubcfi(/6/2!/4/2/1:0)", "epubcfi(/6/4!/4/2/1:0)", "epubcfi(/6/4!/4/2,/1:5,/1:9)",
+                 "epubcfi(/6/4!/4/8/1:0)", "epubcfi(/6/4!/6/2/1:0)", "epubcfi(/6/6!/4/2/1:0)"]
+    books = collection([{"_id": f"h{i}", "locationKey": location_key(location)} for i, location in enumerate(locations)])
+    lower, upper = location_key_range("epubcfi(/6/4!/4/2)", "epubcfi(/6/4!/4/8)")
+
+    async def run():
+        ids, cursor = [], None
+        while True:
+            query = {"locationKey": {"$gte": lower, "$lt": upper}}
+            items, cursor = await find_page(books, query, HIGHLIGHT_SORT, {"_id": 1}, 1, cursor)
+            ids += [item["_id"] for item in items]
+            if not cursor:
+                return ids
+    assert asyncio.run(run()) == ["h1", "h2", "h3"]
+
+
+def test_sort_fields_are_dropped_unless_requested():
+    books = collection([{"_id": "a", "updated": "1", "title": "T"}, {"_id": "b", "updated": "2", "title": "U"}])
+    items, cursor = asyncio.run(find_page(books, {}, BOOK_SORT, {"title": 1}, 1, None))
+    assert items == [{"title": "U"}]
+    assert decode_cursor(cursor, 2) == ["2", "b"]
+
+
+def test_fields_projection():
+    assert fields_projection(None, ["id", "title"], ["id", "title", "created"]) == {"id": 1, "title": 1}
+    assert fields_projection(" created, id ", ["id"], ["id", "title", "created"]) == {"created": 1, "id": 1}
+    with pytest.raises(HTTPException) as error:
+        fields_projection("id,secret", ["id"], ["id"])
+    assert error.value.status_code == 400
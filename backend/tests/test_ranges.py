@@ -0,0 +1,19 @@
+# tests/test_ranges.py
+import pytest
+
+from src.utils.ranges import accepts_encoding
+
+
+@pytest.mark.parametrize("header", ["gzip", "gzip, deflate, br", "br;q=1.0, gzip;q=0.8", "GZIP", "*", "gzip;q=0.001"])
+def test_accepted(header):
+    assert accepts_encoding(header, "gzip")
+
+
+@pytest.mark.parametrize("header", [None, "", "identity", "br, deflate", "gzip;q=0", "gzip; q=0.0, br", "*;q=0", "gzip;q=abc"])
+def test_not_accepted(header):
+    assert not accepts_encoding(header, "gzip")
+
+
+def test_own_entry_overrides_the_wildcard():
+    assert not accepts_encoding("*, gzip;q=0", "gzip")
+    assert accepts_encoding("*;q=0, gzip", "gzip")
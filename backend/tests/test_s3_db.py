@@ -0,0 +1,61 @@
+# tests/test_s3_db.py
+import io
+
+import boto3
+import pytest
+from botocore.exceptions import EndpointConnectionError
+from moto import mock_aws
+
+from src.database import s3_db
+
+BUCKET = "books"
+PART_SIZE = 5 * 1024 * 1024
+
+
+# S3 client whose upload_part fails on the given part
+class FailingClient:
+    def __init__(self, client, failing_part: int, error: Exception):
+        self.client = client
+        self.failing_part = failing_part
+        self.error = error
+
+    def upload_part(self, **kwargs):
+        if kwargs["PartNumber"] == self.failing_part:
+            raise self.error
+        return self.client.upload_part(**kwargs)
+
+    def __getattr__(self, name):
+        return getattr(self.client, name)
+
+
+@pytest.fixture
+def s3(monkeypatch):
+    with mock_aws():
+        client = boto3.client("s3", region_name="us-east-1")
+        client.create_bucket(Bucket=BUCKET)
+        monkeypatch.setattr(s3_db, "S3_BUCKET_NAME", BUCKET)
+        yield client
+
+
+def upload(monkeypatch, client, error: Exception):
+    monkeypatch.setattr(s3_db, "get_client", lambda service: FailingClient(client, 2, error))
+    return s3_db.write_file_stream("book.epub", "application/epub+zip", io.BytesIO(b"x" * (PART_SIZE * 2 + 1)), PART_SIZE)
+
+
+def test_connection_error_aborts_the_upload(monkeypatch, s3):
+    assert upload(monkeypatch, s3, EndpointConnectionError(endpoint_url="https://s3")) is False
+    assert s3.list_multipart_uploads(Bucket=BUCKET).get("Uploads", []) == []
+
+
+def test_unexpected_error_aborts_the_upload_and_is_raised(monkeypatch, s3):
+    with pytest.raises(OSError):
+        upload(monkeypatch, s3, OSError("disk error"))
+    assert s3.list_multipart_uploads(Bucket=BUCKET).get("Uploads", []) == []
+
+
+def test_completed_upload(monkeypatch, s3):
+    monkeypatch.setattr(s3_db, "get_client", lambda service: s3)
+    data = b"x" * (PART_SIZE + 10)
+    assert s3_db.write_file_stream("book.epub", "application/epub+zip", io.BytesIO(data), PART_SIZE) is True
+    assert s3.get_object(Bucket=BUCKET, Key="book.epub")["Body"].read() == data
+    assert s3.list_multipart_uploads(Bucket=BUCKET).get("Uploads", []) == []
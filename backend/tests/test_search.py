@@ -0,0 +1,21 @@
+# tests/test_search.py
+import asyncio
+
+import mongomock
+
+from src.database.mongodb import AsyncCollection
+from src.utils import search
+
+
+def test_highlights_with_the_same_id_are_separate_entries(monkeypatch):
+    collection = mongomock.MongoClient().db.search
+    monkeypatch.setattr(search, "get_passages", lambda: AsyncCollection(collection))
+    for owner_id, book_id, text in [("alice", "book-1", "a whale"), ("alice", "book-2", "a cloud"), ("bob", "book-1", "a storm")]:
+        operation = search.highlight_update(owner_id, book_id, "h1", text)
+        collection.update_one(operation._filter, operation._doc, upsert=True)
+
+    entries = lambda: sorted((entry["ownerId"], entry["bookId"], entry["text"]) for entry in collection.find())
+    assert entries() == [("alice", "book-1", "a whale"), ("alice", "book-2", "a cloud"), ("bob", "book-1", "a storm")]
+
+    asyncio.run(search.unindex_highlight("bob", "book-1", "h1"))
+    assert entries() == [("alice", "book-1", "a whale"), ("alice", "book-2", "a cloud")]
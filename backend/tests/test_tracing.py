@@ -0,0 +1,59 @@
+# tests/test_tracing.py
+import asyncio
+import pstats
+
+from src.database.executor import run_blocking
+from src.utils import tracing
+
+
+def blocking_work():
+    return sum(range(1000))
+
+
+def profiled_functions(path) -> set:
+    return {function for _, _, function in pstats.Stats(str(path)).stats}
+
+
+async def profile_request(monkeypatch, tmp_path, work):
+    monkeypatch.setattr(tracing, "PROFILE_DIR", str(tmp_path))
+    profiler = tracing.start_profile()
+    assert profiler is not None
+    thread_profiles = tracing.ThreadProfiles()
+    token = tracing._thread_profiles.set(thread_profiles)
+    try:
+        await work()
+    finally:
+        tracing._thread_profiles.reset(token)
+    return tracing.finish_profile(profiler, thread_profiles, "0" * 32, True, {})
+
+
+def test_profile_includes_executor_work(monkeypatch, tmp_path):
+    async def work():
+        assert await run_blocking(blocking_work) == 499500
+
+    profile_id = asyncio.run(profile_request(monkeypatch, tmp_path, work))
+
+    assert "blocking_work" in profiled_functions(tracing.profile_path(profile_id))
+    assert tracing.get_profile(profile_id)["threadCalls"] == 1
+
+
+def other_work():
+    return sum(range(1000))
+
+
+def test_other_requests_executor_work_is_not_profiled(monkeypatch, tmp_path):
+    async def requests():
+        # Started before the profiled request, so it runs in a context without its profiles
+        other_request = asyncio.create_task(run_blocking(other_work))
+
+        async def work():
+            await asyncio.gather(run_blocking(blocking_work), other_request)
+
+        return await profile_request(monkeypatch, tmp_path, work)
+
+    profile_id = asyncio.run(requests())
+
+    functions = profiled_functions(tracing.profile_path(profile_id))
+    assert "blocking_work" in functions
+    assert "other_work" not in functions
+    assert tracing.get_profile(profile_id)["threadCalls"] == 1
@@ -19,7 +19,7 @@ import { RootStackParamList } from "./types"; // Import your defined types
 import Loading from "@/components/Loading";
 import { AuthContext, type User } from "@/utilities/authContext";
 import { BookContext } from "@/utilities/bookContext";
-import { getAllBooks, uploadBookToDB } from "@/utilities/backendService";
+import { getBooksPage, uploadBookToDB } from "@/utilities/backendService";
 
 const { width } = Dimensions.get("window");
 
@@ -28,6 +28,9 @@ export default function LibraryScreen() {
   const { books, setBooks } = useContext(BookContext);
 
   const [loading, setLoading] = useState<boolean>(true);
+  // Cursor of the next page of books; null once the last page is loaded
+  const [nextCursor, setNextCursor] = useState<string | null>(null);
+  const [loadingMore, setLoadingMore] = useState<boolean>(false);
   const [uploadingBook, setUploadingBook] = useState<boolean>(false);
   const [modalVisible, setModalVisible] = useState<boolean>(false);
   const [selectedFile, setSelectedFile] = useState<any>(null);
@@ -99,8 +102,9 @@ export default function LibraryScreen() {
       setLoading(true);
 
       try {
-        const data = await getAllBooks(user);
-        setBooks(data);
+        const page = await getBooksPage(user);
+        setBooks(page.items);
+        setNextCursor(page.nextCursor);
       } catch (error) {
         console.error("Error fetching books:", error);
         Alert.alert("Error", "An error occurred while fetching books.");
@@ -111,6 +115,24 @@ export default function LibraryScreen() {
     fetchBooks();
   }, []);
 
+  // Load the next page when the list is scrolled to its end
+  const loadMoreBooks = async () => {
+    if (!nextCursor || loadingMore) {
+      return;
+    }
+    setLoadingMore(true);
+
+    try {
+      const page = await getBooksPage(user, nextCursor);
+      setBooks((books) => [...books, ...page.items]);
+      setNextCursor(page.nextCursor);
+    } catch (error) {
+      console.error("Error fetching books:", error);
+    } finally {
+      setLoadingMore(false);
+    }
+  };
+
   if (loading) {
     return (
       <View style={styles.loadingContainer}>
@@ -172,6 +194,8 @@ export default function LibraryScreen() {
           keyExtractor={(item) => item.id}
           contentContainerStyle={styles.cardList}
           numColumns={5}
+          onEndReached={loadMoreBooks}
+          onEndReachedThreshold={0.5}
         />
       )}
 
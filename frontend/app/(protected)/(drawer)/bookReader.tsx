@@ -25,10 +25,11 @@ import {
   generateHighlightImage,
   regenerateHighlightImage,
   fetchUpdatedHighlight,
-  getAllHighlightsByBookId,
+  getSectionHighlights,
   getBookByBookId,
   createCustomImage,
   createUserHighlight,
+  waitForJob,
   deleteHighlight,
   updateBookSettings,
   getBookSettings,
@@ -113,8 +114,8 @@ const BookReader: React.FC = () => {
         const response = await getBookByBookId(user, bookId);
         setBookUrl(response);
 
-        const data = await getAllHighlightsByBookId(user, bookId);
-        setHighlights(data);
+        // Highlights are loaded section by section as they are displayed
+        setHighlights([]);
 
         if (userHighlight && userHighlight.location) {
           setLocation(userHighlight.location);
@@ -161,6 +162,40 @@ const BookReader: React.FC = () => {
     }
   }, [rendition, fontSize, isDarkMode]);
 
+  // Load the highlights of each section the first time it is displayed
+  const loadedSections = useRef<Set<string>>(new Set());
+  useEffect(() => {
+    if (!rendition) {
+      return;
+    }
+    loadedSections.current = new Set();
+
+    const loadSectionHighlights = async (section: Section) => {
+      if (loadedSections.current.has(section.cfiBase)) {
+        return;
+      }
+      loadedSections.current.add(section.cfiBase);
+
+      try {
+        const sectionHighlights = await getSectionHighlights(user, bookId, section.cfiBase);
+        setHighlights((prevHighlights) => [
+          ...prevHighlights,
+          ...sectionHighlights.filter(
+            (highlight) => !prevHighlights.some((h) => h.id === highlight.id)
+          ),
+        ]);
+      } catch (error) {
+        loadedSections.current.delete(section.cfiBase);
+        console.error("Error fetching section highlights:", error);
+      }
+    };
+
+    rendition.on("rendered", loadSectionHighlights);
+    return () => {
+      rendition.off("rendered", loadSectionHighlights);
+    };
+  }, [rendition, bookId, user]);
+
   // Adding highlights
   useEffect(() => {
     if (highlights && rendition) {
@@ -233,11 +268,10 @@ const BookReader: React.FC = () => {
     if (!selectedHighlight || !selectedHighlight.imgUrl) return;
 
     try {
-      const imgUrl = selectedHighlight.imgUrl;
-      const highlightId = imgUrl.split("/").pop()?.replace(".png", "");
+      const highlightId = selectedHighlight.id;
 
       if (!highlightId) {
-        console.error("Unable to extract highlight ID from imgUrl:", imgUrl);
+        console.error("Selected highlight has no ID:", selectedHighlight);
         return;
       }
   
@@ -424,8 +458,9 @@ const BookReader: React.FC = () => {
 
         if (response.ok) {
           const data = await response.json();
-          setGeneratedImageUrl(data.imgUrl || null);
-          setHighlights([...highlights, { ...selection, imgUrl: data.imgUrl, id: data.highlightId }]);
+          const result = await waitForJob(user, data.jobId);
+          setGeneratedImageUrl(result.imgUrl || null);
+          setHighlights([...highlights, { ...selection, imgUrl: result.imgUrl, id: data.highlightId }]);
         } 
         else {
           console.error("Failed to visualize highlight", response);
@@ -483,8 +518,7 @@ const BookReader: React.FC = () => {
 
     if (inputText) {
       try {
-        const imgUrl = selectedHighlight?.imgUrl;
-        const highlightId = imgUrl?.split("/").pop()?.replace(".png", "") || "";
+        const highlightId = selectedHighlight?.id || "";
 
         const response = await createCustomImage(
           user,
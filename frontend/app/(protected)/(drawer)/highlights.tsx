@@ -20,7 +20,7 @@ import Loading from "@/components/Loading";
 import { AuthContext, type User } from "@/utilities/authContext";
 import {
   Highlight,
-  getAllHighlightsByBookId,
+  getHighlightsPage,
   deleteHighlight,
   deleteHighlightImage,
 } from "@/utilities/backendService";
@@ -42,6 +42,9 @@ export default function ShowBookHighlights() {
 
   const [loading, setLoading] = useState(false); // Loading indicator
   const [error, setError] = useState<string | null>(null); // Error handling
+  // Cursor of the next page of highlights; null once the last page is loaded
+  const [nextCursor, setNextCursor] = useState<string | null>(null);
+  const [loadingMore, setLoadingMore] = useState(false);
   const navigation = useNavigation<StackNavigationProp<RootStackParamList>>();
   const { bookId } = route.params as { bookId: string };
   const backendURL = process.env.EXPO_PUBLIC_BACKEND_API_URL;
@@ -49,8 +52,11 @@ export default function ShowBookHighlights() {
   useEffect(() => {
     const fetchHighlights = async () => {
       try {
-        const data = await getAllHighlightsByBookId(user, bookId);
-        setHighlights(data);
+        const page = await getHighlightsPage(user, bookId);
+        if (page) {
+          setHighlights(page.items);
+          setNextCursor(page.nextCursor);
+        }
       } catch (err) {
         console.log(`Exception while calling the API: ${err}.`);
         Alert.alert("Error", "Failed during the API call.");
@@ -60,6 +66,26 @@ export default function ShowBookHighlights() {
     fetchHighlights();
   }, [bookId, backendURL]);
 
+  // Load the next page when the list is scrolled to its end
+  const loadMoreHighlights = async () => {
+    if (!nextCursor || loadingMore) {
+      return;
+    }
+    setLoadingMore(true);
+
+    try {
+      const page = await getHighlightsPage(user, bookId, nextCursor);
+      if (page) {
+        setHighlights((prevHighlights) => [...prevHighlights, ...page.items]);
+        setNextCursor(page.nextCursor);
+      }
+    } catch (err) {
+      console.log(`Exception while calling the API: ${err}.`);
+    } finally {
+      setLoadingMore(false);
+    }
+  };
+
   const handleDeleteHighlight = async () => {
     if (selectedHighlightId) {
       setLoading(true);
@@ -181,6 +207,8 @@ export default function ShowBookHighlights() {
               keyExtractor={(item) => item.id}
               contentContainerStyle={styles.cardList}
               numColumns={1}
+              onEndReached={loadMoreHighlights}
+              onEndReachedThreshold={0.5}
             />
           </View>
         </View>
@@ -28,24 +28,61 @@ export interface Selection {
   imgUrl?: string;
 }
 
-// This method will fetch all the books for the currently logged
-export async function getAllBooks(user: User) {
-  const response = await fetch(backendURL + `/books`, {
+// One page of a list endpoint, with the cursor of the next page (null on the last page)
+export interface Page<T> {
+  items: T[];
+  nextCursor: string | null;
+}
+
+// List endpoints return one page at a time, with the cursor of the next page in
+// the X-Next-Cursor header. Screens ask for the next page when they need it (e.g. when
+// a list is scrolled to its end) rather than loading every page up front.
+async function fetchPage(
+  user: User,
+  path: string,
+  params: Record<string, string | number | null | undefined> = {}
+): Promise<Page<any> | Response> {
+  const query = new URLSearchParams();
+  Object.entries(params).forEach(([name, value]) => {
+    if (value !== null && value !== undefined) {
+      query.append(name, String(value));
+    }
+  });
+  const url = query.toString()
+    ? `${backendURL}${path}?${query}`
+    : `${backendURL}${path}`;
+  const response = await fetch(url, {
     method: "GET",
     headers: {
       Authorization: `Bearer ${user.accessToken}`,
     },
   });
 
-  // Check for 204 No Content and return an empty array if that's the case
+  // 204 No Content means there is nothing (more) to list
   if (response.status === 204) {
-    return [];
-  } else if (response.ok) {
-    const data = await response.json();
-    return data;
-  } else {
+    return { items: [], nextCursor: null };
+  } else if (!response.ok) {
+    return response;
+  }
+
+  return {
+    items: await response.json(),
+    nextCursor: response.headers.get("X-Next-Cursor"),
+  };
+}
+
+// This method will fetch one page of the books of the currently logged in user;
+// pass the nextCursor of the previous page to get the next one
+export async function getBooksPage(
+  user: User,
+  cursor: string | null = null
+): Promise<Page<Book>> {
+  const result = await fetchPage(user, `/books`, { cursor });
+
+  if (result instanceof Response) {
     throw new Error("Failed to fetch books");
   }
+  return result;
 }
 
 // This method will fetch the book by bookId
@@ -124,25 +161,48 @@ export async function deleteUserSelectedBook(user: User, bookId: string) {
   }
 }
 
-// This method will get all the highlights for the user selected book
-export async function getAllHighlightsByBookId(user: User, bookId: string) {
-  const response = await fetch(backendURL + `/book/${bookId}/highlights`, {
-    method: "GET",
-    headers: {
-      Authorization: `Bearer ${user.accessToken}`,
-    },
-  });
+// This method will get one page of the highlights of the user selected book;
+// pass the nextCursor of the previous page to get the next one
+export async function getHighlightsPage(
+  user: User,
+  bookId: string,
+  cursor: string | null = null
+): Promise<Page<Highlight> | undefined> {
+  const result = await fetchPage(user, `/book/${bookId}/highlights`, { cursor });
 
-  // Handle 204 No Content response by returning an empty array
-  if (response.status === 204) {
-    return [];
-  } else if (response.ok) {
-    const data = await response.json();
-    return data;
-  } else {
-    const error = await response.json();
+  if (result instanceof Response) {
+    const error = await result.json();
     alert(`Error while getting book highlights: ${error.message}.`);
+    return;
   }
+  return result;
+}
+
+// This method will get the highlights in one section (spine item) of the book, for the
+// reader to mark them when the section is displayed. The section is selected by its
+// CFI (epub.js's section.cfiBase, e.g. /6/4[chap01]), which covers every location in it.
+export async function getSectionHighlights(
+  user: User,
+  bookId: string,
+  cfiBase: string
+): Promise<Highlight[]> {
+  let highlights: Highlight[] = [];
+  let cursor: string | null = null;
+
+  do {
+    const result = await fetchPage(user, `/book/${bookId}/highlights/range`, {
+      start: `epubcfi(${cfiBase})`,
+      end: `epubcfi(${cfiBase})`,
+      cursor,
+    });
+    if (result instanceof Response) {
+      throw new Error("Failed to fetch section highlights");
+    }
+    highlights = highlights.concat(result.items);
+    cursor = result.nextCursor;
+  } while (cursor);
+
+  return highlights;
 }
 
 // Delete highlight function
@@ -190,6 +250,36 @@ export async function deleteHighlightImage(
   }
 }
 
+// Image routes queue a background job and answer 202 with its jobId. This polls
+// GET /job/{jobId} until the job is done and returns its result (with the imgUrl).
+const JOB_POLL_INTERVAL_MS = 1000;
+const JOB_WAIT_TIMEOUT_MS = 10 * 60 * 1000;
+
+export async function waitForJob(user: User, jobId: string) {
+  const deadline = Date.now() + JOB_WAIT_TIMEOUT_MS;
+
+  while (Date.now() < deadline) {
+    const response = await fetch(`${backendURL}/job/${jobId}`, {
+      method: "GET",
+      headers: {
+        Authorization: `Bearer ${user.accessToken}`,
+      },
+    });
+    if (!response.ok) {
+      throw new Error("Failed to fetch image job.");
+    }
+
+    const job = await response.json();
+    if (job.status === "done") {
+      return job.result;
+    } else if (job.status === "failed") {
+      throw new Error(`Image generation failed: ${job.error}`);
+    }
+    await new Promise((resolve) => setTimeout(resolve, JOB_POLL_INTERVAL_MS));
+  }
+  throw new Error("Timed out waiting for the image.");
+}
+
 // Generate a new image for a highlight with no image
 export async function generateHighlightImage(
   user: User,
@@ -204,8 +294,9 @@ export async function generateHighlightImage(
 
   if (response.ok) {
     const data = await response.json();
-    console.log("Image successfully generated:", data.imgUrl);
-    return data.imgUrl;
+    const result = await waitForJob(user, data.jobId);
+    console.log("Image successfully generated:", result.imgUrl);
+    return result.imgUrl;
   } else {
     const error = await response.json();
     console.error("Failed to generate highlight image:", error);
@@ -228,6 +319,8 @@ export async function regenerateHighlightImage(
   });
 
   if (response.ok) {
+    const data = await response.json();
+    await waitForJob(user, data.jobId);
     console.log("Image regeneration succeeded");
     return true;
   } else {
@@ -343,7 +436,9 @@ export async function createCustomImage(
     }
   );
 
-  if (response.status === 200) {
+  if (response.ok) {
+    const data = await response.json();
+    await waitForJob(user, data.jobId);
     console.log("Image regeneration succeeded");
     return true;
   } else {